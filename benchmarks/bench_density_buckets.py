@@ -0,0 +1,66 @@
+"""
+低密度网格选择的基准测试
+比较全数组扫描（np.min + np.where）与桶队列（DensityBuckets）选择最低占据数网格的单次代价，
+并测量逐个放置模式下每个原子的平均耗时随原子数的变化，二者都应随规模保持基本不变
+"""
+
+import sys
+import os
+import io
+import time
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import numpy as np
+import random_structure
+
+def time_per_call(func, repeats: int) -> float:
+    """返回func单次调用的平均耗时（微秒）"""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        func()
+    return (time.perf_counter() - start) / repeats * 1e6
+
+def bench_selection(total_cells: int, repeats: int = 2000):
+    """在约半数网格已被占据的情况下比较两种选择方式"""
+    rng = np.random.default_rng(0)
+    buckets = random_structure.DensityBuckets(total_cells)
+    for cell in rng.integers(total_cells, size=total_cells // 2):
+        buckets.increment(cell)
+    grid_density = buckets.counts
+
+    def scan():
+        min_density = np.min(grid_density)
+        low_density_indices = np.where(grid_density == min_density)[0]
+        return low_density_indices[rng.integers(len(low_density_indices))]
+
+    def bucket():
+        return buckets.random_min_cells(rng)
+
+    def update():
+        buckets.increment(rng.integers(total_cells))
+
+    return time_per_call(scan, repeats), time_per_call(bucket, repeats), time_per_call(update, repeats)
+
+def bench_generation(num_atoms: int) -> float:
+    """逐个放置模式下每个原子的平均耗时（微秒）"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        random_structure.generate_random_structure(
+            num_atoms=num_atoms, density=0.0784, min_distance=1.5, seed=0
+        )
+    return (time.perf_counter() - start) / num_atoms * 1e6
+
+if __name__ == "__main__":
+    print("低密度网格选择（微秒/次）")
+    print(f"{'网格数':>10} {'全数组扫描':>12} {'桶队列选择':>12} {'桶队列更新':>12}")
+    for total_cells in [10**3, 10**4, 10**5, 10**6]:
+        scan, bucket, update = bench_selection(total_cells)
+        print(f"{total_cells:>10} {scan:>12.2f} {bucket:>12.2f} {update:>12.2f}")
+
+    print()
+    print("逐个放置模式（微秒/原子）")
+    print(f"{'原子数':>10} {'耗时':>12}")
+    for num_atoms in [1000, 4000, 16000]:
+        print(f"{num_atoms:>10} {bench_generation(num_atoms):>12.2f}")
@@ -0,0 +1,65 @@
+"""
+LAMMPS数据文件写出的吞吐量基准测试
+比较逐行 f-string 写出（原实现）与按列批量格式化的 save_lammps_data，
+分别给出未压缩、gzip和zstd（如已安装zstandard）输出的 MB/s 与 atoms/s
+"""
+
+import sys
+import os
+import time
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import numpy as np
+import random_structure
+
+def legacy_save_lammps_data(filename, positions, box_size, atom_types):
+    """原来的逐行写出方式（仅写出Atoms部分之前的简化文件头），作为对照"""
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write("LAMMPS data file generated by random-structure.py\n\n")
+        f.write(f"{len(positions)} atoms\n\n")
+        f.write(f"0.000000 {box_size[0]:.6f} xlo xhi\n")
+        f.write(f"0.000000 {box_size[1]:.6f} ylo yhi\n")
+        f.write(f"0.000000 {box_size[2]:.6f} zlo zhi\n\n")
+        f.write("Atoms\n\n")
+        for i in range(len(positions)):
+            f.write(f"{i+1} {atom_types[i]} {positions[i, 0]:.6f} {positions[i, 1]:.6f} {positions[i, 2]:.6f}\n")
+
+def measure(write, filename, num_atoms):
+    """运行一次写出并返回 (秒, 文件大小MB, 文件MB/s, atoms/s)"""
+    start = time.perf_counter()
+    write(filename)
+    elapsed = time.perf_counter() - start
+    size_mb = os.path.getsize(filename) / 1e6
+    return elapsed, size_mb, size_mb / elapsed, num_atoms / elapsed
+
+if __name__ == "__main__":
+    num_atoms = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    rng = np.random.default_rng(0)
+    box_size = [200.0, 200.0, 200.0]
+    positions = rng.random((num_atoms, 3)) * box_size
+    atom_types = rng.integers(1, 3, size=num_atoms)
+    element_types = np.where(atom_types == 1, "Fe", "B").tolist()
+
+    try:
+        import zstandard
+        compressions = [None, "gzip", "zstd"]
+    except ImportError:
+        compressions = [None, "gzip"]
+
+    cases = [("逐行写出 atomic", "legacy.data",
+              lambda name: legacy_save_lammps_data(name, positions, box_size, atom_types))]
+    for atom_style in ["atomic", "full"]:
+        for compression in compressions:
+            suffix = {None: "", "gzip": ".gz", "zstd": ".zst"}[compression]
+            cases.append((f"批量写出 {atom_style} {compression or ''}".strip(), f"{atom_style}.data{suffix}",
+                          lambda name, style=atom_style: random_structure.save_lammps_data(
+                              name, positions, box_size, atom_types, element_types, atom_style=style)))
+
+    print(f"原子数: {num_atoms}")
+    print(f"{'写出方式':<24} {'耗时(s)':>10} {'文件MB':>10} {'MB/s':>10} {'atoms/s':>14}")
+    with tempfile.TemporaryDirectory() as directory:
+        for label, name, write in cases:
+            elapsed, size_mb, mb_per_s, atoms_per_s = measure(write, os.path.join(directory, name), num_atoms)
+            print(f"{label:<24} {elapsed:>10.3f} {size_mb:>10.1f} {mb_per_s:>10.1f} {atoms_per_s:>14.0f}")
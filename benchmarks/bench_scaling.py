@@ -0,0 +1,293 @@
+"""
+结构生成与文件输出的规模化基准测试
+
+以一个基准配置为中心，依次单独改变原子数、数密度、最小距离、元素种类数和放置策略，
+记录 generate_random_structure 的耗时、每秒尝试次数、接受率和峰值内存，以及
+save_lammps_data / save_lammps_trajectory / TrajectoryWriter 的输出 MB/s。
+结果保存为JSON，并与保存的基准结果（baseline.json）比较，耗时明显变长的条目视为性能回退。
+
+用法:
+python benchmarks/bench_scaling.py                    # 运行并与 benchmarks/baseline.json 比较
+python benchmarks/bench_scaling.py --quick            # 只运行小规模的条目
+python benchmarks/bench_scaling.py --update-baseline  # 用本次结果覆盖基准结果
+"""
+
+import sys
+import os
+import io
+import json
+import time
+import argparse
+import platform
+import tempfile
+import tracemalloc
+import contextlib
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import numpy as np
+import random_structure
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+DEFAULT_OUTPUT = os.path.join(BENCHMARK_DIR, "results.json")
+
+ELEMENT_SETS = {
+    1: {"Ti": 1.0},
+    2: {"Ti": 0.5, "Al": 0.5},
+    3: {"Fe": 0.6, "Ni": 0.3, "B": 0.1},
+}
+
+# 放置策略名称到 generate_random_structure 参数的映射
+STRATEGIES = {
+    "sequential": dict(placement_strategy="rsa", batch_size=None),
+    "batched": dict(placement_strategy="rsa", batch_size=4096),
+    "void": dict(placement_strategy="void", batch_size=4096),
+    "relax": dict(placement_strategy="relax"),
+}
+
+# 基准配置：packing_fraction 为 密度 * pi/6 * min_distance^3（随机序列吸附的饱和值约为0.38）
+BASE_CASE = dict(num_atoms=10000, packing_fraction=0.25, min_distance=1.0, num_elements=2, strategy="batched")
+
+def generation_cases(quick: bool) -> List[Dict]:
+    """以基准配置为中心，每次只改变一个参数"""
+    sweeps = {
+        "num_atoms": [1000, 10000] if quick else [1000, 10000, 100000, 1000000],
+        "packing_fraction": [0.1, 0.25] if quick else [0.1, 0.25, 0.33],
+        "min_distance": [1.0, 2.0] if quick else [1.0, 1.5, 2.0, 3.0],
+        "num_elements": [1, 3],
+        "strategy": list(STRATEGIES),
+    }
+    cases = []
+    for parameter, values in sweeps.items():
+        for value in values:
+            case = dict(BASE_CASE, **{parameter: value})
+            # 逐个放置模式在大体系下太慢，只测到基准规模
+            if case["strategy"] == "sequential" and case["num_atoms"] > BASE_CASE["num_atoms"]:
+                continue
+            if case not in cases:
+                cases.append(case)
+    # 各放置策略随原子数的扩展性
+    for strategy in ("void", "relax"):
+        for num_atoms in ([] if quick else [100000]):
+            cases.append(dict(BASE_CASE, strategy=strategy, num_atoms=num_atoms))
+    return cases
+
+def io_cases(quick: bool) -> List[Dict]:
+    """输出基准：不同原子数和写出方式"""
+    sizes = [10000, 100000] if quick else [10000, 100000, 1000000]
+    cases = []
+    for num_atoms in sizes:
+        for writer in ("data", "data_gzip", "trajectory_frame", "trajectory_stream"):
+            cases.append(dict(num_atoms=num_atoms, writer=writer))
+    return cases
+
+def case_key(kind: str, case: Dict) -> str:
+    """用于与基准结果匹配的条目名"""
+    return kind + ":" + ",".join(f"{name}={case[name]}" for name in sorted(case))
+
+@contextlib.contextmanager
+def count_attempts():
+    """
+    临时包装各放置函数，记录它们返回的尝试次数
+
+    generate_random_structure在调用时才从模块中查找放置函数，因此替换模块属性即可，
+    不需要修改被测代码
+    """
+    record = {"attempts": 0}
+    names = ["_place_sequential", "_place_batched", "_place_void", "_place_relax"]
+    originals = {name: getattr(random_structure, name) for name in names}
+
+    def wrap(func):
+        def wrapper(*args, **kwargs):
+            placed_atoms, attempts = func(*args, **kwargs)
+            record["attempts"] += attempts
+            return placed_atoms, attempts
+        return wrapper
+
+    for name, func in originals.items():
+        setattr(random_structure, name, wrap(func))
+    try:
+        yield record
+    finally:
+        for name, func in originals.items():
+            setattr(random_structure, name, func)
+
+def measure(func: Callable, repeat: int, memory: bool, min_time: float = 1.0):
+    """
+    重复运行取最短耗时（累计运行超过min_time秒或达到repeat次后停止，耗时短的条目因此会多跑几次以降低噪声），
+    另外在tracemalloc下单独运行一次测量峰值内存（NumPy数组的分配也会被统计）
+
+    返回:
+    (最短耗时秒数, 峰值内存MB或None, 最后一次运行的返回值)
+    """
+    best = float("inf")
+    result = None
+    total = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        total += elapsed
+        if total >= min_time:
+            break
+    peak_mb = None
+    if memory:
+        tracemalloc.start()
+        func()
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    return best, peak_mb, result
+
+def run_generation_case(case: Dict, repeat: int, memory: bool) -> Dict:
+    density = case["packing_fraction"] / (np.pi / 6 * case["min_distance"]**3)
+    kwargs = dict(num_atoms=case["num_atoms"], density=density, min_distance=case["min_distance"],
+                  element_ratios=ELEMENT_SETS[case["num_elements"]], seed=0, **STRATEGIES[case["strategy"]])
+
+    def generate():
+        with count_attempts() as record, contextlib.redirect_stdout(io.StringIO()):
+            random_structure.generate_random_structure(**kwargs)
+        return record["attempts"]
+
+    wall_time, peak_mb, attempts = measure(generate, repeat, memory)
+    metrics = dict(wall_time=wall_time, attempts=attempts, peak_memory_mb=peak_mb,
+                   atoms_per_second=case["num_atoms"] / wall_time)
+    if case["strategy"] == "relax":
+        # 松弛模式的"尝试次数"是松弛轮数，接受率没有意义
+        metrics.update(sweeps=attempts, attempts=None, attempts_per_second=None, acceptance_rate=None)
+    else:
+        metrics.update(attempts_per_second=attempts / wall_time, acceptance_rate=case["num_atoms"] / attempts)
+    return metrics
+
+def run_io_case(case: Dict, directory: str, repeat: int, memory: bool) -> Dict:
+    num_atoms = case["num_atoms"]
+    rng = np.random.default_rng(0)
+    box_size = [100.0, 100.0, 100.0]
+    positions = rng.random((num_atoms, 3)) * box_size
+    atom_types = rng.integers(1, 3, size=num_atoms)
+    element_types = np.where(atom_types == 1, "Fe", "B").tolist()
+    writer = case["writer"]
+    filename = os.path.join(directory, {"data": "bench.data", "data_gzip": "bench.data.gz"}.get(writer, "bench.lammpstrj"))
+
+    def write():
+        # 单帧轨迹写出在文件已存在时会追加，每次运行前先删除
+        if os.path.exists(filename):
+            os.remove(filename)
+        if writer in ("data", "data_gzip"):
+            random_structure.save_lammps_data(filename, positions, box_size, atom_types, element_types)
+        elif writer == "trajectory_frame":
+            random_structure.save_lammps_trajectory(filename, positions, box_size, atom_types, element_types,
+                                                    num_atoms, num_atoms)
+        else:
+            # 模拟生成过程中的流式写出：每放置1%原子写一帧增量
+            with random_structure.TrajectoryWriter(filename, stride=num_atoms // 100, incremental=True) as stream:
+                for placed_atoms in range(0, num_atoms + 1, max(1, num_atoms // 1000)):
+                    stream.update(positions, atom_types, box_size, placed_atoms)
+        return os.path.getsize(filename) / 1e6
+
+    wall_time, peak_mb, size_mb = measure(write, repeat, memory)
+    return dict(wall_time=wall_time, peak_memory_mb=peak_mb, output_mb=size_mb,
+                mb_per_second=size_mb / wall_time, atoms_per_second=num_atoms / wall_time)
+
+def metadata() -> Dict:
+    return dict(timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"), python=platform.python_version(),
+                numpy=np.__version__, platform=platform.platform(), processor=platform.processor(),
+                cpu_count=os.cpu_count())
+
+def compare(results: List[Dict], baseline: Dict, tolerance: float, noise_floor: float) -> List[Dict]:
+    """
+    与基准结果逐条比较耗时
+
+    参数:
+    results: 本次的结果条目
+    baseline: 基准结果（与输出文件格式相同）
+    tolerance: 允许的相对变慢比例
+    noise_floor: 绝对差值低于该秒数时不视为回退（过短的条目计时噪声大）
+
+    返回:
+    回退条目列表
+    """
+    reference = {entry["key"]: entry for entry in baseline.get("results", [])}
+    regressions = []
+    print(f"\n与基准结果比较（{baseline.get('metadata', {}).get('timestamp', '未知时间')}）:")
+    print(f"{'条目':<72} {'基准(s)':>10} {'本次(s)':>10} {'比值':>8}")
+    for entry in results:
+        old = reference.get(entry["key"])
+        if old is None:
+            continue
+        ratio = entry["wall_time"] / old["wall_time"]
+        regressed = ratio > 1 + tolerance and entry["wall_time"] - old["wall_time"] > noise_floor
+        flag = "  <-- 回退" if regressed else ""
+        print(f"{entry['key']:<72} {old['wall_time']:>10.3f} {entry['wall_time']:>10.3f} {ratio:>8.2f}{flag}")
+        if regressed:
+            regressions.append(dict(key=entry["key"], baseline=old["wall_time"], current=entry["wall_time"], ratio=ratio))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="结构生成与输出的规模化基准测试")
+    parser.add_argument("--quick", action="store_true", help="只运行小规模条目")
+    parser.add_argument("--repeat", type=int, default=5, help="每个条目的最多重复次数（取最短耗时，累计超过1秒即停止）")
+    parser.add_argument("--no-memory", action="store_true", help="不测量峰值内存（省去一次额外运行）")
+    parser.add_argument("--only", choices=["generation", "io"], help="只运行其中一类")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="结果JSON文件")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="基准结果JSON文件")
+    parser.add_argument("--update-baseline", action="store_true", help="把本次结果写为新的基准结果")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允许的相对变慢比例，默认25%%")
+    parser.add_argument("--noise-floor", type=float, default=0.05, help="小于该秒数的差值不视为回退")
+    args = parser.parse_args()
+    memory = not args.no_memory
+
+    results = []
+    if args.only in (None, "generation"):
+        print(f"{'放置策略':<12} {'原子数':>9} {'堆积分数':>8} {'最小距离':>8} {'元素数':>6} "
+              f"{'耗时(s)':>9} {'尝试/s':>12} {'接受率':>8} {'峰值MB':>9}")
+        for case in generation_cases(args.quick):
+            metrics = run_generation_case(case, args.repeat, memory)
+            results.append(dict(kind="generation", key=case_key("generation", case), params=case, **metrics))
+            rate = f"{metrics['attempts_per_second']:>12.0f}" if metrics["attempts_per_second"] else f"{'-':>12}"
+            acceptance = f"{metrics['acceptance_rate']:>8.3f}" if metrics["acceptance_rate"] else f"{'-':>8}"
+            peak = f"{metrics['peak_memory_mb']:>9.1f}" if memory else f"{'-':>9}"
+            print(f"{case['strategy']:<12} {case['num_atoms']:>9} {case['packing_fraction']:>8.2f} "
+                  f"{case['min_distance']:>8.1f} {case['num_elements']:>6} {metrics['wall_time']:>9.3f} "
+                  f"{rate} {acceptance} {peak}")
+
+    if args.only in (None, "io"):
+        print(f"\n{'写出方式':<20} {'原子数':>9} {'耗时(s)':>9} {'文件MB':>9} {'MB/s':>9} {'峰值MB':>9}")
+        with tempfile.TemporaryDirectory() as directory:
+            for case in io_cases(args.quick):
+                metrics = run_io_case(case, directory, args.repeat, memory)
+                results.append(dict(kind="io", key=case_key("io", case), params=case, **metrics))
+                peak = f"{metrics['peak_memory_mb']:>9.1f}" if memory else f"{'-':>9}"
+                print(f"{case['writer']:<20} {case['num_atoms']:>9} {metrics['wall_time']:>9.3f} "
+                      f"{metrics['output_mb']:>9.1f} {metrics['mb_per_second']:>9.1f} {peak}")
+
+    report = dict(metadata=metadata(), results=results)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n结果已保存到 {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"基准结果已更新: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("没有找到基准结果，使用 --update-baseline 生成")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance, args.noise_floor)
+    report["regressions"] = regressions
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    if regressions:
+        print(f"\n发现 {len(regressions)} 个性能回退条目")
+        return 1
+    print("\n没有发现性能回退")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
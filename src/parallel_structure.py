@@ -0,0 +1,669 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+随机结构的并行生成：
+1. 进程池批量生成相互独立的结构（可复现的独立随机数种子）
+2. 区域分解并行生成单个超大结构
+3. 平铺复制：生成一个小的周期性tile，经随机对称变换后复制成超大结构
+@Time: 2026/10/17
+@File: parallel_structure.py
+@Author: Xuerui Wei
+"""
+
+import numpy as np
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from random_structure import (generate_random_structure, save_lammps_data, CellList, BackgroundWriter,
+                              _place_batched, _place_void, _assign_atom_types, _report_progress,
+                              _batch_conflicts, _allocate_positions, _type_sequences, _compact_type_dtype)
+from structure_analysis import neighbor_list
+
+class EnsembleResult(NamedTuple):
+    """集合中一个结构的生成结果"""
+    index: int  # 结构在集合中的编号
+    root_seed: int  # 集合的根种子，配合index可以复现该结构
+    filename: Optional[str]  # 工作进程写出的LAMMPS数据文件路径，未写文件时为None
+    positions: Optional[np.ndarray]  # 原子坐标，写文件时为None（避免在进程间传输大数组）
+    box_size: List[float]  # 盒子尺寸
+    atom_types: Optional[List[int]]  # 原子类型列表，写文件时为None
+    element_types: Optional[List[str]]  # 元素类型名称列表，写文件时为None
+
+def ensemble_seed(root_seed: int, index: int) -> np.random.SeedSequence:
+    """
+    返回集合中第index个结构的随机数种子
+
+    与 np.random.SeedSequence(root_seed).spawn(n)[index] 相同，各结构的随机数流相互独立，
+    不需要生成前面的结构就能单独复现任意一个结构
+
+    参数:
+    root_seed: 集合的根种子
+    index: 结构编号
+
+    返回:
+    SeedSequence对象
+    """
+    return np.random.SeedSequence(root_seed, spawn_key=(index,))
+
+def ensemble_member(index: int, root_seed: int, **generation_kwargs):
+    """
+    在当前进程中复现集合中的第index个结构
+
+    参数:
+    index: 结构编号
+    root_seed: 集合的根种子
+    generation_kwargs: 传给generate_random_structure的参数（需与生成集合时相同）
+
+    返回:
+    与generate_random_structure相同
+    """
+    return generate_random_structure(seed=ensemble_seed(root_seed, index), **generation_kwargs)
+
+def _generate_member(index: int, root_seed: int, filename: Optional[str],
+                     generation_kwargs: dict, save_kwargs: dict) -> EnsembleResult:
+    """工作进程中生成一个结构，需要时直接写出文件"""
+    # 多个进程同时刷新进度会使终端输出混乱，因此在工作进程中默认关闭进度显示
+    generation_kwargs = dict(generation_kwargs)
+    generation_kwargs.setdefault("progress", False)
+    positions, box_size, atom_types, element_types = ensemble_member(index, root_seed, **generation_kwargs)
+    if filename is None:
+        return EnsembleResult(index, root_seed, None, positions, box_size, atom_types, element_types)
+    save_lammps_data(filename, positions, box_size, atom_types, element_types, **save_kwargs)
+    return EnsembleResult(index, root_seed, filename, None, box_size, None, None)
+
+def generate_ensemble(
+    num_structures: int,
+    root_seed: int = None,
+    output_dir: str = None,
+    filename_pattern: str = "structure_{index:04d}.data",
+    max_workers: int = None,
+    save_kwargs: dict = None,
+    io_queue_size: int = 0,
+    **generation_kwargs
+) -> Iterator[EnsembleResult]:
+    """
+    用进程池并行生成一组相互独立的随机结构，结果按完成顺序逐个返回
+
+    每个结构的种子由根种子通过SeedSequence派生（见ensemble_seed），因此整个集合以及
+    其中任意一个结构都可以由根种子复现，与工作进程数和完成顺序无关。
+
+    参数:
+    num_structures: 结构数量
+    root_seed: 根种子，默认为None（随机生成，并记录在每个结果的root_seed中）
+    output_dir: 输出目录；给出时由工作进程直接写出LAMMPS数据文件，只返回文件路径
+    filename_pattern: 输出文件名模板，可使用 {index}
+    max_workers: 工作进程数，默认为CPU核数；为1时在当前进程中依次生成
+    save_kwargs: 传给save_lammps_data的额外参数（如atom_style、compression）
+    io_queue_size: 大于0且max_workers=1、给出output_dir时，文件由BackgroundWriter的写入线程写出，
+                   生成下一个结构的同时写出上一个结构，最多有io_queue_size个结构等待写出；
+                   返回结果时文件可能尚未写完，迭代结束时全部写完，写入出错时由迭代器抛出。
+                   进程池中各工作进程的写入本来就与其他进程的生成重叠，不使用该参数
+    generation_kwargs: 传给generate_random_structure的参数（num_atoms、density等）
+
+    返回:
+    EnsembleResult的迭代器
+    """
+    if generation_kwargs.get("generate_trajectory"):
+        raise ValueError("集合生成不支持轨迹输出，请关闭generate_trajectory")
+    if root_seed is None:
+        root_seed = np.random.SeedSequence().entropy
+    save_kwargs = save_kwargs or {}
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+
+    def task_args(index):
+        filename = None
+        if output_dir is not None:
+            filename = os.path.join(output_dir, filename_pattern.format(index=index))
+        return index, root_seed, filename, generation_kwargs, save_kwargs
+
+    if max_workers == 1 and output_dir is not None and io_queue_size > 0:
+        member_kwargs = dict(generation_kwargs)
+        member_kwargs.setdefault("progress", False)
+        # 提前停止迭代时with块等待已提交的文件写完
+        with BackgroundWriter(io_queue_size) as writer:
+            for index in range(num_structures):
+                filename = task_args(index)[2]
+                positions, box_size, atom_types, element_types = ensemble_member(index, root_seed, **member_kwargs)
+                writer.save_lammps_data(filename, positions, box_size, atom_types, element_types, **save_kwargs)
+                yield EnsembleResult(index, root_seed, filename, None, box_size, None, None)
+        return
+
+    if max_workers == 1:
+        for index in range(num_structures):
+            yield _generate_member(*task_args(index))
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_generate_member, *task_args(index)) for index in range(num_structures)]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # 提前停止迭代或出错时取消尚未开始的任务
+            for future in futures:
+                future.cancel()
+
+def _default_domains(n_cells: np.ndarray, num_domains: int) -> np.ndarray:
+    """
+    把子区域数分解到三个方向上，尽量使子区域接近立方体
+
+    每个被切分的方向上，一个子区域至少需要2个网格（内部 + 边界带）
+
+    参数:
+    n_cells: 各方向的网格数 [nx, ny, nz]
+    num_domains: 期望的子区域数
+
+    返回:
+    各方向的子区域数 [dx, dy, dz]
+    """
+    domains = np.ones(3, dtype=np.int64)
+    factor = 2
+    remaining = num_domains
+    factors = []
+    while remaining > 1:
+        while remaining % factor == 0:
+            factors.append(factor)
+            remaining //= factor
+        factor += 1
+    for factor in sorted(factors, reverse=True):
+        # 优先切分当前每个子区域网格数最多的方向
+        cells_per_domain = n_cells // domains
+        for axis in np.argsort(-cells_per_domain, kind='stable'):
+            if n_cells[axis] // (domains[axis] * factor) >= 2:
+                domains[axis] *= factor
+                break
+    return domains
+
+def _fill_domain(origin: np.ndarray, size: np.ndarray, periodic: np.ndarray, num_atoms: int,
+                 min_distance: float, seed: np.random.SeedSequence, batch_size: int,
+                 placement_strategy: str) -> Tuple[np.ndarray, int]:
+    """
+    工作进程中填充一个子区域的内部
+
+    被切分方向上的内部区域与相邻子区域之间隔着至少一个网格宽（不小于min_distance）的
+    边界带，因此这里按非周期盒子处理，不需要知道其他子区域中的原子；未被切分的方向
+    仍然是整个盒子长度，按周期性处理。
+
+    参数:
+    origin: 内部区域在整个盒子中的下角点坐标
+    size: 内部区域尺寸
+    periodic: 各方向是否周期性
+    num_atoms: 目标原子数
+    min_distance: 原子间最小距离
+    seed: 该子区域的随机数种子
+    batch_size: 每批候选点数
+    placement_strategy: 放置策略，"rsa"或"void"
+
+    返回:
+    positions: 已放置原子在整个盒子中的坐标（达到饱和时少于num_atoms个）
+    attempts: 已尝试的候选点总数
+    """
+    rng = np.random.default_rng(seed)
+    positions = np.zeros((num_atoms, 3))
+    cell_list = CellList(positions, size, min_distance,
+                         track_density=(placement_strategy == "rsa"), periodic=periodic)
+    if placement_strategy == "void":
+        placed_atoms, attempts = _place_void(positions, cell_list, rng, batch_size,
+                                             max_attempts=num_atoms * 1000)
+    else:
+        placed_atoms, attempts = _place_batched(positions, cell_list, rng, batch_size,
+                                                max_attempts=num_atoms * 1000)
+    return positions[:placed_atoms] + origin, attempts
+
+def generate_domain_decomposed(
+    num_atoms: int,
+    density: float,
+    min_distance: float = 1.0,
+    element_ratios: Dict[str, float] = None,
+    domains: Tuple[int, int, int] = None,
+    max_workers: int = None,
+    seed=None,
+    batch_size: int = 4096,
+    placement_strategy: str = "rsa",
+    progress=True
+) -> Tuple[np.ndarray, List[float], List[int], List[str]]:
+    """
+    区域分解并行生成单个超大随机结构
+
+    盒子按与generate_random_structure相同的网格划分（网格宽度不小于min_distance），沿网格
+    边界切成 dx*dy*dz 个子区域。每个子区域在被切分方向上的最后一层网格作为边界带，
+    其余部分（内部）由工作进程独立填充；不同子区域的内部之间（包括跨周期性边界）至少
+    相隔一个网格宽，所以各自满足最小距离即可保证整体满足。所有内部填充完成后，主进程把
+    这些原子插入整个盒子的网格，再用空隙跟踪方式在边界带中补足剩余原子，边界带中的
+    候选点与两侧子区域的原子一起检查，因此最终结构在子区域边界和周期性边界上都满足
+    min_distance。
+
+    参数:
+    num_atoms: 原子数量
+    density: 数密度 (atoms per cubic unit)
+    min_distance: 原子间最小距离
+    element_ratios: 元素类型及其比例，例如 {"Ti": 0.5, "Al": 0.5}
+    domains: 各方向的子区域数 (dx, dy, dz)，默认为None（按工作进程数自动分解）
+    max_workers: 工作进程数，默认为CPU核数；为1时在当前进程中依次填充各子区域
+    seed: 随机数种子（int或np.random.SeedSequence）；种子和domains相同时结果与工作进程数无关
+    batch_size: 每批候选点数
+    placement_strategy: 子区域内部的放置策略，"rsa"（批量随机序列吸附，默认）或"void"
+    progress: 进度显示，与generate_random_structure相同（True、False或回调 progress(placed_atoms, num_atoms)）
+
+    返回:
+    positions: 原子坐标 (num_atoms x 3)
+    box_size: 盒子边长 [lx, ly, lz]
+    atom_types: 原子类型列表
+    element_types: 元素类型名称列表
+    """
+    if placement_strategy not in ("rsa", "void"):
+        raise ValueError(f"未知的放置策略: {placement_strategy}")
+
+    box_length = (num_atoms / density)**(1/3)
+    box_size = [box_length, box_length, box_length]
+    box = np.asarray(box_size)
+    n_cells = np.maximum(1, np.floor(box / min_distance).astype(np.int64))
+    cell_width = box / n_cells
+
+    if domains is None:
+        domains = _default_domains(n_cells, max_workers or os.cpu_count() or 1)
+    domains = np.asarray(domains, dtype=np.int64)
+    if np.any(domains < 1) or np.any(n_cells[domains > 1] // domains[domains > 1] < 2):
+        raise ValueError(f"子区域划分 {tuple(domains)} 过细：被切分方向上每个子区域至少需要2个网格 "
+                         f"(网格数 {tuple(n_cells)})")
+    split = domains > 1
+
+    # 各方向的子区域边界（网格编号），被切分方向上每个子区域的最后一层网格为边界带
+    bounds = [np.linspace(0, n, d + 1).round().astype(np.int64) for n, d in zip(n_cells, domains)]
+    halo_rows = []
+    for axis in range(3):
+        rows = np.zeros(n_cells[axis], dtype=bool)
+        if split[axis]:
+            rows[bounds[axis][1:] - 1] = True
+        halo_rows.append(rows)
+
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+
+    def child_seed(index):
+        return np.random.SeedSequence(root.entropy, spawn_key=tuple(root.spawn_key) + (index,))
+
+    tasks = []
+    box_volume = np.prod(box)
+    for index, (i, j, k) in enumerate(np.ndindex(*domains)):
+        lower = np.array([bounds[0][i], bounds[1][j], bounds[2][k]])
+        upper = np.array([bounds[0][i + 1], bounds[1][j + 1], bounds[2][k + 1]]) - split
+        origin = lower * cell_width
+        size = (upper - lower) * cell_width
+        target = int(round(num_atoms * np.prod(size) / box_volume))
+        tasks.append((origin, size, ~split, target, min_distance, child_seed(index),
+                      batch_size, placement_strategy))
+
+    # 内部填充
+    if max_workers == 1:
+        results = [_fill_domain(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_fill_domain, *zip(*tasks)))
+
+    positions = np.zeros((num_atoms, 3))
+    placed_atoms = 0
+    attempts = 0
+    for domain_positions, domain_attempts in results:
+        count = min(len(domain_positions), num_atoms - placed_atoms)
+        positions[placed_atoms:placed_atoms + count] = domain_positions[:count]
+        placed_atoms += count
+        attempts += domain_attempts
+
+    if progress is True:
+        report = lambda previous, placed: _report_progress(previous, placed, num_atoms)
+    elif progress:
+        report = lambda previous, placed: progress(placed, num_atoms)
+    else:
+        report = None
+    if report is not None:
+        report(0, placed_atoms)
+
+    # 边界带填充：所有内部原子先插入整个盒子的周期性网格，再只在与边界带重叠的空隙网格中投点
+    rng = np.random.default_rng(child_seed(len(tasks)))
+    cell_list = CellList(positions, box_size, min_distance)
+    cell_list.insert(np.arange(placed_atoms))
+
+    def in_halo(lower, upper):
+        mask = np.zeros(len(lower), dtype=bool)
+        for axis in np.flatnonzero(split):
+            # 空隙网格比网格窄，最多跨越两层网格
+            first = np.floor(lower[:, axis] / cell_width[axis]).astype(np.int64) % n_cells[axis]
+            last = np.floor(upper[:, axis] / cell_width[axis] - 1e-9).astype(np.int64) % n_cells[axis]
+            mask |= halo_rows[axis][first] | halo_rows[axis][last]
+        return mask
+
+    if placed_atoms < num_atoms:
+        previous_placed = placed_atoms
+        placed_atoms, halo_attempts = _place_void(
+            positions, cell_list, rng, batch_size,
+            max_attempts=num_atoms * 1000,
+            on_batch=report,
+            region=in_halo if split.any() else None,
+            start=previous_placed
+        )
+        attempts += halo_attempts
+
+    if placed_atoms < num_atoms:
+        raise RuntimeError(f"无法在 {attempts} 次尝试内放置所有原子，请检查参数设置")
+
+    atom_types, element_types = _assign_atom_types(num_atoms, element_ratios, rng)
+    if progress is True:
+        print()  # 换行
+    return positions, box_size, atom_types, element_types
+
+class TilingReport:
+    """
+    平铺复制生成的结构中仍然存在的关联
+
+    传给 generate_tiled_structure(report=...) 后填充，用来判断平铺结构能否代替真正独立生成的
+    大结构。每个tile都是同一个模板经过对称操作、平移、元素重排和小位移得到的，因此：
+    距离小于 max_reliable_distance 的局部量（g(r)、配位数、键角分布）与模板相同，是可靠的；
+    波矢小于 min_reliable_wavevector 的长波涨落（小q的结构因子、密度和组成在tile之间的涨落）
+    被人为压低——每个tile的原子数和组成完全相同；对整体求平均的统计量的有效独立样本数只有
+    independent_atoms 个原子，而不是全部原子数。
+
+    属性:
+    tiles: 各方向的tile数 (nx, ny, nz)
+    tile_atoms: 每个tile的原子数（即独立原子数 independent_atoms）
+    tile_box: tile的盒子尺寸 [lx, ly, lz]
+    operations: 每个tile使用的对称操作矩阵 (T x 3 x 3)，tile内坐标 u' = R (u - c) + c
+    shifts: 每个tile内容的周期性平移 (T x 3)
+    shuffle_species: 是否在每个tile中随机重排元素
+    perturbation: 每个坐标分量的最大随机位移
+    boundary_atoms: 与tile边界面的距离小于min_distance的原子数（这些原子的环境在模板中不存在）
+    repaired_atoms: 因跨tile边界距离过近而被重新放置的原子数
+    timings: 各阶段耗时（秒）：tile / replicate / repair / total
+    """
+
+    def __init__(self):
+        self.tiles = (1, 1, 1)
+        self.tile_atoms = 0
+        self.tile_box = [0.0, 0.0, 0.0]
+        self.operations = np.zeros((0, 3, 3), dtype=np.int8)
+        self.shifts = np.zeros((0, 3))
+        self.shuffle_species = False
+        self.perturbation = 0.0
+        self.boundary_atoms = 0
+        self.repaired_atoms = 0
+        self.timings = {}
+
+    @property
+    def independent_atoms(self) -> int:
+        """相互独立的原子数"""
+        return self.tile_atoms
+
+    @property
+    def copies(self) -> int:
+        """每个模板原子的副本数"""
+        return int(np.prod(self.tiles))
+
+    @property
+    def distinct_operations(self) -> int:
+        """实际用到的不同对称操作数"""
+        return len(np.unique(self.operations.reshape(len(self.operations), -1), axis=0))
+
+    @property
+    def max_reliable_distance(self) -> float:
+        """在此距离以内的原子对都来自同一个tile（或跨边界的新环境），与模板的局部结构相同"""
+        return float(min(self.tile_box)) / 2
+
+    @property
+    def min_reliable_wavevector(self) -> float:
+        """小于此波矢的长波涨落受到tile重复的影响"""
+        return 2 * np.pi / float(min(self.tile_box))
+
+    def as_dict(self) -> dict:
+        """可以直接写成JSON的字典（不含逐个tile的变换）"""
+        return {
+            "tiles": [int(n) for n in self.tiles],
+            "tile_atoms": self.tile_atoms,
+            "tile_box": [float(length) for length in self.tile_box],
+            "copies": self.copies,
+            "independent_atoms": self.independent_atoms,
+            "distinct_operations": self.distinct_operations,
+            "shuffle_species": self.shuffle_species,
+            "perturbation": self.perturbation,
+            "boundary_atoms": self.boundary_atoms,
+            "repaired_atoms": self.repaired_atoms,
+            "max_reliable_distance": self.max_reliable_distance,
+            "min_reliable_wavevector": self.min_reliable_wavevector,
+            "timings": dict(self.timings),
+        }
+
+def _box_symmetry_operations(box: np.ndarray) -> np.ndarray:
+    """
+    把正交盒子映射到自身的对称操作（坐标轴的置换与反射），只有长度相同的轴之间可以交换；
+    立方盒子有48个
+
+    返回:
+    操作矩阵 (K x 3 x 3)，每行每列只有一个 ±1
+    """
+    operations = []
+    for permutation in itertools.permutations(range(3)):
+        if np.allclose(box[list(permutation)], box):
+            for signs in itertools.product((1, -1), repeat=3):
+                matrix = np.zeros((3, 3), dtype=np.int8)
+                matrix[np.arange(3), permutation] = signs
+                operations.append(matrix)
+    return np.array(operations)
+
+def _repair_tile_faces(positions: np.ndarray, box_size: List[float], boundary: np.ndarray, shell: np.ndarray,
+                       min_distance: float, rng: np.random.Generator, trials: int = 16,
+                       local_rounds: int = 16, max_rounds: int = 1000, chunk_size: int = 1 << 16) -> int:
+    """
+    消除不同tile的原子之间跨边界面的距离冲突
+
+    只有两侧都在边界面附近（没有位移时为min_distance以内）的原子才可能冲突。_batch_conflicts 在这些原子中找出与
+    更早的原子冲突的一方（只需要对排序后的网格编号二分查找，不需要为整个大盒子分配网格），
+    把它们在原位置附近（每个分量不超过min_distance）重新投点；接近饱和密度时附近可能没有
+    空间，local_rounds轮之后改为在随机选取的其他边界原子的原位置附近投点（原子数和组成不变）。新位置
+    离边界面比边界原子最多远min_distance，可能与它冲突的原子都在shell中（比boundary的范围宽
+    2*min_distance），因此只需要和shell原子一起检查。每轮为每个待放置原子同时生成多个候选点（逐轮加倍到trials个），
+    用CellList与已固定的原子批量检查。
+
+    参数:
+    positions: 整个盒子的原子坐标（就地修改，可以是np.memmap）
+    box_size: 整个盒子的尺寸
+    boundary: 与边界面距离小于min_distance（加上位移幅度）的原子编号
+    shell: 与边界面距离小于3*min_distance（加上位移幅度）的原子编号（包含boundary）
+    min_distance: 原子间最小距离
+    rng: 随机数生成器
+    trials: 每轮为每个原子生成的最大候选点数
+    local_rounds: 在原位置附近尝试的轮数
+    max_rounds: 重新投点的最大轮数
+    chunk_size: 每次与固定原子比较的候选点数
+
+    返回:
+    重新放置的原子数
+    """
+    box = np.asarray(box_size, dtype=float)
+    conflicting = boundary[_batch_conflicts(positions[boundary], box, min_distance)]
+    if len(conflicting) == 0:
+        return 0
+
+    # 重新放置之前的边界原子位置
+    boundary_points = np.asarray(positions[boundary], dtype=float)
+    origins = np.asarray(positions[conflicting], dtype=float)
+    fixed = shell[~np.isin(shell, conflicting)]
+
+    # 固定原子插入CellList；网格数与shell原子数相当，不随整个盒子的体积增长
+    points = np.zeros((len(fixed) + len(conflicting), 3))
+    points[:len(fixed)] = positions[fixed]
+    cell_size = max(min_distance, (np.prod(box) / max(len(fixed), 1))**(1/3))
+    cell_list = CellList(points, box_size, min_distance, cell_size=cell_size)
+    cell_list.insert(np.arange(len(fixed)))
+    filled = len(fixed)
+
+    pending = np.arange(len(conflicting))
+    for round_index in range(max_rounds):
+        # 先在原位置附近尝试；附近没有空间时（接近饱和密度）改为在任意边界原子附近尝试
+        if round_index < local_rounds:
+            centers = origins[pending]
+        else:
+            centers = boundary_points[rng.integers(len(boundary), size=len(pending))]
+        # 每个待放置原子同时尝试多个候选点（密度低时大多一次成功，候选点数逐轮加倍），取第一个不与固定原子冲突的
+        count = min(trials, 1 << round_index)
+        candidates = (centers[:, None, :] + rng.uniform(-min_distance, min_distance,
+                                                        (len(pending), count, 3))) % box
+        candidates = candidates.reshape(-1, 3)
+        # 分块检查，每次展开的原子对数有上限
+        valid = np.concatenate([~cell_list.has_conflict(candidates[start:start + chunk_size])
+                                for start in range(0, len(candidates), chunk_size)])
+        candidates, valid = candidates.reshape(len(pending), count, 3), valid.reshape(len(pending), count)
+        found = np.flatnonzero(valid.any(axis=1))
+        chosen = candidates[found, valid[found].argmax(axis=1)]
+        # 同一轮中相互冲突的候选点只保留排在前面的
+        accepted = ~_batch_conflicts(chosen, box, min_distance)
+        found, chosen = found[accepted], chosen[accepted]
+        positions[conflicting[pending[found]]] = chosen
+        points[filled:filled + len(found)] = chosen
+        cell_list.insert(np.arange(filled, filled + len(found)))
+        filled += len(found)
+        pending = np.delete(pending, found)
+        if len(pending) == 0:
+            return len(conflicting)
+    raise RuntimeError(f"tile边界修复失败：{len(pending)} 个原子在 {max_rounds} 轮尝试内找不到满足最小距离的位置，"
+                       f"请减小密度或使用更大的tile")
+
+def generate_tiled_structure(
+    tiles: Tuple[int, int, int],
+    tile_atoms: int,
+    density: float,
+    min_distance: float = 1.0,
+    element_ratios: Dict[str, float] = None,
+    rotate: bool = True,
+    shift: bool = True,
+    shuffle_species: bool = True,
+    perturbation: float = 0.0,
+    seed=None,
+    positions_file: str = None,
+    report: TilingReport = None,
+    progress=True,
+    **generation_kwargs
+) -> Tuple[np.ndarray, List[float], List[int], List[str]]:
+    """
+    平铺复制生成超大随机结构
+
+    先用generate_random_structure生成一个 tile_atoms 个原子的周期性tile，再复制成
+    nx*ny*nz 个tile。每个副本独立地随机选择：盒子的对称操作（坐标轴的置换与反射，立方
+    tile有48个）、tile内容的周期性平移、元素在原子之间的重排，以及每个原子的小位移。前三种
+    变换保持tile内所有原子对的周期性距离；位移之后，按模板中距离小于
+    min_distance + 2*sqrt(3)*perturbation 的原子对检查，使距离过近的两个原子退回未位移的位置。
+    相邻副本的变换不同，跨边界面的原子对不再是模板中的原子对，最后在边界面附近检查这些
+    原子对并把冲突的原子就近重新放置，所以整个结构（包括周期性边界）满足min_distance。
+
+    整个过程的耗时约为生成一个tile加上对全部原子的几次向量化复制。接近随机序列吸附饱和密度时，
+    跨边界的冲突增多、边界附近的空隙也更难找到，修复可能成为主要耗时（见TilingReport.timings），
+    此时可以使用更大的tile或generate_domain_decomposed。结构中仍然存在的关联见TilingReport：
+    它只适合研究局部结构，不适合研究长波涨落或需要大量独立样本的统计量。
+
+    参数:
+    tiles: 各方向的tile数 (nx, ny, nz)
+    tile_atoms: 每个tile的原子数
+    density: 数密度 (atoms per cubic unit)
+    min_distance: 原子间最小距离（只支持单一的最小距离，元素重排会改变元素对）
+    element_ratios: 元素类型及其比例，例如 {"Ti": 0.5, "Al": 0.5}
+    rotate: 是否对每个tile随机施加盒子的对称操作
+    shift: 是否对每个tile的内容随机做周期性平移
+    shuffle_species: 是否在每个tile中随机重排元素
+    perturbation: 每个坐标分量的最大随机位移，默认为0（不位移）
+    seed: 随机数种子（int或np.random.SeedSequence）
+    positions_file: 坐标内存映射文件；给出时坐标写入该文件，原子类型以int8/int16数组返回
+    report: TilingReport对象，给出时填充仍然存在的关联和各阶段耗时
+    progress: tile生成的进度显示，与generate_random_structure相同
+    generation_kwargs: 传给generate_random_structure的其他参数（batch_size、placement_strategy、box_shape等）
+
+    返回:
+    positions: 原子坐标 (tile_atoms*nx*ny*nz x 3)
+    box_size: 盒子边长 [lx, ly, lz]
+    atom_types: 原子类型列表
+    element_types: 元素类型名称列表
+    """
+    if isinstance(min_distance, dict):
+        raise ValueError("平铺模式只支持单一的最小距离")
+    tiles = np.asarray(tiles, dtype=np.int64)
+    if tiles.shape != (3,) or np.any(tiles < 1):
+        raise ValueError(f"tile数必须是三个正整数: {tuple(tiles)}")
+    if perturbation < 0:
+        raise ValueError("perturbation不能为负数")
+    start_time = time.perf_counter()
+
+    root = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    tile_seed, transform_seed = (np.random.SeedSequence(root.entropy, spawn_key=tuple(root.spawn_key) + (index,))
+                                 for index in range(2))
+    tile_positions, tile_box, tile_types, _ = generate_random_structure(
+        tile_atoms, density, min_distance, element_ratios, seed=tile_seed, progress=progress, **generation_kwargs)
+    if len(tile_box) != 3:
+        raise ValueError("平铺模式只支持正交的tile")
+    tile_time = time.perf_counter()
+
+    elements = list(element_ratios) if element_ratios is not None else ["Ti"]
+    tile_box = np.asarray(tile_box, dtype=float)
+    tile_types = np.asarray(tile_types).astype(_compact_type_dtype(len(elements)))
+    box_size = (tile_box * tiles).tolist()
+    num_tiles = int(np.prod(tiles))
+    num_atoms = tile_atoms * num_tiles
+    rng = np.random.default_rng(transform_seed)
+
+    symmetry = _box_symmetry_operations(tile_box) if rotate else np.eye(3, dtype=np.int8)[None]
+    operations = symmetry[rng.integers(len(symmetry), size=num_tiles)]
+    shifts = rng.random((num_tiles, 3)) * tile_box if shift else np.zeros((num_tiles, 3))
+    if perturbation > 0:
+        # 位移后可能小于min_distance的模板原子对（周期性距离在对称操作和平移下不变）
+        first, second, _ = neighbor_list(tile_positions, tile_box.tolist(),
+                                         min_distance + 2 * np.sqrt(3) * perturbation)
+
+    positions = _allocate_positions(num_atoms, positions_file)
+    atom_types = np.empty(num_atoms, dtype=tile_types.dtype)
+    center = tile_box / 2
+    boundary, shell = [], []
+    for index, tile_index in enumerate(np.ndindex(*tiles)):
+        local = ((tile_positions - center) @ operations[index].T + center + shifts[index]) % tile_box
+        if perturbation > 0:
+            displacement = rng.uniform(-perturbation, perturbation, local.shape)
+            # 跨tile边界的原子对由边界修复处理，这里只检查在tile内部的原子对
+            delta = local[second] - local[first]
+            inside = np.all(np.abs(delta) < center, axis=1)
+            pair_first, pair_second, delta = first[inside], second[inside], delta[inside]
+            while True:
+                moved = delta + displacement[pair_second] - displacement[pair_first]
+                close = np.einsum('ij,ij->i', moved, moved) < min_distance**2
+                if not close.any():
+                    break
+                displacement[pair_first[close]] = 0.0
+                displacement[pair_second[close]] = 0.0
+            local += displacement
+        offset = index * tile_atoms
+        positions[offset:offset + tile_atoms] = (local + np.asarray(tile_index) * tile_box) % box_size
+        atom_types[offset:offset + tile_atoms] = rng.permutation(tile_types) if shuffle_species else tile_types
+        # 位移可能把原子推过边界面最多perturbation，与它冲突的相邻tile原子离边界面可达min_distance + perturbation
+        face_distance = np.min(np.minimum(local, tile_box - local), axis=1)
+        boundary.append(offset + np.flatnonzero(face_distance < min_distance + perturbation))
+        shell.append(offset + np.flatnonzero(face_distance < 3 * min_distance + perturbation))
+    replicate_time = time.perf_counter()
+
+    boundary = np.concatenate(boundary)
+    repaired = 0
+    if num_tiles > 1 or perturbation > 0:
+        repaired = _repair_tile_faces(positions, box_size, boundary, np.concatenate(shell), min_distance, rng)
+    end_time = time.perf_counter()
+
+    if report is not None:
+        report.__init__()
+        report.tiles = tuple(int(n) for n in tiles)
+        report.tile_atoms = tile_atoms
+        report.tile_box = tile_box.tolist()
+        report.operations = operations
+        report.shifts = shifts
+        report.shuffle_species = shuffle_species
+        report.perturbation = perturbation
+        report.boundary_atoms = len(boundary)
+        report.repaired_atoms = repaired
+        report.timings = {"tile": tile_time - start_time, "replicate": replicate_time - tile_time,
+                          "repair": end_time - replicate_time, "total": end_time - start_time}
+    atom_types, element_types = _type_sequences(atom_types, elements, positions_file is not None)
+    return positions, box_size, atom_types, element_types
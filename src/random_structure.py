@@ -8,10 +8,20 @@
 """
 
 import numpy as np
-import random
+import gzip
 import os
 import sys
-from typing import Tuple, List, Dict
+import time
+import contextlib
+import json
+import mmap
+import queue
+import re
+import tempfile
+import threading
+import warnings
+from collections.abc import Sequence
+from typing import Callable, Tuple, List, Dict, NamedTuple, Optional, Union
 
 # 常见元素的质量（原子质量单位）
 ELEMENT_MASSES = {
@@ -51,57 +61,1794 @@ def save_lammps_trajectory(filename: str, positions: np.ndarray, box_size: List[
     if not os.path.isabs(filename):
         filename = os.path.join(os.getcwd(), filename)
     
-    # 使用UTF-8编码打开文件，避免编码错误
-    mode = 'a' if os.path.exists(filename) and step > 1 else 'w'  # 第一帧用写入模式，后续帧用追加模式
-    with open(filename, mode, encoding='utf-8') as f:
-        f.write("ITEM: TIMESTEP\n")
-        f.write(f"{step}\n")
-        f.write("ITEM: NUMBER OF ATOMS\n")
-        f.write(f"{step}\n")  # 使用当前实际原子数而不是总目标原子数
-        f.write("ITEM: BOX BOUNDS pp pp pp\n")
-        f.write(f"0.000000 {box_size[0]:.6f}\n")
-        f.write(f"0.000000 {box_size[1]:.6f}\n")
-        f.write(f"0.000000 {box_size[2]:.6f}\n")
-        f.write("ITEM: ATOMS id type x y z\n")
-        for i in range(step):  # 只写入当前实际存在的原子
-            if i < len(atom_types):  # 确保不会越界
-                f.write(f"{i+1} {atom_types[i]} {positions[i, 0]:.6f} {positions[i, 1]:.6f} {positions[i, 2]:.6f}\n")
+    mode = 'ab' if os.path.exists(filename) and step > 1 else 'wb'  # 第一帧用写入模式，后续帧用追加模式
+    with open(filename, mode) as f:
+        # 使用当前实际原子数而不是总目标原子数
+        f.write(_trajectory_header(step, step, box_size).encode('utf-8'))
+        # 只写入当前实际存在的原子，并确保不会越界
+        count = min(step, len(atom_types))
+        _write_atom_lines(f, np.arange(1, count + 1), np.asarray(atom_types[:count]), positions[:count])
 
-def generate_random_structure(
-    num_atoms: int,
-    density: float,
-    min_distance: float = 1.0,
-    element_ratios: Dict[str, float] = None,
-    generate_trajectory: bool = False,  # 添加轨迹生成开关参数
-    use_ml_assisted_placement: bool = False  # 添加ML辅助放置开关
-) -> Tuple[np.ndarray, List[float], List[int], List[str]]:
+def _trajectory_header(timestep: int, num_atoms: int, box_size: List[float]) -> str:
+    """生成lammpstrj一帧的文件头（到 ITEM: ATOMS 行为止）"""
+    if len(box_size) == 6:
+        # 三斜盒子写出包围盒边界和倾斜因子（LAMMPS dump的约定）
+        lx, ly, lz, xy, xz, yz = box_size
+        bounds = (
+            "ITEM: BOX BOUNDS xy xz yz pp pp pp\n"
+            f"{min(0.0, xy, xz, xy + xz):.6f} {lx + max(0.0, xy, xz, xy + xz):.6f} {xy:.6f}\n"
+            f"{min(0.0, yz):.6f} {ly + max(0.0, yz):.6f} {xz:.6f}\n"
+            f"0.000000 {lz:.6f} {yz:.6f}\n"
+        )
+    else:
+        bounds = (
+            "ITEM: BOX BOUNDS pp pp pp\n"
+            f"0.000000 {box_size[0]:.6f}\n"
+            f"0.000000 {box_size[1]:.6f}\n"
+            f"0.000000 {box_size[2]:.6f}\n"
+        )
+    return (
+        "ITEM: TIMESTEP\n"
+        f"{timestep}\n"
+        "ITEM: NUMBER OF ATOMS\n"
+        f"{num_atoms}\n"
+        f"{bounds}"
+        "ITEM: ATOMS id type x y z\n"
+    )
+
+def _round_scaled(values: np.ndarray, decimals: int) -> np.ndarray:
+    """
+    精确计算 round(values * 10^decimals)，舍入方式与 "%.{decimals}f" 相同
+
+    %f 按二进制浮点数的精确十进制值舍入（恰好在中点时取偶数），而浮点乘积 values * 10^k 本身
+    有舍入误差，直接取整在中点附近会差1。这里用Veltkamp拆分得到乘积的精确误差 p + err，
+    再与 floor(p) + 0.5 比较（两者相差不到1，相减没有误差），得到正确舍入的结果。
+
+    参数:
+    values: 非负浮点数数组（乘积小于2^52）
+    decimals: 小数位数（不超过22，10^decimals可以精确表示）
+
+    返回:
+    int64数组
+    """
+    scale = 10.0**decimals
+    product = values * scale
+    # Veltkamp拆分：values和scale各拆成两个26位的部分，部分积都是精确的
+    split = 134217729.0  # 2^27 + 1
+    high = split * values
+    high = high - (high - values)
+    low = values - high
+    scale_high = split * scale
+    scale_high = scale_high - (scale_high - scale)
+    scale_low = scale - scale_high
+    error = ((high * scale_high - product) + high * scale_low + low * scale_high) + low * scale_low
+
+    floor = np.floor(product)
+    # 乘积恰好舍入到整数而精确值略小时，精确值的整数部分要减一
+    floor -= (product == floor) & (error < 0)
+    difference = (product - (floor + 0.5)) + error
+    round_up = (difference > 0) | ((difference == 0) & (floor % 2 == 1))
+    return floor.astype(np.int64) + round_up
+
+def _format_columns(columns: List[np.ndarray], decimals: List[int]) -> bytes:
+    """
+    用NumPy按列批量格式化数值表，输出与 "%d"/"%.{k}f" 逐个格式化相同的文本
+
+    每一列先按最大位数生成右对齐的定宽字符矩阵（逐位取数字），再去掉左侧的填充空格，
+    列之间用一个空格分隔、每行以换行结束，整个过程没有逐行的Python循环。
+    小数按 |x| 的精确值舍入（见_round_scaled），与 % 格式化逐位相同；唯一的区别是舍入后为0的
+    负数（包括-0.0）不写负号。
+
+    参数:
+    columns: 各列数值（一维数组，长度相同）
+    decimals: 各列的小数位数，0表示按整数输出
+
+    返回:
+    ASCII编码的文本
+    """
+    num_rows = len(columns[0])
+    if num_rows == 0:
+        return b""
+    space, minus, dot, zero = ord(' '), ord('-'), ord('.'), ord('0')
+
+    # 字符矩阵按 (列宽, 行数) 存放，使逐位写入都是连续内存，最后再转置
+    fields = []
+    for values, k in zip(columns, decimals):
+        values = np.asarray(values)
+        if k:
+            scaled = _round_scaled(np.abs(values.astype(np.float64)), k)
+            int_part, frac_part = np.divmod(scaled, 10**k)
+        else:
+            scaled = int_part = np.abs(values.astype(np.int64))
+        negative = (values < 0) & (scaled > 0)
+        if scaled.max() < 2**32:
+            # 32位无符号整数的除法明显快于64位
+            scaled, int_part = scaled.astype(np.uint32), int_part.astype(np.uint32)
+            if k:
+                frac_part = frac_part.astype(np.uint32)
+
+        num_digits = len(str(int(int_part.max())))
+        field = np.full((1 + num_digits + (1 + k if k else 0), num_rows), space, dtype=np.uint8)
+        # 整数部分从个位开始逐位写入，高位的前导零保留为空格
+        digit_count = np.ones(num_rows, dtype=np.int64)
+        remaining = int_part
+        for j in range(num_digits):
+            remaining, digit = np.divmod(remaining, 10)
+            if j == 0:
+                field[num_digits] = zero + digit
+            else:
+                present = remaining + digit > 0
+                field[num_digits - j] = np.where(present, zero + digit, space)
+                digit_count += present
+        rows = np.flatnonzero(negative)
+        field[num_digits - digit_count[rows], rows] = minus
+        if k:
+            field[num_digits + 1] = dot
+            remaining = frac_part
+            for j in range(k):
+                remaining, digit = np.divmod(remaining, 10)
+                field[num_digits + 1 + k - j] = zero + digit
+        fields.append(field)
+        fields.append(np.full((1, num_rows), space, dtype=np.uint8))
+    fields[-1] = np.full((1, num_rows), ord('\n'), dtype=np.uint8)
+
+    table = np.ascontiguousarray(np.vstack(fields).T)
+    # 填充空格只会出现在各列的左侧，分隔符所在列全部保留
+    keep = table != space
+    separator_columns = np.cumsum([field.shape[0] for field in fields])[:-1] - 1
+    keep[:, separator_columns[1::2]] = True
+    return table[keep].tobytes()
+
+def _write_atom_lines(f, ids: np.ndarray, atom_types: np.ndarray, positions: np.ndarray,
+                      chunk_size: int = 1 << 15):
+    """
+    批量写入 "id type x y z" 格式的原子行
+
+    参数:
+    f: 以二进制模式打开的文件对象
+    ids: 原子编号
+    atom_types: 原子类型编号
+    positions: 原子坐标 (n x 3)
+    chunk_size: 每块的原子数
+    """
+    for start in range(0, len(ids), chunk_size):
+        stop = min(start + chunk_size, len(ids))
+        f.write(_format_columns(
+            [ids[start:stop], atom_types[start:stop],
+             positions[start:stop, 0], positions[start:stop, 1], positions[start:stop, 2]],
+            [0, 0, 6, 6, 6]
+        ))
+
+def _open_output(filename: str, compression: str = None, buffer_size: int = 1 << 22):
+    """
+    以二进制写模式打开输出文件，可选gzip或zstd压缩
+
+    参数:
+    filename: 输出文件名
+    compression: 压缩格式，None、"gzip"或"zstd"；为None时按扩展名（.gz / .zst）自动判断
+    buffer_size: 未压缩输出的文件缓冲区大小（字节）
+
+    返回:
+    二进制文件对象
+    """
+    if compression is None:
+        if filename.endswith(".gz"):
+            compression = "gzip"
+        elif filename.endswith(".zst"):
+            compression = "zstd"
+    if compression == "gzip":
+        # 数值文本在低压缩级别下的压缩率已接近高级别，速度却快数倍
+        return gzip.open(filename, 'wb', compresslevel=1)
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("写出zstd压缩文件需要安装zstandard包: pip install zstandard")
+        return zstandard.ZstdCompressor(level=3).stream_writer(open(filename, 'wb'))
+    if compression is not None:
+        raise ValueError(f"不支持的压缩格式: {compression}")
+    return open(filename, 'wb', buffering=buffer_size)
+
+class BackgroundWriter:
+    """
+    后台写入线程：写文件的任务放入有界队列，由一个写入线程按提交顺序依次执行
+
+    生成下一个结构的同时写出上一个结构，磁盘写入（以及zlib/zstd压缩中释放GIL的部分）与
+    计算重叠，批量生成的总耗时接近计算和写入中较慢的一方，而不是两者之和。
+    队列满时submit阻塞，直到写入线程取走一个任务（背压），尚未写出的结构最多占用
+    queue_size 份内存。写入线程中的异常在下一次submit或close时在调用线程中重新抛出，
+    出错之后提交的任务不再执行。提交的数组在写出之前不能被修改。
+    """
+
+    def __init__(self, queue_size: int = 2):
+        """
+        参数:
+        queue_size: 队列中最多等待写出的任务数
+        """
+        self.queue_size = max(1, queue_size)
+        self.tasks_done = 0
+        self.blocked_time = 0.0  # 调用线程等待队列空位的总时间（秒），明显大于0说明写入是瓶颈
+        self.write_time = 0.0  # 写入线程执行任务的总时间（秒）
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._error = None
+        self._closed = False
+        # 守护线程不会阻止解释器退出，未调用close时队列中的任务可能丢失
+        self._thread = threading.Thread(target=self._run, name="BackgroundWriter", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            # 出错后仍然取走剩余的任务（不执行），等待队列空位的调用线程不会一直阻塞
+            if self._error is None:
+                func, args, kwargs = task
+                start = time.perf_counter()
+                try:
+                    func(*args, **kwargs)
+                    self.tasks_done += 1
+                except BaseException as error:
+                    self._error = error
+                self.write_time += time.perf_counter() - start
+
+    def _check(self):
+        if self._error is not None:
+            raise self._error
+
+    def submit(self, func: Callable, *args, **kwargs):
+        """
+        提交一个写入任务，队列已满时阻塞等待
+
+        参数:
+        func: 在写入线程中调用的函数
+        args, kwargs: 调用参数
+        """
+        if self._closed:
+            raise RuntimeError("BackgroundWriter已关闭")
+        self._check()
+        start = time.perf_counter()
+        self._queue.put((func, args, kwargs))
+        self.blocked_time += time.perf_counter() - start
+
+    def save_lammps_data(self, filename: str, *args, **kwargs):
+        """在写入线程中调用save_lammps_data，参数相同"""
+        self.submit(save_lammps_data, filename, *args, **kwargs)
+
+    def save_lammps_trajectory(self, filename: str, *args, **kwargs):
+        """在写入线程中调用save_lammps_trajectory，参数相同"""
+        self.submit(save_lammps_trajectory, filename, *args, **kwargs)
+
+    def _shutdown(self):
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+
+    def close(self):
+        """等待队列中的任务全部写出并结束写入线程，写入出错时抛出该异常"""
+        self._shutdown()
+        self._check()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # with块中已经抛出异常时只等待写入线程结束，不用写入错误覆盖原来的异常
+            self._shutdown()
+
+class TrajectoryWriter:
+    """
+    流式LAMMPS轨迹写入器
+
+    文件在整个生成过程中保持打开并使用大缓冲区，按原子数间隔（stride）或时间间隔
+    （interval）抽帧写入，而不是每放置一个原子就重新打开文件并重写全部原子。
+    incremental=True 时每帧只写入上一帧之后新增的原子（原子编号保持不变），
+    compression="gzip"/"zstd" 时写出压缩的文本轨迹（OVITO可以直接读取gzip压缩的轨迹）。
+    background=True 时抽帧只复制这一帧的坐标和类型，格式化和写文件交给BackgroundWriter
+    的写入线程，生成过程不等待磁盘。
+    """
+
+    def __init__(self, filename: str = "generation_trajectory.lammpstrj", stride: int = 1,
+                 interval: float = None, incremental: bool = False, compression: str = None,
+                 buffer_size: int = 1 << 22, background: bool = False, queue_size: int = 4):
+        """
+        参数:
+        filename: 输出文件名
+        stride: 两帧之间至少新增的原子数，默认为1（每个原子写一帧）
+        interval: 两帧之间的最短时间间隔（秒），与stride同时给出时两个条件都需满足，默认为None
+        incremental: 是否每帧只写入新增的原子，默认为False（每帧写入全部已放置原子）
+        compression: 压缩格式，None、"gzip"或"zstd"；为None时按扩展名自动判断
+        buffer_size: 文件缓冲区大小（字节）
+        background: 是否在后台线程中写入，默认为False
+        queue_size: 后台写入时最多等待写出的帧数，队列满时生成过程等待（背压）
+        """
+        # 确保文件保存在当前目录下
+        if not os.path.isabs(filename):
+            filename = os.path.join(os.getcwd(), filename)
+        self.filename = filename
+        self.stride = max(1, stride)
+        self.interval = interval
+        self.incremental = incremental
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.background = background
+        self.queue_size = queue_size
+        self.frames_written = 0
+        self._file = None
+        self._writer = None
+        self._last_written = 0
+        self._last_time = None
+        self._pending = None
+
+    def update(self, positions: np.ndarray, atom_types, box_size: List[float], placed_atoms: int):
+        """
+        通知写入器当前已放置的原子数，满足抽帧条件时写入一帧
+
+        参数:
+        positions: 原子坐标数组（前placed_atoms行有效）
+        atom_types: 原子类型列表（至少包含前placed_atoms个）
+        box_size: 盒子尺寸
+        placed_atoms: 当前已放置原子数
+        """
+        self._pending = (positions, atom_types, box_size, placed_atoms)
+        if placed_atoms - self._last_written < self.stride:
+            return
+        if self.interval is not None and self._last_time is not None \
+                and time.monotonic() - self._last_time < self.interval:
+            return
+        self._write_frame(positions, atom_types, box_size, placed_atoms)
+
+    def _write_frame(self, positions, atom_types, box_size, placed_atoms):
+        first = self._last_written if self.incremental else 0
+        if self.background:
+            if self._writer is None:
+                self._writer = BackgroundWriter(self.queue_size)
+            # 生成过程会继续修改坐标数组，放入队列的是这一帧的副本
+            self._writer.submit(self._write_atoms, first, placed_atoms, list(box_size),
+                                np.array(atom_types[first:placed_atoms]), positions[first:placed_atoms].copy())
+        else:
+            self._write_atoms(first, placed_atoms, box_size, atom_types[first:placed_atoms],
+                              positions[first:placed_atoms])
+        self._last_written = placed_atoms
+        self._last_time = time.monotonic()
+        self.frames_written += 1
+
+    def _write_atoms(self, first, placed_atoms, box_size, atom_types, positions):
+        if self._file is None:
+            self._file = _open_output(self.filename, self.compression, self.buffer_size)
+        f = self._file
+        f.write(_trajectory_header(placed_atoms, placed_atoms - first, box_size).encode('utf-8'))
+        _write_atom_lines(f, np.arange(first + 1, placed_atoms + 1), np.asarray(atom_types), positions)
+
+    def close(self):
+        """写入尚未写出的最后一帧，等待后台写入完成后关闭文件；后台写入出错时抛出该异常"""
+        try:
+            if self._pending is not None and self._pending[3] > self._last_written:
+                self._write_frame(*self._pending)
+            self._pending = None
+            if self._writer is not None:
+                self._writer.close()
+        finally:
+            # 先结束写入线程再关闭文件
+            if self._writer is not None:
+                self._writer._shutdown()
+                self._writer = None
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class GenerationStats:
+    """
+    一次结构生成过程的统计信息
+
+    传给 generate_random_structure(stats=...) 后由放置函数填充；不传时放置循环中不做
+    任何统计，没有额外开销。as_dict() 返回可以直接写成JSON的字典，便于在调度系统中
+    批量收集。
+
+    属性:
+    num_atoms: 目标原子数
+    placement_strategy: 放置策略
+    placed_atoms: 已放置的原子数
+    attempts: 候选点总数（relax模式为松弛轮数）
+    batches: 批数（逐个放置时为尝试次数）
+    rejections_by_occupancy: 被拒绝的候选点按其所在网格当时已有原子数的统计，下标为占据数
+    history: 采样记录 [(秒, attempts, placed_atoms), ...]，用于计算接受率随时间的变化
+    ml_assisted_triggered: ML辅助放置是否被触发
+    ml_triggered_at: 触发时的 (attempts, placed_atoms)
+    stalled_at: 自适应尝试预算判定放置停滞时的 (attempts, placed_atoms)，未停滞时为None
+    switched_strategy: 停滞后切换到的放置策略，未切换时为None
+    timings: 各阶段耗时（秒），如 setup / placement / total
+    """
+
+    def __init__(self, profile_callback: Callable[[str, dict], None] = None):
+        """
+        参数:
+        profile_callback: 可选的剖析回调 profile_callback(event, data)，在阶段结束（"phase"）、
+                          每批结束（"batch"）和ML辅助触发（"ml_assisted"）时调用
+        """
+        self.profile_callback = profile_callback
+        self.num_atoms = 0
+        self.placement_strategy = None
+        self.placed_atoms = 0
+        self.attempts = 0
+        self.batches = 0
+        self.rejections_by_occupancy = np.zeros(0, dtype=np.int64)
+        self.history = []
+        self.ml_assisted_triggered = False
+        self.ml_triggered_at = None
+        self.stalled_at = None
+        self.switched_strategy = None
+        self.timings = {}
+        self._start = time.perf_counter()
+        self._last_batch = self._start
+        self._sample_step = 1
+        self._next_sample = 0
+        self._sample_attempts = 0
+
+    def begin(self, num_atoms: int, placement_strategy: str):
+        """开始一次生成，重置计数"""
+        self.__init__(self.profile_callback)
+        self.num_atoms = num_atoms
+        self.placement_strategy = placement_strategy
+        # 约每0.5%进度（或同样多的连续失败尝试）采样一次，记录条数与规模无关
+        self._sample_step = max(1, num_atoms // 200)
+
+    @property
+    def rejections(self) -> int:
+        """被拒绝的候选点总数"""
+        return self.attempts - self.placed_atoms
+
+    @property
+    def acceptance_rate(self) -> float:
+        """整体接受率"""
+        return self.placed_atoms / self.attempts if self.attempts else 0.0
+
+    def acceptance_over_time(self) -> np.ndarray:
+        """
+        接受率随时间的变化
+
+        返回:
+        数组 (K x 3)，每行为 (秒, 累计尝试次数, 相邻两次采样之间的接受率)
+        """
+        if len(self.history) < 2:
+            return np.zeros((0, 3))
+        samples = np.asarray(self.history, dtype=float)
+        rate = np.diff(samples[:, 2]) / np.maximum(np.diff(samples[:, 1]), 1)
+        return np.column_stack([samples[1:, 0], samples[1:, 1], rate])
+
+    def record_batch(self, attempts: int, accepted: int):
+        """
+        记录一批候选点的结果
+
+        参数:
+        attempts: 本批候选点数
+        accepted: 本批接受的原子数
+        """
+        self.attempts += attempts
+        self.placed_atoms += accepted
+        self.batches += 1
+        if self.placed_atoms >= self._next_sample or self.attempts - self._sample_attempts >= 10 * self._sample_step:
+            self.history.append((time.perf_counter() - self._start, self.attempts, self.placed_atoms))
+            self._next_sample = self.placed_atoms + self._sample_step
+            self._sample_attempts = self.attempts
+        if self.profile_callback is not None:
+            now = time.perf_counter()
+            self.profile_callback("batch", dict(attempts=attempts, accepted=accepted,
+                                                placed_atoms=self.placed_atoms, seconds=now - self._last_batch))
+            self._last_batch = now
+
+    def record_rejections(self, occupancy):
+        """
+        按所在网格的占据数统计被拒绝的候选点
+
+        参数:
+        occupancy: 被拒绝候选点所在网格的原子数（整数或整数数组）
+        """
+        counts = np.bincount(np.atleast_1d(occupancy))
+        if len(counts) > len(self.rejections_by_occupancy):
+            counts[:len(self.rejections_by_occupancy)] += self.rejections_by_occupancy
+            self.rejections_by_occupancy = counts
+        else:
+            self.rejections_by_occupancy[:len(counts)] += counts
+
+    def record_ml_trigger(self):
+        """记录ML辅助放置被触发的时刻"""
+        self.ml_assisted_triggered = True
+        self.ml_triggered_at = (self.attempts, self.placed_atoms)
+        if self.profile_callback is not None:
+            self.profile_callback("ml_assisted", dict(attempts=self.attempts, placed_atoms=self.placed_atoms))
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """
+        统计一个阶段的耗时（同名阶段累加）
+
+        参数:
+        name: 阶段名称
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+            if self.profile_callback is not None:
+                self.profile_callback("phase", dict(name=name, seconds=seconds))
+
+    def as_dict(self) -> dict:
+        """返回可直接序列化为JSON的字典"""
+        return dict(
+            num_atoms=self.num_atoms,
+            placement_strategy=self.placement_strategy,
+            placed_atoms=self.placed_atoms,
+            attempts=self.attempts,
+            rejections=self.rejections,
+            acceptance_rate=self.acceptance_rate,
+            batches=self.batches,
+            rejections_by_occupancy=self.rejections_by_occupancy.tolist(),
+            ml_assisted_triggered=self.ml_assisted_triggered,
+            ml_triggered_at=self.ml_triggered_at,
+            stalled_at=self.stalled_at,
+            switched_strategy=self.switched_strategy,
+            timings=dict(self.timings),
+            history=[list(sample) for sample in self.history],
+        )
+
+def _report_progress(previous_placed: int, placed_atoms: int, num_atoms: int):
+    """
+    在已放置原子数跨过每1%时刷新命令行进度显示
+
+    参数:
+    previous_placed: 本次更新前的已放置原子数
+    placed_atoms: 当前已放置原子数
+    num_atoms: 原子总数（目标原子数）
+    """
+    step = max(1, num_atoms // 100)
+    if placed_atoms // step > previous_placed // step or placed_atoms == num_atoms:
+        progress = placed_atoms / num_atoms * 100
+        sys.stdout.write(f'\r结构生成进度: {progress:.1f}% ({placed_atoms}/{num_atoms} 原子)')
+        sys.stdout.flush()
+
+def _is_triclinic(box_size) -> bool:
+    """判断盒子是否为三斜盒子（给出了非零的倾斜因子 xy, xz, yz）"""
+    return len(box_size) == 6 and any(tilt != 0 for tilt in box_size[3:])
+
+def _box_matrix(box_size) -> np.ndarray:
+    """
+    返回盒子矩阵，三行分别为LAMMPS约定的晶格矢量 a=(lx,0,0), b=(xy,ly,0), c=(xz,yz,lz)
+
+    参数:
+    box_size: 盒子尺寸 [lx, ly, lz] 或 [lx, ly, lz, xy, xz, yz]
+
+    返回:
+    3 x 3 矩阵
+    """
+    lx, ly, lz = box_size[:3]
+    xy, xz, yz = box_size[3:6] if len(box_size) == 6 else (0.0, 0.0, 0.0)
+    return np.array([[lx, 0.0, 0.0], [xy, ly, 0.0], [xz, yz, lz]], dtype=float)
+
+def _perpendicular_widths(box_size) -> np.ndarray:
+    """
+    盒子在三个方向上相对两个面之间的距离（正交盒子即为边长）
+
+    参数:
+    box_size: 盒子尺寸 [lx, ly, lz] 或 [lx, ly, lz, xy, xz, yz]
+
+    返回:
+    [wx, wy, wz]
+    """
+    if not _is_triclinic(box_size):
+        return np.asarray(box_size[:3], dtype=float)
+    a, b, c = _box_matrix(box_size)
+    volume = a[0] * b[1] * c[2]
+    return volume / np.linalg.norm([np.cross(b, c), np.cross(c, a), np.cross(a, b)], axis=1)
+
+def _fractional(points: np.ndarray, box_size) -> np.ndarray:
+    """
+    笛卡尔坐标转换为分数坐标（盒子矩阵为下三角形式，可以逐个分量回代求解）
+
+    参数:
+    points: 坐标或位移 (..., 3)
+    box_size: 盒子尺寸 [lx, ly, lz] 或 [lx, ly, lz, xy, xz, yz]
+
+    返回:
+    分数坐标 (..., 3)
+    """
+    if not _is_triclinic(box_size):
+        return points / np.asarray(box_size[:3], dtype=float)
+    lx, ly, lz, xy, xz, yz = box_size
+    fz = points[..., 2] / lz
+    fy = (points[..., 1] - fz * yz) / ly
+    fx = (points[..., 0] - fy * xy - fz * xz) / lx
+    return np.stack([fx, fy, fz], axis=-1)
+
+def _cartesian(fractions: np.ndarray, box_size) -> np.ndarray:
+    """
+    分数坐标转换为笛卡尔坐标
+
+    参数:
+    fractions: 分数坐标 (..., 3)
+    box_size: 盒子尺寸 [lx, ly, lz] 或 [lx, ly, lz, xy, xz, yz]
+
+    返回:
+    笛卡尔坐标 (..., 3)
+    """
+    if not _is_triclinic(box_size):
+        return fractions * np.asarray(box_size[:3], dtype=float)
+    return fractions @ _box_matrix(box_size)
+
+def _minimum_image(delta: np.ndarray, box_size, periodic=None) -> np.ndarray:
+    """
+    对位移向量（可以是任意形状的 (..., 3) 数组）应用最小镜像约定
+
+    三斜盒子在分数坐标中取整，截断距离不超过盒子最小垂直宽度的一半时结果是准确的
+    （与LAMMPS对三斜盒子的要求相同）
+
+    参数:
+    delta: 位移向量
+    box_size: 盒子尺寸 [lx, ly, lz] 或 [lx, ly, lz, xy, xz, yz]
+    periodic: 各方向是否周期性 [px, py, pz]，默认为None（三个方向都是周期性的）
+
+    返回:
+    映射到最近镜像后的位移向量
+    """
+    if _is_triclinic(box_size):
+        shift = np.round(_fractional(delta, box_size))
+        if periodic is not None:
+            shift = shift * np.asarray(periodic, dtype=bool)
+        return delta - _cartesian(shift, box_size)
+    box = np.asarray(box_size[:3], dtype=float)
+    if periodic is None:
+        return delta - box * np.round(delta / box)
+    # 非周期方向不做回绕
+    return delta - np.where(periodic, box, 0.0) * np.round(delta / box)
+
+def periodic_distances(points_a: np.ndarray, points_b: np.ndarray, box_size,
+                       pairwise: bool = False) -> np.ndarray:
+    """
+    批量计算考虑周期性边界条件的最小镜像距离
+
+    pairwise=False 时两组坐标按NumPy广播规则逐个配对，既可以是一对多
+    （(3,) 与 (M, 3)），也可以是逐对（(K, 3) 与 (K, 3)）；pairwise=True 时计算
+    (K, 3) 与 (M, 3) 之间的全部距离矩阵。距离矩阵按分量逐个累加，临时内存为 K*M 而不是 3*K*M。
+
+    参数:
+    points_a: 第一组坐标 (..., 3)
+    points_b: 第二组坐标 (..., 3)
+    box_size: 盒子尺寸 [lx, ly, lz]（正交）或 [lx, ly, lz, xy, xz, yz]（三斜）
+    pairwise: 是否计算全部两两距离，默认为False
+
+    返回:
+    距离数组，pairwise为True时形状为 (K, M)
+    """
+    frac_a = _fractional(np.asarray(points_a, dtype=float), box_size)
+    frac_b = _fractional(np.asarray(points_b, dtype=float), box_size)
+    if pairwise:
+        frac_a = frac_a[:, None, :]
+        frac_b = frac_b[None, :, :]
+    # 分数坐标差取整得到最近镜像，再按盒子矩阵的下三角结构换回笛卡尔分量
+    s = [frac_b[..., i] - frac_a[..., i] for i in range(3)]
+    s = [component - np.round(component) for component in s]
+    lx, ly, lz = box_size[:3]
+    if _is_triclinic(box_size):
+        xy, xz, yz = box_size[3:6]
+        dx = s[0] * lx + s[1] * xy + s[2] * xz
+        dy = s[1] * ly + s[2] * yz
+    else:
+        dx = s[0] * lx
+        dy = s[1] * ly
+    dz = s[2] * lz
+    return np.sqrt(dx * dx + dy * dy + dz * dz)
+
+def _stencil_offsets(n_cells: np.ndarray, search_range) -> np.ndarray:
+    """
+    预先计算邻居网格的偏移模板
+
+    某一方向的网格数不足 2*search_range+1 时，该方向直接取全部网格，
+    避免周期性回绕后同一个网格被重复计入
+
+    参数:
+    n_cells: 各方向的网格数 [nx, ny, nz]
+    search_range: 搜索半径（网格数），可以是整数或各方向分别指定的 [rx, ry, rz]
+
+    返回:
+    偏移量数组 (M x 3)
+    """
+    search_range = np.broadcast_to(search_range, (3,))
+    axes = []
+    for n, r in zip(n_cells, search_range):
+        if 2 * r + 1 <= n:
+            axes.append(np.arange(-r, r + 1))
+        else:
+            axes.append(np.arange(n))
+    return np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3)
+
+class DensityBuckets:
+    """
+    按占据数分桶的网格集合（桶队列）
+
+    order 数组按占据数从小到大存放全部网格编号，bucket_start[c] 记录占据数为c的网格在
+    order 中的起始位置，position 记录每个网格在 order 中的位置。网格占据数加一时，
+    只需把它与所在桶的最后一个网格交换，再把下一个桶的起点前移一位，因此更新和
+    "随机选择一个占据数最少的网格"都是O(1)操作，与网格总数无关。
+    """
+
+    def __init__(self, total_cells: int):
+        """
+        参数:
+        total_cells: 网格总数
+        """
+        self.total_cells = total_cells
+        self.counts = np.zeros(total_cells, dtype=np.int32)
+        # 网格数小于2^31时用32位编号，超大盒子中桶队列的内存减半
+        index_dtype = np.int32 if total_cells < np.iinfo(np.int32).max else np.int64
+        self.order = np.arange(total_cells, dtype=index_dtype)
+        self.position = np.arange(total_cells, dtype=index_dtype)
+        self.bucket_start = [0, total_cells]
+        self.min_count = 0
+
+    def increment(self, cell: int):
+        """
+        将一个网格的占据数加一
+
+        参数:
+        cell: 网格编号
+        """
+        count = int(self.counts[cell])
+        starts = self.bucket_start
+        if count + 2 == len(starts):
+            starts.append(self.total_cells)
+
+        # 与当前桶的最后一个网格交换位置，然后让下一个桶向前扩展一位
+        last = starts[count + 1] - 1
+        other = self.order[last]
+        current = self.position[cell]
+        self.order[current] = other
+        self.position[other] = current
+        self.order[last] = cell
+        self.position[cell] = last
+        starts[count + 1] = last
+        self.counts[cell] = count + 1
+
+        while starts[self.min_count] == starts[self.min_count + 1]:
+            self.min_count += 1
+
+    def increment_many(self, cells: np.ndarray):
+        """
+        将一组网格的占据数各加上它在cells中出现的次数
+
+        按出现次数分轮，每轮中要加一的网格互不相同：同一个桶中要移出的m个网格放到桶的最后m个
+        位置（与占据这些位置的其他网格交换），再把下一个桶的起点前移m位。每轮都是数组运算，
+        轮数等于同一网格出现的最多次数。
+
+        参数:
+        cells: 网格编号数组（可以重复）
+        """
+        cells, repeats = np.unique(np.asarray(cells, dtype=np.int64), return_counts=True)
+        for round_index in range(int(repeats.max()) if len(repeats) else 0):
+            moving = cells[repeats > round_index]
+            counts = self.counts[moving].astype(np.int64)
+            order = np.argsort(counts, kind='stable')
+            moving, counts = moving[order], counts[order]
+            values, group_sizes = np.unique(counts, return_counts=True)
+            starts = self.bucket_start
+            if int(values[-1]) + 2 == len(starts):
+                starts.append(self.total_cells)
+            ends = np.array([starts[count + 1] for count in values.tolist()], dtype=np.int64)
+
+            # 每个桶最后 group_size 个位置，按桶的顺序与moving对应
+            group_offsets = np.repeat(np.cumsum(group_sizes) - group_sizes, group_sizes)
+            tail = np.repeat(ends - group_sizes, group_sizes) + np.arange(len(moving)) - group_offsets
+            tail_cells = self.order[tail].astype(np.int64)
+            sorted_moving = np.sort(moving)
+            # 已经在尾部的要移出的网格不动，其余的与尾部中不需要移出的网格一一交换（两者都按桶排列）
+            displaced = ~np.isin(tail_cells, sorted_moving, assume_unique=True)
+            outside = self.position[moving] < np.repeat(ends - group_sizes, group_sizes)
+            slots, swapped = tail[displaced], tail_cells[displaced]
+            outsiders = moving[outside]
+            outsider_slots = self.position[outsiders].astype(np.int64)
+            self.order[outsider_slots] = swapped
+            self.position[swapped] = outsider_slots
+            self.order[slots] = outsiders
+            self.position[outsiders] = slots
+
+            for count, size in zip(values.tolist(), group_sizes.tolist()):
+                starts[count + 1] -= size
+            self.counts[moving] += 1
+
+        starts = self.bucket_start
+        while starts[self.min_count] == starts[self.min_count + 1]:
+            self.min_count += 1
+
+    def random_min_cells(self, rng: np.random.Generator, size: int = None):
+        """
+        从占据数最少的网格中随机选择
+
+        参数:
+        rng: NumPy随机数生成器
+        size: 选择的个数，默认为None（返回单个网格编号）
+
+        返回:
+        网格编号（size为None时为整数，否则为数组）
+        """
+        start = self.bucket_start[self.min_count]
+        bucket_size = self.bucket_start[self.min_count + 1] - start
+        return self.order[start + rng.integers(bucket_size, size=size)]
+
+class CellList:
+    """
+    基于数组的周期性链表网格（linked-cell list）
+
+    每个网格只保存链表头 head[cell]，每个原子保存同一网格中下一个原子的编号 next[atom]，
+    -1 表示链表结束。原子坐标保存在外部的 positions 数组中，这里只记录编号，因此内存
+    随原子数增长，不会为每个网格分配列表。邻居偏移模板在构造时计算一次，查询时
+    对整批查询点同时沿链表推进，不需要逐个原子的Python循环。
+
+    某个方向设为非周期时，该方向越过盒子边界的邻居网格被指向一个始终为空的哨兵网格
+    （编号 total_cells），距离计算也不做回绕，用于只填充大盒子中一个子区域的情形。
+
+    三斜盒子的网格在分数坐标中划分，网格是平行六面体，cell_width 为其垂直厚度。
+    cutoff 也可以是按原子类型编号索引的截断距离矩阵（见 _cutoff_matrix），此时网格按
+    最大截断距离划分，并为每个原子记录类型编号 types，距离检查使用对应元素对的截断距离。
+
+    内存：每个原子 4 字节（next，按元素对给出截断距离时另有 2 字节的 types），每个网格 8 字节
+    （head、counts），track_density=True 时每个网格再加 8 字节（DensityBuckets 的 order、position）。
+    网格宽度等于截断距离时网格数约为 盒子体积 / cutoff^3，数密度（以cutoff为单位）为0.4时
+    每个原子约对应2.5个网格，索引合计约 45 字节/原子，比坐标本身（24 字节/原子）还多。
+    """
+
+    def __init__(self, positions: np.ndarray, box_size: List[float], cutoff,
+                 cell_size: float = None, track_density: bool = False, periodic=(True, True, True)):
+        """
+        参数:
+        positions: 原子坐标数组 (capacity x 3)，插入原子前需先写入对应行
+        box_size: 盒子尺寸 [lx, ly, lz] 或 [lx, ly, lz, xy, xz, yz]
+        cutoff: 邻居搜索截断距离（通常为最小距离），或按类型编号索引的截断距离矩阵
+        cell_size: 期望的网格宽度，默认为最大截断距离；实际宽度为盒子垂直宽度的整数分之一且不小于该值
+        track_density: 是否用桶队列维护网格占据数，以便O(1)选择低密度网格，默认为False
+        periodic: 各方向是否周期性 [px, py, pz]，默认三个方向都是周期性的
+        """
+        self.positions = positions
+        self.box = np.asarray(box_size, dtype=float)
+        self.triclinic = _is_triclinic(box_size)
+        if np.ndim(cutoff) == 2:
+            self.cutoff_matrix = np.asarray(cutoff, dtype=float)
+            self.cutoff = float(self.cutoff_matrix.max())
+            self.types = np.zeros(len(positions), dtype=np.int16)
+        else:
+            self.cutoff_matrix = None
+            self.cutoff = float(cutoff)
+            self.types = None
+        self.periodic = np.broadcast_to(np.asarray(periodic, dtype=bool), (3,)).copy()
+        if cell_size is None:
+            cell_size = self.cutoff
+        widths = _perpendicular_widths(self.box)
+        self.n_cells = np.maximum(1, np.floor(widths / cell_size).astype(np.int64))
+        self.cell_width = widths / self.n_cells
+        self.total_cells = int(np.prod(self.n_cells))
+
+        # 搜索半径按各方向网格宽度确定，并剔除与中心网格最近距离已超过cutoff的偏移
+        search_range = np.ceil(self.cutoff / self.cell_width - 1e-9).astype(np.int64)
+        # 非周期方向不会回绕，总是使用完整的 -r..r 偏移
+        stencil_cells = np.where(self.periodic, self.n_cells, 2 * search_range + 1)
+        stencil = _stencil_offsets(stencil_cells, search_range)
+        gap = np.maximum(np.abs(stencil) - 1, 0) * self.cell_width
+        wrap_all = 2 * search_range + 1 > stencil_cells
+        gap[:, wrap_all] = 0.0
+        # 三斜网格的各方向不正交，只能用各方向间隙的最大值作为距离下界
+        if self.triclinic:
+            self.stencil = stencil[np.max(gap, axis=1) < self.cutoff]
+        else:
+            self.stencil = stencil[np.sum(gap**2, axis=1) < self.cutoff**2]
+
+        index_dtype = np.int32 if len(positions) < np.iinfo(np.int32).max else np.int64
+        # 最后一个元素是非周期方向越界时使用的空哨兵网格
+        self.head = np.full(self.total_cells + 1, -1, dtype=index_dtype)
+        self.next = np.full(len(positions), -1, dtype=index_dtype)
+        self.density = DensityBuckets(self.total_cells) if track_density else None
+        self.counts = self.density.counts if track_density else np.zeros(self.total_cells, dtype=np.int32)
+
+    def cell_coords(self, points: np.ndarray) -> np.ndarray:
+        """
+        计算点所在网格的整数坐标
+
+        参数:
+        points: 点坐标 (K x 3)
+
+        返回:
+        网格坐标 (K x 3)
+        """
+        if self.triclinic:
+            coords = np.floor(_fractional(points, self.box) * self.n_cells).astype(np.int64)
+        else:
+            coords = np.floor(points / self.cell_width).astype(np.int64)
+        # 非周期方向上恰好落在盒子边界上的点归入边界网格
+        return np.where(self.periodic, coords % self.n_cells, np.clip(coords, 0, self.n_cells - 1))
+
+    def cell_index(self, points: np.ndarray) -> np.ndarray:
+        """
+        计算点所在网格的一维编号
+
+        参数:
+        points: 点坐标 (K x 3)
+
+        返回:
+        网格编号 (K,)
+        """
+        return np.ravel_multi_index(tuple(self.cell_coords(points).T), self.n_cells)
+
+    def cell_points(self, coords: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+        """
+        由网格坐标和网格内的相对位置得到点的笛卡尔坐标
+
+        参数:
+        coords: 网格坐标 (K x 3)
+        offsets: 网格内的相对位置，各分量在 [0, 1) 之间 (K x 3)
+
+        返回:
+        点坐标 (K x 3)
+        """
+        if self.triclinic:
+            return _cartesian((coords + offsets) / self.n_cells, self.box)
+        return (coords + offsets) * self.cell_width
+
+    def insert(self, indices):
+        """
+        将 positions 中指定编号的原子插入网格
+
+        参数:
+        indices: 原子编号（整数或整数数组）
+        """
+        indices = np.atleast_1d(np.asarray(indices, dtype=np.int64))
+        if len(indices) == 0:
+            return
+        cells = self.cell_index(self.positions[indices])
+        order = np.argsort(cells, kind='stable')
+        cells, indices = cells[order], indices[order]
+
+        # 同一网格中的新原子先串成一段链表，段尾再接到原来的链表头上
+        last_in_group = np.append(cells[1:] != cells[:-1], True)
+        first_in_group = np.insert(last_in_group[:-1], 0, True)
+        self.next[indices[:-1]] = indices[1:]
+        self.next[indices[last_in_group]] = self.head[cells[last_in_group]]
+        self.head[cells[first_in_group]] = indices[first_in_group]
+
+        if self.density is not None:
+            if len(cells) == 1:
+                self.density.increment(cells[0])
+            else:
+                self.density.increment_many(cells)
+        else:
+            group_starts = np.flatnonzero(first_in_group)
+            self.counts[cells[group_starts]] += np.diff(np.append(group_starts, len(cells))).astype(np.int32)
+
+    def clear(self):
+        """清空网格中的全部原子（原子移动后整体重建网格时使用）"""
+        self.head.fill(-1)
+        self.next.fill(-1)
+        if self.density is not None:
+            self.density = DensityBuckets(self.total_cells)
+            self.counts = self.density.counts
+        else:
+            self.counts.fill(0)
+
+    def neighbor_cells(self, coords: np.ndarray) -> np.ndarray:
+        """
+        按偏移模板计算相邻网格编号
+
+        参数:
+        coords: 网格坐标 (K x 3)
+
+        返回:
+        相邻网格编号 (K x M)
+        """
+        nx, ny, nz = self.n_cells
+        ix = coords[:, 0:1] + self.stencil[:, 0]
+        iy = coords[:, 1:2] + self.stencil[:, 1]
+        iz = coords[:, 2:3] + self.stencil[:, 2]
+        if self.periodic.all():
+            return (ix % nx * ny + iy % ny) * nz + iz % nz
+        outside = np.zeros(ix.shape, dtype=bool)
+        for axis, index in enumerate((ix, iy, iz)):
+            if not self.periodic[axis]:
+                outside |= (index < 0) | (index >= self.n_cells[axis])
+        cells = (ix % nx * ny + iy % ny) * nz + iz % nz
+        cells[outside] = self.total_cells
+        return cells
+
+    def query_pairs(self, points: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        找出每个查询点相邻网格中的全部原子
+
+        参数:
+        points: 查询点坐标 (K x 3)
+
+        返回:
+        query: 查询点编号
+        atoms: 对应的原子编号（与query一一对应）
+        """
+        points = np.atleast_2d(points)
+        cells = self.neighbor_cells(self.cell_coords(points))
+        query = np.repeat(np.arange(len(points)), cells.shape[1])
+        current = self.head[cells.ravel()]
+
+        query_parts, atom_parts = [], []
+        # 所有查询点同时沿各自的链表前进一步，循环次数等于单个网格中的最大原子数
+        while True:
+            present = current >= 0
+            query, current = query[present], current[present]
+            if len(current) == 0:
+                break
+            query_parts.append(query)
+            atom_parts.append(current)
+            current = self.next[current]
+
+        if not query_parts:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+        return np.concatenate(query_parts), np.concatenate(atom_parts).astype(np.int64)
+
+    def has_conflict(self, points: np.ndarray, cutoff: float = None, types: np.ndarray = None) -> np.ndarray:
+        """
+        检查查询点与已插入原子之间是否存在小于cutoff的最小镜像距离
+
+        参数:
+        points: 查询点坐标 (K x 3)
+        cutoff: 距离阈值，默认为构造时的cutoff（不能大于它）
+        types: 查询点的类型编号 (K,)；给出且网格使用截断距离矩阵时按元素对的截断距离检查
+
+        返回:
+        布尔数组 (K,)，True表示该点与某个原子距离过近
+        """
+        points = np.atleast_2d(points)
+        if cutoff is None:
+            cutoff = self.cutoff
+        query, atoms = self.query_pairs(points)
+        delta = _minimum_image(self.positions[atoms] - points[query], self.box, self.periodic)
+        if types is not None and self.cutoff_matrix is not None:
+            limit = self.cutoff_matrix[np.asarray(types)[query], self.types[atoms]]**2
+        else:
+            limit = cutoff**2
+        close = np.einsum('ij,ij->i', delta, delta) < limit
+        conflict = np.zeros(len(points), dtype=bool)
+        conflict[query[close]] = True
+        return conflict
+
+# 三维硬球的随机序列吸附饱和堆积分数和随机密堆积分数（堆积分数 = 数密度 * pi/6 * 最小距离^3）
+RSA_SATURATION = 0.3841
+RANDOM_CLOSE_PACKING = 0.64
+
+class FeasibilityEstimate(NamedTuple):
+    """生成参数的可行性估计"""
+    packing_fraction: float  # 以最小距离为直径的硬球堆积分数
+    limit: float  # 所选放置策略能达到的堆积分数上限
+    feasible: bool  # 堆积分数是否在上限以内
+    recommended_strategy: Optional[str]  # 建议的放置策略，任何策略都无法达到时为None
+    message: str  # 说明
+
+def packing_fraction(density: float, min_distance: Union[float, Dict[Tuple[str, str], float]] = 1.0,
+                     element_ratios: Dict[str, float] = None) -> float:
+    """
+    计算以最小距离为直径的硬球堆积分数
+
+    按元素对给出最小距离时，每种元素取同种元素对的距离为直径，按元素比例加权（非加和的
+    异种元素对距离不计入，只是近似）。
+
+    参数:
+    density: 数密度
+    min_distance: 最小距离，或按元素对给出的最小距离
+    element_ratios: 元素比例（按元素对给出最小距离时使用），默认为None（全部为Ti）
+
+    返回:
+    堆积分数
+    """
+    if np.isscalar(min_distance):
+        return float(density * np.pi / 6 * min_distance**3)
+    if element_ratios is None:
+        element_ratios = {"Ti": 1.0}
+    elements = list(element_ratios)
+    diameters = np.diag(_cutoff_matrix(min_distance, elements))[1:]
+    fractions = np.array(list(element_ratios.values()), dtype=float)
+    fractions /= fractions.sum()
+    return float(density * np.pi / 6 * np.sum(fractions * diameters**3))
+
+def estimate_feasibility(density: float, min_distance: Union[float, Dict[Tuple[str, str], float]] = 1.0,
+                         element_ratios: Dict[str, float] = None, placement_strategy: str = "rsa",
+                         num_atoms: int = None) -> FeasibilityEstimate:
+    """
+    由堆积分数估计生成参数是否可行
+
+    随机序列吸附（"rsa"）和空隙跟踪（"void"）每个原子一旦放下就不再移动，三维硬球最多只能达到
+    饱和堆积分数约0.384（"rsa"在接近饱和时需要的尝试次数急剧增加，实际在0.33以上就建议改用"void"）；
+    先放置再松弛（"relax"）会移动原子，上限为随机密堆积约0.64。有限大小的周期性体系存在涨落，
+    给出num_atoms时上限放宽 1/sqrt(num_atoms) 的比例。
+
+    参数:
+    density: 数密度
+    min_distance: 最小距离，或按元素对给出的最小距离
+    element_ratios: 元素比例
+    placement_strategy: 放置策略
+    num_atoms: 原子数，默认为None（不考虑有限大小涨落）
+
+    返回:
+    FeasibilityEstimate
+    """
+    phi = packing_fraction(density, min_distance, element_ratios)
+    limit = RANDOM_CLOSE_PACKING if placement_strategy == "relax" else RSA_SATURATION
+    tolerance = 1.0 + (1.0 / np.sqrt(num_atoms) if num_atoms else 0.0)
+    feasible = phi <= limit * tolerance
+    if phi <= 0.33:
+        recommended = "rsa"
+    elif phi <= RSA_SATURATION * tolerance:
+        recommended = "void"
+    elif phi <= RANDOM_CLOSE_PACKING * tolerance:
+        recommended = "relax"
+    else:
+        recommended = None
+    if not feasible:
+        message = f"堆积分数 {phi:.3f} 超过{placement_strategy}模式的上限 {limit:.3f}"
+        if recommended is not None:
+            message += f"，可改用 placement_strategy=\"{recommended}\""
+        else:
+            message += "（超过随机密堆积，任何放置策略都无法满足），请降低密度或最小距离"
+    else:
+        message = f"堆积分数 {phi:.3f}，{placement_strategy}模式的上限为 {limit:.3f}"
+    return FeasibilityEstimate(phi, limit, bool(feasible), recommended, message)
+
+class AttemptBudget:
+    """
+    自适应尝试次数预算
+
+    每隔window次尝试统计一次这段时间的接受率。随机序列吸附中接受率随已放置原子数单调下降，
+    以当前接受率用完剩余的尝试次数是能放下的原子数的上限；这个上限仍小于剩余原子数时，
+    放置注定会在 max_attempts 处失败，于是判定为停滞并提前结束，不必耗尽全部尝试次数。
+    """
+
+    def __init__(self, num_atoms: int, max_attempts: int, window: int = None):
+        """
+        参数:
+        num_atoms: 目标原子数
+        max_attempts: 最大尝试次数
+        window: 统计接受率的尝试次数窗口，默认为 max(10 * num_atoms, 10000)
+        """
+        self.num_atoms = num_atoms
+        self.max_attempts = max_attempts
+        self.window = window or max(10 * num_atoms, 10000)
+        self.stalled = False
+        self._window_start = None
+
+    def check(self, attempts: int, placed_atoms: int) -> bool:
+        """
+        放置循环每一轮开始前调用
+
+        参数:
+        attempts: 已尝试次数
+        placed_atoms: 已放置的原子数
+
+        返回:
+        是否继续尝试（判定为停滞时返回False）
+        """
+        if self._window_start is None:
+            self._window_start = (attempts, placed_atoms)
+            return True
+        start_attempts, start_placed = self._window_start
+        if attempts - start_attempts < self.window:
+            return True
+        rate = (placed_atoms - start_placed) / (attempts - start_attempts)
+        self._window_start = (attempts, placed_atoms)
+        if rate * (self.max_attempts - attempts) < self.num_atoms - placed_atoms:
+            self.stalled = True
+            return False
+        return True
+
+def _place_sequential(positions: np.ndarray, cell_list: CellList, rng: np.random.Generator,
+                      use_ml_assisted_placement: bool = False, max_attempts: int = None,
+                      on_batch=None, start: int = 0, type_counts: np.ndarray = None,
+                      stats: GenerationStats = None, budget: AttemptBudget = None) -> Tuple[int, int]:
+    """
+    逐个放置原子（随机序列吸附）
+
+    优化策略：70%概率在占据数最少的网格中生成候选点，30%在随机网格中生成；
+    当尝试次数过多时启用ML辅助，只在低密度网格中生成候选点。
+
+    参数:
+    positions: 预先分配的原子坐标数组 (num_atoms x 3)，原地填充
+    cell_list: 基于positions构建的空网格（track_density=True），截断距离即最小距离
+    rng: NumPy随机数生成器
+    use_ml_assisted_placement: 是否使用ML辅助原子放置
+    max_attempts: 最大尝试次数，默认为 num_atoms * 1000
+    on_batch: 每放置一个原子后的回调函数 on_batch(previous_placed, placed_atoms)
+    start: positions中已经插入网格的原子数，从第start个原子开始放置，默认为0
+    type_counts: 按类型编号索引的待放置各类型原子数；给出时（网格需使用截断距离矩阵）每个候选点
+                 按剩余原子数的比例抽取类型，接受后写入 cell_list.types
+    stats: 可选的GenerationStats，记录尝试次数、拒绝统计和ML辅助触发时刻
+    budget: 可选的AttemptBudget，判定为停滞时提前结束
+
+    返回:
+    placed_atoms: positions中已放置的原子总数（包括预先放置的start个）
+    attempts: 已尝试的次数
+    """
+    num_atoms = len(positions)
+    if max_attempts is None:
+        max_attempts = num_atoms * 1000  # 防止无限循环
+    remaining = None if type_counts is None else np.array(type_counts, dtype=np.int64)
+    
+    placed_atoms = start
+    attempts = 0
+    
+    # 当放置过程变得困难时（尝试次数过多时），启用ML辅助
+    ml_assisted_triggered = False
+    
+    while (placed_atoms < num_atoms and attempts < max_attempts
+           and (budget is None or budget.check(attempts, placed_atoms))):
+        # 检查是否需要启用ML辅助（当尝试次数过多时）
+        if use_ml_assisted_placement and not ml_assisted_triggered and attempts > placed_atoms * 50:
+            ml_assisted_triggered = True
+            if stats is not None:
+                stats.record_ml_trigger()
+        
+        # 根据是否使用ML辅助来选择放置策略
+        # 低密度网格直接从桶队列中占据数最少的桶里随机选取，代价与网格总数无关
+        if ml_assisted_triggered:
+            # 使用简单的低密度区域选择
+            cell = cell_list.density.random_min_cells(rng)
+        elif rng.random() < 0.7:
+            # 优化策略：70%概率选择低密度区域
+            cell = cell_list.density.random_min_cells(rng)
+        else:
+            # 30%随机选择一个网格
+            cell = rng.integers(cell_list.total_cells)
+        grid_coords = np.array(np.unravel_index(cell, cell_list.n_cells))
+        
+        # 在选定的网格内随机生成新原子位置
+        new_pos = cell_list.cell_points(grid_coords, rng.random(3))
+        new_type = None if remaining is None else _draw_types(rng, remaining, 1)
+        
+        # 检查是否与相邻网格中的原子满足最小距离要求（考虑周期性边界条件），有效则添加该原子
+        accepted = not cell_list.has_conflict(new_pos, types=new_type)[0]
+        if stats is not None:
+            if not accepted:
+                stats.record_rejections(cell_list.counts[cell])
+            stats.record_batch(1, int(accepted))
+        if accepted:
+            positions[placed_atoms] = new_pos
+            if remaining is not None:
+                cell_list.types[placed_atoms] = new_type[0]
+                remaining[new_type[0]] -= 1
+            cell_list.insert(placed_atoms)
+            placed_atoms += 1
+            if on_batch is not None:
+                on_batch(placed_atoms - 1, placed_atoms)
+        
+        attempts += 1
+    
+    return placed_atoms, attempts
+
+def _batch_conflicts(points: np.ndarray, box_size, cutoff: float, periodic=None,
+                     types: np.ndarray = None, cutoff_matrix: np.ndarray = None) -> np.ndarray:
+    """
+    找出一批候选点中与排在其前面的候选点距离小于cutoff的点
+
+    候选点按网格编号排序后，通过二分查找得到相邻网格中的候选点，整个过程不需要
+    为每个网格分配存储。只丢弃排在后面的一方，因此保留下来的点两两满足距离要求。
+
+    参数:
+    points: 候选点坐标 (K x 3)
+    box_size: 盒子尺寸 [lx, ly, lz] 或 [lx, ly, lz, xy, xz, yz]
+    cutoff: 最小距离（使用截断距离矩阵时为其中的最大值）
+    periodic: 各方向是否周期性 [px, py, pz]，默认为None（三个方向都是周期性的）
+    types: 候选点的类型编号 (K,)，与cutoff_matrix一起给出时按元素对的截断距离检查
+    cutoff_matrix: 按类型编号索引的截断距离矩阵
+
+    返回:
+    布尔数组 (K,)，True表示该候选点与更早的候选点冲突
+    """
+    num_points = len(points)
+    box = np.asarray(box_size, dtype=float)
+    n_cells = np.maximum(1, np.floor(_perpendicular_widths(box) / cutoff).astype(np.int64))
+    coords = np.floor(_fractional(points, box) * n_cells).astype(np.int64)
+    if periodic is None:
+        coords %= n_cells
+    else:
+        periodic = np.asarray(periodic, dtype=bool)
+        coords = np.where(periodic, coords % n_cells, np.clip(coords, 0, n_cells - 1))
+    flat_cells = np.ravel_multi_index(tuple(coords.T), n_cells)
+    order = np.argsort(flat_cells, kind='stable')
+    sorted_cells = flat_cells[order]
+    # 按网格顺序查询，二分查找的访问位置单调变化，对缓存友好
+    coords = coords[order]
+
+    conflict = np.zeros(num_points, dtype=bool)
+    stencil_cells = n_cells if periodic is None else np.where(periodic, n_cells, 3)
+    for offset in _stencil_offsets(stencil_cells, 1):
+        shifted = coords + offset
+        neighbor_cells = np.ravel_multi_index(tuple((shifted % n_cells).T), n_cells)
+        if periodic is not None:
+            # 非周期方向越界的相邻网格不存在，-1 在二分查找中得到空区间
+            outside = np.any(~periodic & ((shifted < 0) | (shifted >= n_cells)), axis=1)
+            neighbor_cells[outside] = -1
+        start = np.searchsorted(sorted_cells, neighbor_cells, side='left')
+        counts = np.searchsorted(sorted_cells, neighbor_cells, side='right') - start
+        total = counts.sum()
+        if total == 0:
+            continue
+        # 展开每个候选点在相邻网格中的所有候选点（CSR方式）
+        query = np.repeat(order, counts)
+        sorted_index = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(start, counts)
+        other = order[sorted_index]
+        earlier = other < query
+        query, other = query[earlier], other[earlier]
+        delta = _minimum_image(points[query] - points[other], box, periodic)
+        if types is not None and cutoff_matrix is not None:
+            limit = cutoff_matrix[types[query], types[other]]**2
+        else:
+            limit = cutoff**2
+        close = np.einsum('ij,ij->i', delta, delta) < limit
+        conflict[query[close]] = True
+    return conflict
+
+def _draw_types(rng: np.random.Generator, remaining: np.ndarray, size: int) -> np.ndarray:
+    """
+    按各类型剩余原子数的比例为候选点抽取类型编号
+
+    参数:
+    rng: NumPy随机数生成器
+    remaining: 按类型编号索引的剩余原子数
+    size: 候选点数
+
+    返回:
+    类型编号数组 (size,)
+    """
+    return rng.choice(len(remaining), size=size, p=remaining / remaining.sum())
+
+def _filter_candidates(cell_list: CellList, candidates: np.ndarray, types: np.ndarray = None,
+                       remaining: np.ndarray = None) -> np.ndarray:
+    """
+    筛选一批候选点：先与已放置原子做距离检查，再丢弃批内相互冲突的候选点，
+    给出类型时还保证每种类型接受的个数不超过剩余原子数
+
+    参数:
+    cell_list: 已放置原子的网格
+    candidates: 候选点坐标 (K x 3)
+    types: 候选点的类型编号 (K,)，默认为None（不区分类型）
+    remaining: 按类型编号索引的剩余原子数
+
+    返回:
+    保留的候选点编号（按原顺序）
+    """
+    keep = np.flatnonzero(~cell_list.has_conflict(candidates, types=types))
+    kept_types = None if types is None else types[keep]
+    if len(keep) > 1:
+        valid = ~_batch_conflicts(candidates[keep], cell_list.box, cell_list.cutoff, cell_list.periodic,
+                                  kept_types, cell_list.cutoff_matrix)
+        keep = keep[valid]
+        kept_types = None if types is None else kept_types[valid]
+    if remaining is not None:
+        valid = np.ones(len(keep), dtype=bool)
+        for type_id in np.flatnonzero(np.bincount(kept_types, minlength=len(remaining)) > remaining):
+            valid[np.flatnonzero(kept_types == type_id)[remaining[type_id]:]] = False
+        keep = keep[valid]
+    return keep
+
+def _place_batched(positions: np.ndarray, cell_list: CellList, rng: np.random.Generator,
+                   batch_size: int, use_ml_assisted_placement: bool = False,
+                   max_attempts: int = None, on_batch=None, start: int = 0, type_counts: np.ndarray = None,
+                   stats: GenerationStats = None, budget: AttemptBudget = None) -> Tuple[int, int]:
+    """
+    批量向量化放置原子
+
+    每批生成batch_size个候选点，整批通过网格与已放置原子做最小镜像距离检查，再丢弃批内
+    相互冲突的候选点，因此结果与逐个放置一样满足最小距离要求。候选网格的选择策略
+    与逐个放置相同：70%概率选择低密度网格，30%随机选择；ML辅助触发后只选择低密度网格。
+
+    参数:
+    positions: 预先分配的原子坐标数组 (num_atoms x 3)，原地填充
+    cell_list: 基于positions构建的空网格（track_density=True），截断距离即最小距离
+    rng: NumPy随机数生成器
+    batch_size: 每批候选点数
+    use_ml_assisted_placement: 是否使用ML辅助原子放置
+    max_attempts: 最大候选点总数，默认为 num_atoms * 1000
+    on_batch: 每批接受原子后的回调函数 on_batch(previous_placed, placed_atoms)
+    start: positions中已经插入网格的原子数，从第start个原子开始放置，默认为0
+    type_counts: 按类型编号索引的待放置各类型原子数；给出时（网格需使用截断距离矩阵）候选点
+                 按剩余原子数的比例抽取类型，接受后写入 cell_list.types
+    stats: 可选的GenerationStats，记录尝试次数、拒绝统计和ML辅助触发时刻
+    budget: 可选的AttemptBudget，判定为停滞时提前结束
+
+    返回:
+    placed_atoms: positions中已放置的原子总数（包括预先放置的start个）
+    attempts: 已尝试的候选点总数
+    """
+    num_atoms = len(positions)
+    if max_attempts is None:
+        max_attempts = num_atoms * 1000
+    remaining = None if type_counts is None else np.array(type_counts, dtype=np.int64)
+
+    placed_atoms = start
+    attempts = 0
+    ml_assisted_triggered = False
+    while (placed_atoms < num_atoms and attempts < max_attempts
+           and (budget is None or budget.check(attempts, placed_atoms))):
+        n_candidates = min(batch_size, max_attempts - attempts)
+        # 与逐个放置相同，触发后一直只选择低密度网格
+        if use_ml_assisted_placement and not ml_assisted_triggered and attempts > placed_atoms * 50:
+            if stats is not None:
+                stats.record_ml_trigger()
+            ml_assisted_triggered = True
+        n_low = n_candidates if ml_assisted_triggered else rng.binomial(n_candidates, 0.7)
+        cells = np.concatenate([
+            cell_list.density.random_min_cells(rng, n_low),
+            rng.integers(cell_list.total_cells, size=n_candidates - n_low)
+        ])
+        coords = np.stack(np.unravel_index(cells, cell_list.n_cells), axis=1)
+        candidates = cell_list.cell_points(coords, rng.random((n_candidates, 3)))
+        types = None if remaining is None else _draw_types(rng, remaining, n_candidates)
+        attempts += n_candidates
+
+        # 与相邻网格中已放置原子的距离检查（整批一次完成），并解决批内候选点之间的冲突
+        keep = _filter_candidates(cell_list, candidates, types, remaining)[:num_atoms - placed_atoms]
+        n_accepted = len(keep)
+        if stats is not None:
+            rejected = np.ones(n_candidates, dtype=bool)
+            rejected[keep] = False
+            stats.record_rejections(cell_list.counts[cells[rejected]])
+            stats.record_batch(n_candidates, n_accepted)
+        if n_accepted == 0:
+            continue
+
+        indices = np.arange(placed_atoms, placed_atoms + n_accepted)
+        positions[indices] = candidates[keep]
+        if remaining is not None:
+            cell_list.types[indices] = types[keep]
+            remaining -= np.bincount(types[keep], minlength=len(remaining))
+        cell_list.insert(indices)
+
+        previous_placed = placed_atoms
+        placed_atoms += n_accepted
+        if on_batch is not None:
+            on_batch(previous_placed, placed_atoms)
+
+    return placed_atoms, attempts
+
+def _covered_cells(cell_list: CellList, corners: np.ndarray, width: np.ndarray,
+                   split: bool = False, chunk_size: int = 16384) -> np.ndarray:
+    """
+    判断空隙网格是否已被某一个已放置原子的排斥球完全覆盖
+
+    排斥球是凸的，只要网格离某个原子最远的角点到该原子的距离小于cutoff，整个网格
+    就位于该原子的排斥球内，不可能再放入原子。能覆盖网格的原子到网格中心的距离
+    必然小于cutoff，因此只需检查网格中心的邻居原子。split=True 时判断每个网格的8个
+    子网格，子网格沿用父网格中心的邻居原子，漏判只会让子网格多保留一轮，不影响正确性。
+
+    参数:
+    cell_list: 已放置原子的网格
+    corners: 空隙网格的下角点坐标 (M x 3)
+    width: 空隙网格的边长 [wx, wy, wz]
+    split: 是否判断细分后的子网格，默认为False
+    chunk_size: 每次处理的空隙网格数，用于限制临时内存
+
+    返回:
+    布尔数组，split为False时形状为 (M,)，否则为 (M*8,)，按父网格、子网格顺序排列，
+    True表示该网格已被完全覆盖
+    """
+    width = np.asarray(width, dtype=float)
+    if split:
+        sub_half_width = 0.25 * width
+        sub_centers = (np.indices((2, 2, 2)).reshape(3, -1).T - 0.5) * 0.5 * width
+    else:
+        sub_half_width = 0.5 * width
+        sub_centers = np.zeros((1, 3))
+    n_sub = len(sub_centers)
+
+    # 使用截断距离矩阵时，一个原子的排斥范围取它与各类型截断距离中的最小值
+    if cell_list.cutoff_matrix is not None:
+        cover_radius = cell_list.cutoff_matrix[:, 1:].min(axis=1)
+
+    covered = np.zeros((len(corners), n_sub), dtype=bool)
+    for start in range(0, len(corners), chunk_size):
+        centers = corners[start:start + chunk_size] + 0.5 * width
+        query, atoms = cell_list.query_pairs(centers)
+        delta = _minimum_image(cell_list.positions[atoms] - centers[query], cell_list.box, cell_list.periodic)
+        farthest = np.abs(delta[:, None, :] - sub_centers[None, :, :]) + sub_half_width
+        if cell_list.cutoff_matrix is None:
+            limit = cell_list.cutoff**2
+        else:
+            limit = cover_radius[cell_list.types[atoms]][:, None]**2
+        pair, sub = np.nonzero(np.sum(farthest**2, axis=-1) < limit)
+        covered[start + query[pair], sub] = True
+    return covered.ravel()
+
+def _place_void(positions: np.ndarray, cell_list: CellList, rng: np.random.Generator,
+                batch_size: int = 4096, max_attempts: int = None, on_batch=None,
+                max_level: int = 8, region=None, start: int = 0,
+                type_counts: np.ndarray = None, stats: GenerationStats = None) -> Tuple[int, int]:
+    """
+    跟踪空隙网格的放置方式（适用于接近随机序列吸附极限的高密度）
+
+    仿照最大泊松圆盘采样（Bridson活动列表 / Ebeida空隙细分）并推广到周期性盒子：
+    空隙网格初始边长不超过 min_distance/sqrt(3)，一个网格内放入原子后整个网格即被填满；
+    候选点只在仍有空余体积的活动网格中生成，被某个原子排斥球完全覆盖的网格被移出活动
+    列表。当一轮投点的接受率过低时，把剩余活动网格细分为8个子网格并剔除已覆盖的子网格，
+    继续投点。这样候选点始终落在真实存在的空隙中，不会像全盒随机尝试那样在接近饱和时
+    把绝大多数尝试浪费在被拒绝的位置上。
+
+    参数:
+    positions: 预先分配的原子坐标数组 (num_atoms x 3)，原地填充
+    cell_list: 基于positions构建的空网格，截断距离即最小距离
+    rng: NumPy随机数生成器
+    batch_size: 每批同时投点的活动网格数
+    max_attempts: 最大候选点总数，默认为 num_atoms * 1000
+    on_batch: 每批接受原子后的回调函数 on_batch(previous_placed, placed_atoms)
+    max_level: 最大细分层数
+    region: 可选的区域函数 region(lower, upper) -> 布尔数组，参数为初始空隙网格的下、上角点坐标，
+            只在返回True的网格中投点，默认为None（整个盒子）
+    start: positions中已经插入网格的原子数，从第start个原子开始放置，默认为0
+    type_counts: 按类型编号索引的待放置各类型原子数；给出时（网格需使用截断距离矩阵）候选点
+                 按剩余原子数的比例抽取类型，空隙网格按最小的截断距离划分（仅支持正交盒子）
+    stats: 可选的GenerationStats，记录尝试次数和拒绝统计（按候选点所在邻居网格的占据数）
+
+    返回:
+    placed_atoms: positions中已放置的原子总数，包括预先放置的start个（活动网格耗尽时小于num_atoms，说明已达到饱和）
+    attempts: 已尝试的候选点总数
+    """
+    num_atoms = len(positions)
+    if max_attempts is None:
+        max_attempts = num_atoms * 1000
+    box = cell_list.box
+    remaining = None if type_counts is None else np.array(type_counts, dtype=np.int64)
+
+    # 网格内任意两点的距离都小于最小的截断距离，放入一个原子即可视为填满
+    smallest_cutoff = cell_list.cutoff if cell_list.cutoff_matrix is None else cell_list.cutoff_matrix[1:, 1:].min()
+    n_void = np.ceil(box / (smallest_cutoff / np.sqrt(3))).astype(np.int64)
+    width = box / n_void
+    active = np.stack(np.unravel_index(rng.permutation(int(np.prod(n_void))), n_void), axis=1)
+    if region is not None:
+        active = active[region(active * width, (active + 1) * width)]
+
+    placed_atoms = start
+    attempts = 0
+    level = 0
+    while placed_atoms < num_atoms and attempts < max_attempts and len(active) > 0:
+        # 在当前层反复投点（每个活动网格一个候选点），直到接受率明显下降
+        while placed_atoms < num_atoms and attempts < max_attempts and len(active) > 0:
+            filled = np.zeros(len(active), dtype=bool)
+            round_accepted = 0
+            for chunk_start in range(0, len(active), batch_size):
+                if placed_atoms >= num_atoms or attempts >= max_attempts:
+                    break
+                chunk = np.arange(chunk_start, min(chunk_start + batch_size, len(active),
+                                                   chunk_start + max_attempts - attempts))
+                candidates = (active[chunk] + rng.random((len(chunk), 3))) * width
+                types = None if remaining is None else _draw_types(rng, remaining, len(chunk))
+                attempts += len(chunk)
+
+                keep = _filter_candidates(cell_list, candidates, types, remaining)[:num_atoms - placed_atoms]
+                if stats is not None:
+                    rejected = np.ones(len(chunk), dtype=bool)
+                    rejected[keep] = False
+                    stats.record_rejections(cell_list.counts[cell_list.cell_index(candidates[rejected])])
+                    stats.record_batch(len(chunk), len(keep))
+                chunk, candidates = chunk[keep], candidates[keep]
+                if len(candidates) == 0:
+                    continue
+
+                indices = np.arange(placed_atoms, placed_atoms + len(candidates))
+                positions[indices] = candidates
+                if remaining is not None:
+                    cell_list.types[indices] = types[keep]
+                    remaining -= np.bincount(types[keep], minlength=len(remaining))
+                cell_list.insert(indices)
+                filled[chunk] = True
+                round_accepted += len(candidates)
+
+                previous_placed = placed_atoms
+                placed_atoms += len(candidates)
+                if on_batch is not None:
+                    on_batch(previous_placed, placed_atoms)
+
+            # 放入原子的网格以及被已有原子完全覆盖的网格都不再有空余体积
+            acceptance = round_accepted / len(active)
+            active = active[~filled]
+            active = active[~_covered_cells(cell_list, active * width, width)]
+            if acceptance < 0.05:
+                break
+
+        if placed_atoms >= num_atoms or len(active) == 0 or level >= max_level:
+            break
+
+        # 细分剩余的活动网格，剔除已被覆盖的子网格，并打乱顺序以保持空间上的均匀性
+        covered = _covered_cells(cell_list, active * width, width, split=True)
+        children = (2 * active[:, None, :] + np.indices((2, 2, 2)).reshape(3, -1).T[None, :, :]).reshape(-1, 3)
+        width = width / 2
+        level += 1
+        active = children[~covered]
+        active = active[rng.permutation(len(active))]
+
+    return placed_atoms, attempts
+
+def _place_relax(positions: np.ndarray, cell_list: CellList, rng: np.random.Generator,
+                 max_sweeps: int = 2000, on_batch=None, types: np.ndarray = None,
+                 stats: GenerationStats = None) -> Tuple[int, int]:
+    """
+    先放置再松弛的放置方式：一次性在盒子中均匀放入全部原子，再用软球推开重叠
+
+    每一轮（sweep）整体重建网格，找出距离小于截断距离的原子对，把每对原子沿连线
+    各推开重叠量的一半（略微多推一点，避免刚分开的原子对再次接触），所有位移同时
+    累加后一次性更新。之后的每一轮只需检查上一轮移动过的原子，代价为若干次O(N)的
+    整体操作，不会像逐个拒绝那样在高密度时尝试次数急剧增加，因此可以达到随机序列
+    吸附无法达到的密度（随机密堆积附近才会明显变慢）。
+
+    参数:
+    positions: 原子坐标数组 (num_atoms x 3)，原地填充
+    cell_list: 基于positions构建的空网格，截断距离即最小距离
+    rng: NumPy随机数生成器
+    max_sweeps: 最大松弛轮数
+    on_batch: 松弛结束后的回调函数 on_batch(previous_placed, placed_atoms)
+    types: 每个原子的类型编号；网格使用截断距离矩阵时需要给出，写入 cell_list.types
+    stats: 可选的GenerationStats，每轮检查记录一次（attempts为检查轮数，placed_atoms为不与其他原子重叠的原子数）
+
+    返回:
+    placed_atoms: 不与任何原子重叠的原子数（等于num_atoms时说明已全部满足最小距离）
+    attempts: 已进行的松弛轮数
+    """
+    num_atoms = len(positions)
+    box = cell_list.box
+    positions[:] = _cartesian(rng.random((num_atoms, 3)), box)
+    if cell_list.cutoff_matrix is not None:
+        cell_list.types[:] = types
+
+    def overlapping_pairs(check, is_checked):
+        # 找出check中的原子与其他原子之间距离小于截断距离的原子对，两个原子都在check中时每对只保留一次
+        cell_list.clear()
+        cell_list.insert(np.arange(num_atoms))
+        query, atoms = cell_list.query_pairs(positions[check])
+        first = check[query]
+        unique = (atoms != first) & (~is_checked[atoms] | (first < atoms))
+        first, second = first[unique], atoms[unique]
+        delta = _minimum_image(positions[second] - positions[first], box)
+        distance = np.sqrt(np.einsum('ij,ij->i', delta, delta))
+        if cell_list.cutoff_matrix is None:
+            limit = np.full(len(first), cell_list.cutoff)
+        else:
+            limit = cell_list.cutoff_matrix[cell_list.types[first], cell_list.types[second]]
+        close = distance < limit
+        return first[close], second[close], delta[close], distance[close], limit[close]
+
+    moving = np.arange(num_atoms)
+    is_moving = np.ones(num_atoms, dtype=bool)
+    sweeps = 0
+    while sweeps < max_sweeps:
+        # 只有上一轮移动过的原子可能产生新的重叠
+        first, second, delta, distance, limit = overlapping_pairs(moving, is_moving)
+        if stats is not None:
+            # 只检查了移动过的原子，未移动的原子上一轮已确认不重叠
+            clear_atoms = num_atoms - len(np.union1d(first, second))
+            stats.record_batch(1, clear_atoms - stats.placed_atoms)
+        if len(first) == 0:
+            break
+
+        # 重合的原子对沿随机方向推开
+        coincident = distance == 0
+        if np.any(coincident):
+            delta[coincident] = rng.normal(size=(int(coincident.sum()), 3))
+            distance[coincident] = np.linalg.norm(delta[coincident], axis=1)
+        push = (0.5 * (limit * (1 + 1e-2) - distance) / distance)[:, None] * delta
+
+        displacement = np.zeros((num_atoms, 3))
+        for axis in range(3):
+            displacement[:, axis] = (np.bincount(second, push[:, axis], minlength=num_atoms)
+                                     - np.bincount(first, push[:, axis], minlength=num_atoms))
+        # 与很多原子同时重叠时合位移可能过大，限制单轮位移不超过截断距离的一半
+        length = np.linalg.norm(displacement, axis=1)
+        too_far = length > 0.5 * cell_list.cutoff
+        displacement[too_far] *= (0.5 * cell_list.cutoff / length[too_far])[:, None]
+
+        moving = np.flatnonzero(length > 0)
+        is_moving.fill(False)
+        is_moving[moving] = True
+        # 移动后映射回盒子内
+        positions[moving] = _cartesian(_fractional(positions[moving] + displacement[moving], box) % 1.0, box)
+        sweeps += 1
+
+    if sweeps < max_sweeps:
+        placed_atoms = num_atoms
+    else:
+        # 达到最大轮数时整体检查一次，统计仍与其他原子重叠的原子
+        first, second, _, _, _ = overlapping_pairs(np.arange(num_atoms), np.ones(num_atoms, dtype=bool))
+        placed_atoms = num_atoms - len(np.union1d(first, second))
+    if on_batch is not None:
+        on_batch(0, placed_atoms)
+    return placed_atoms, sweeps
+
+def _cutoff_matrix(min_distance, elements: List[str]) -> np.ndarray:
     """
-    生成满足特定数密度的随机原子结构（使用空间粗粒化优化）
-    
+    由元素对的最小距离构造按类型编号索引的截断距离矩阵
+
+    类型编号从1开始，与element_ratios中元素的顺序一致，矩阵第0行和第0列不使用。
+
+    参数:
+    min_distance: 元素对到最小距离的字典，例如 {("Fe", "Fe"): 2.2, ("Fe", "B"): 1.8, ("B", "B"): 1.6}，
+                  (a, b) 与 (b, a) 等价；也可以是按元素顺序排列的 T x T 矩阵
+    elements: 元素列表
+
+    返回:
+    (T+1) x (T+1) 的对称矩阵
+    """
+    num_types = len(elements)
+    matrix = np.zeros((num_types + 1, num_types + 1))
+    if isinstance(min_distance, dict):
+        for i, first in enumerate(elements):
+            for j, second in enumerate(elements):
+                distance = min_distance.get((first, second), min_distance.get((second, first)))
+                if distance is None:
+                    raise ValueError(f"缺少元素对 {first}-{second} 的最小距离")
+                matrix[i + 1, j + 1] = distance
+    else:
+        values = np.asarray(min_distance, dtype=float)
+        if values.shape != (num_types, num_types) or not np.allclose(values, values.T):
+            raise ValueError(f"最小距离矩阵应为 {num_types} x {num_types} 的对称矩阵")
+        matrix[1:, 1:] = values
+    return matrix
+
+class ElementTypes(Sequence):
+    """
+    按原子类型编号按需映射到元素名称的只读序列
+
+    紧凑模式下代替逐个原子的元素名称列表（列表中每个原子要占一个8字节的引用），
+    支持 len()、下标、切片和迭代，可以直接传给 save_lammps_data。
+    """
+
+    def __init__(self, atom_types: np.ndarray, elements: List[str]):
+        """
+        参数:
+        atom_types: 原子类型编号数组（从1开始）
+        elements: 元素名称列表，elements[t - 1] 为类型t的元素
+        """
+        self.atom_types = atom_types
+        self.elements = list(elements)
+        self._names = np.array([None] + self.elements, dtype=object)
+
+    def __len__(self):
+        return len(self.atom_types)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._names[self.atom_types[index]].tolist()
+        return self.elements[int(self.atom_types[index]) - 1]
+
+    def __iter__(self):
+        for start in range(0, len(self.atom_types), 1 << 16):
+            yield from self[start:start + (1 << 16)]
+
+def _compact_type_dtype(num_types: int):
+    """能容纳类型编号 1..num_types 的最小整数类型"""
+    return np.int8 if num_types < np.iinfo(np.int8).max else np.int16
+
+def _assign_atom_types(num_atoms: int, element_ratios: Dict[str, float],
+                       rng: np.random.Generator, compact: bool = False) -> Tuple[List[int], List[str]]:
+    """
+    按元素比例生成打乱顺序的原子类型列表
+
     参数:
     num_atoms: 原子数量
-    density: 数密度 (atoms per cubic unit)
-    min_distance: 原子间最小距离
-    element_ratios: 元素类型及其比例，例如 {"Ti": 0.5, "Al": 0.5}
-    generate_trajectory: 是否生成轨迹文件，默认为False
-    use_ml_assisted_placement: 是否使用ML辅助原子放置，默认为False
+    element_ratios: 元素类型及其比例，默认为None（全部为Ti）
+    rng: NumPy随机数生成器
+    compact: 是否以int8/int16数组和ElementTypes返回（与列表形式的结果相同，但每个原子只占1~2字节）
+
     返回:
-    positions: 原子坐标 (num_atoms x 3)
-    box_size: 盒子边长 [lx, ly, lz]
-    atom_types: 原子类型列表
+    atom_types: 原子类型列表（从1开始的编号）
     element_types: 元素类型名称列表
     """
-    
-    # 根据数密度计算盒子大小
-    volume = num_atoms / density
-    box_length = volume**(1/3)
-    box_size = [box_length, box_length, box_length]
-    
-    # 初始化坐标数组
-    positions = np.zeros((num_atoms, 3))
-    atom_types = []  # 存储每个原子的类型（数字）
-    element_types = []  # 存储每个原子的元素类型名称
-    
     # 如果没有提供元素比例，则默认所有原子为Ti类型
     if element_ratios is None:
         element_ratios = {"Ti": 1.0}
@@ -109,258 +1856,1178 @@ def generate_random_structure(
     # 计算每个元素类型的原子数量
     elements = list(element_ratios.keys())
     ratios = list(element_ratios.values())
+    counts = [round(num_atoms * ratio) for ratio in ratios]
+    
+    # 如果由于四舍五入导致总数不匹配，多出的原子从最后删除，缺少的原子补为第一个元素类型
+    diff = num_atoms - sum(counts)
+    
+    if compact:
+        # 按与列表相同的顺序排列后打乱，随机数的使用方式与列表完全相同
+        dtype = _compact_type_dtype(len(elements))
+        atom_types = np.repeat(np.arange(1, len(elements) + 1, dtype=dtype), counts)
+        atom_types = np.concatenate([atom_types, np.ones(diff, dtype=dtype)]) if diff > 0 else atom_types[:num_atoms]
+        rng.shuffle(atom_types)
+        return atom_types, ElementTypes(atom_types, elements)
     
     # 创建原子类型的分布列表
     atom_distribution = []
-    for i, element in enumerate(elements):
-        count = round(num_atoms * ratios[i])
+    for element, count in zip(elements, counts):
         atom_distribution.extend([element] * count)
-    
-    # 如果由于四舍五入导致总数不匹配，调整最后一个元素的数量
-    if len(atom_distribution) != num_atoms:
-        diff = num_atoms - len(atom_distribution)
-        if diff > 0:
-            # 添加缺少的原子到第一个元素类型
-            atom_distribution.extend([elements[0]] * diff)
-        else:
-            # 删除多余的原子（从最后删除）
-            atom_distribution = atom_distribution[:num_atoms]
+    if diff > 0:
+        # 添加缺少的原子到第一个元素类型
+        atom_distribution.extend([elements[0]] * diff)
+    else:
+        # 删除多余的原子（从最后删除）
+        atom_distribution = atom_distribution[:num_atoms]
     
     # 打乱原子分布顺序
-    random.shuffle(atom_distribution)
+    rng.shuffle(atom_distribution)
     
     # 创建元素到类型编号的映射
     element_to_type = {element: i+1 for i, element in enumerate(elements)}
+    atom_types = [element_to_type[element] for element in atom_distribution]
+    return atom_types, atom_distribution
+
+def _allocate_positions(num_atoms: int, positions_file: str = None) -> np.ndarray:
+    """分配坐标数组；给出文件路径时使用内存映射（新文件全部为0，只有写入过的页才占用内存）"""
+    if positions_file is not None:
+        return np.memmap(positions_file, dtype=np.float64, mode='w+', shape=(num_atoms, 3))
+    return np.zeros((num_atoms, 3))
+
+def _type_sequences(atom_types: np.ndarray, elements: List[str], compact: bool):
+    """由类型编号数组得到返回给调用者的 (atom_types, element_types)，紧凑模式下为int8/int16数组和ElementTypes"""
+    if compact:
+        atom_types = atom_types.astype(_compact_type_dtype(len(elements)))
+        return atom_types, ElementTypes(atom_types, elements)
+    atom_types = atom_types.tolist()
+    return atom_types, [elements[type_id - 1] for type_id in atom_types]
+
+class _Checkpoint:
+    """
+    生成过程的检查点：保存已放置的原子、类型和随机数生成器状态
+
+    每次放置回调时检查距上次保存的时间，超过间隔才写文件，因此保存频率与批大小无关。
+    文件先写到同一目录下的临时文件再原子替换，保存过程中被中断也不会损坏已有的检查点。
+    """
+
+    def __init__(self, filename: str, interval: float, positions: np.ndarray, box_size: List[float],
+                 rng: np.random.Generator, cell_list: CellList, atom_types, elements: List[str],
+                 type_counts: np.ndarray, settings: dict, start: int):
+        """
+        参数:
+        filename: 检查点文件路径
+        interval: 两次保存之间的最小间隔（秒）
+        positions: 坐标数组（放置过程中原地填充）
+        box_size: 盒子尺寸
+        rng: 放置使用的随机数生成器
+        cell_list: 放置使用的网格
+        atom_types: 预先分配的全部原子类型（按元素对检查距离时为None，类型取自cell_list.types）
+        elements: 元素名称，elements[t - 1] 为类型t的元素
+        type_counts: 按元素对检查距离时待放置的各类型原子数，否则为None
+        settings: 续算需要的生成参数（num_atoms、placement_strategy、batch_size、use_ml_assisted_placement）
+        start: 开始放置前已有的原子数
+        """
+        self.filename = filename
+        self.interval = interval
+        self.positions = positions
+        self.rng = rng
+        self.cell_list = cell_list
+        self.placed_atoms = start
+        self.fixed = dict(
+            box_size=np.asarray(box_size, dtype=float),
+            cutoff=cell_list.cutoff_matrix if cell_list.cutoff_matrix is not None else np.asarray(cell_list.cutoff),
+            elements=np.array(elements, dtype=str),
+            settings=np.array(json.dumps(settings))
+        )
+        if type_counts is not None:
+            # 保存各类型的目标总数，续算时减去已放置的原子即为剩余数
+            self.fixed["type_totals"] = type_counts + np.bincount(cell_list.types[:start], minlength=len(type_counts))
+            self.atom_types = None
+        else:
+            self.atom_types = np.asarray(atom_types, dtype=np.int16)
+        self.last_save = time.perf_counter()
+
+    def update(self, placed_atoms: int):
+        """记录放置进度，距上次保存超过间隔时写入检查点"""
+        self.placed_atoms = placed_atoms
+        if time.perf_counter() - self.last_save >= self.interval:
+            self.save()
+
+    def save(self, placed_atoms: int = None):
+        """
+        写入检查点
+
+        参数:
+        placed_atoms: 已放置的原子数，默认为最后一次update记录的值
+        """
+        if placed_atoms is not None:
+            self.placed_atoms = placed_atoms
+        placed = self.placed_atoms
+        atom_types = self.cell_list.types[:placed] if self.atom_types is None else self.atom_types
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        fd, temporary = tempfile.mkstemp(dir=directory, prefix=".checkpoint-", suffix=".npz")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, positions=np.asarray(self.positions[:placed]), atom_types=atom_types,
+                         rng_state=np.array(json.dumps(self.rng.bit_generator.state)), **self.fixed)
+            os.replace(temporary, self.filename)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temporary)
+            raise
+        self.last_save = time.perf_counter()
+
+def _load_checkpoint(filename: str) -> dict:
+    """
+    读取检查点文件
+
+    返回:
+    字典，包含 positions（已放置原子的坐标）、atom_types、box_size、cutoff（标量或截断距离矩阵）、elements、
+    type_totals（未按元素对检查距离时为None）、settings 和恢复了状态的随机数生成器 rng
+    """
+    with np.load(filename) as data:
+        state = json.loads(str(data["rng_state"]))
+        rng = np.random.Generator(getattr(np.random, state["bit_generator"])())
+        rng.bit_generator.state = state
+        cutoff = data["cutoff"]
+        return dict(
+            positions=data["positions"],
+            atom_types=data["atom_types"].astype(np.int64),
+            box_size=data["box_size"].tolist(),
+            cutoff=float(cutoff) if cutoff.ndim == 0 else cutoff,
+            elements=data["elements"].tolist(),
+            type_totals=data["type_totals"] if "type_totals" in data.files else None,
+            settings=json.loads(str(data["settings"])),
+            rng=rng
+        )
+
+def _run_placement(positions: np.ndarray, cell_list: CellList, rng: np.random.Generator, settings: dict,
+                   max_attempts: int, on_batch, type_counts: np.ndarray, stats: GenerationStats, start: int,
+                   relax_types: np.ndarray = None, budget: AttemptBudget = None) -> Tuple[int, int]:
+    """按settings中的放置策略调用对应的放置函数，返回 (placed_atoms, attempts)"""
+    placement_strategy = settings["placement_strategy"]
+    batch_size = settings["batch_size"]
+    use_ml_assisted_placement = settings["use_ml_assisted_placement"]
+    if placement_strategy == "relax":
+        # 先放置再松弛：类型事先确定，全部原子一起移动
+        return _place_relax(
+            positions, cell_list, rng,
+            on_batch=on_batch,
+            types=relax_types,
+            stats=stats
+        )
+    if placement_strategy == "void":
+        # 空隙跟踪模式总是批量进行
+        return _place_void(
+            positions, cell_list, rng, batch_size or 4096,
+            max_attempts=max_attempts,
+            on_batch=on_batch,
+            start=start,
+            type_counts=type_counts,
+            stats=stats
+        )
+    if batch_size is not None and batch_size > 1:
+        # 批量模式：成批生成候选点并向量化检查
+        return _place_batched(
+            positions, cell_list, rng, batch_size,
+            use_ml_assisted_placement=use_ml_assisted_placement,
+            max_attempts=max_attempts,
+            on_batch=on_batch,
+            start=start,
+            type_counts=type_counts,
+            stats=stats,
+            budget=budget
+        )
+    # 逐个添加原子，确保满足最小距离要求（考虑周期性边界条件和空间粗粒化优化）
+    return _place_sequential(
+        positions, cell_list, rng,
+        use_ml_assisted_placement=use_ml_assisted_placement,
+        max_attempts=max_attempts,
+        on_batch=on_batch,
+        start=start,
+        type_counts=type_counts,
+        stats=stats,
+        budget=budget
+    )
+
+def _complete_structure(positions: np.ndarray, box_size: List[float], cell_list: CellList,
+                        rng: np.random.Generator, atom_types, element_types, elements: List[str],
+                        type_counts: np.ndarray, settings: dict, start: int, progress, stats: GenerationStats,
+                        phase, generate_trajectory=False, checkpoint: str = None, checkpoint_interval: float = 60.0):
+    """
+    放置剩余原子并整理返回值（generate_random_structure、resume_random_structure和extend_structure共用）
+
+    参数:
+    positions: 坐标数组，前start个原子已经插入cell_list
+    atom_types, element_types: 预先分配的原子类型；按元素对检查距离时（type_counts不为None）由放置过程确定，
+                               relax模式以外忽略这两个参数
+    elements: 元素名称，elements[t - 1] 为类型t的元素
+    type_counts: 按元素对检查距离时待放置的各类型原子数，否则为None
+    settings: 放置参数（num_atoms、placement_strategy、batch_size、use_ml_assisted_placement）
+    start: 已放置的原子数
+    其余参数同generate_random_structure，phase为统计阶段耗时的上下文管理器
+
+    返回:
+    与generate_random_structure相同
+    """
+    num_atoms = len(positions)
+    placement_strategy = settings["placement_strategy"]
+    relax_types = None
+    if type_counts is not None:
+        if placement_strategy == "relax":
+            relax_types = np.asarray(atom_types)
+        else:
+            atom_types = cell_list.types
     
-    # 空间粗粒化优化设置
-    # 网格大小必须至少是min_distance，以确保所有可能影响当前网格的原子都在相邻网格中
-    # 为了确保安全，我们使用min_distance * sqrt(3)作为网格大小，这样可以覆盖所有对角线方向的影响
-    grid_size = min_distance * np.sqrt(3)
-    nx = int(np.ceil(box_length / grid_size))
-    ny = int(np.ceil(box_length / grid_size))
-    nz = int(np.ceil(box_length / grid_size))
-    
-    # 初始化网格系统和密度统计
-    grid = {}
-    grid_density = np.zeros((nx, ny, nz))
-    for i in range(nx):
-        for j in range(ny):
-            for k in range(nz):
-                grid[(i, j, k)] = []
-    
-    # 获取网格坐标（考虑周期性边界条件）
-    def get_grid_coords(pos):
-        ix = int(pos[0] / grid_size) % nx
-        iy = int(pos[1] / grid_size) % ny
-        iz = int(pos[2] / grid_size) % nz
-        return (ix, iy, iz)
-    
-    # 获取相邻网格（考虑周期性边界条件）
-    # 扩大搜索范围以确保覆盖所有可能影响的原子
-    def get_neighboring_grids(grid_coords):
-        neighbors = []
-        # 搜索范围需要根据网格大小和最小距离的关系来确定
-        search_range = max(2, int(np.ceil(min_distance / grid_size)) + 1)
-        for dx in range(-search_range, search_range + 1):
-            for dy in range(-search_range, search_range + 1):
-                for dz in range(-search_range, search_range + 1):
-                    nx_coord = (grid_coords[0] + dx) % nx
-                    ny_coord = (grid_coords[1] + dy) % ny
-                    nz_coord = (grid_coords[2] + dz) % nz
-                    neighbors.append((nx_coord, ny_coord, nz_coord))
-        return list(set(neighbors))  # 去重
-    
-    # 添加第一个原子在盒子中心附近
-    positions[0] = np.array([
-        random.uniform(0, box_length),
-        random.uniform(0, box_length),
-        random.uniform(0, box_length)
-    ])
-    element_type = atom_distribution[0]
-    atom_types.append(element_to_type[element_type])
-    element_types.append(element_type)
-    placed_atoms = 1
-    
-    # 更新第一个原子的网格信息
-    first_grid_coord = get_grid_coords(positions[0])
-    grid[first_grid_coord].append(0)
-    grid_density[first_grid_coord] += 1
-    
-    # 如果需要生成轨迹，则保存第一个原子的构型作为轨迹的第一帧
-    if generate_trajectory:
-        save_lammps_trajectory("generation_trajectory.lammpstrj", 
-                             positions[:placed_atoms], box_size, 
-                             atom_types, element_types, placed_atoms, num_atoms)
+    # 轨迹写入器：文件保持打开，按间隔抽帧
+    if isinstance(generate_trajectory, TrajectoryWriter):
+        trajectory_writer = generate_trajectory
+    elif generate_trajectory:
+        trajectory_writer = TrajectoryWriter("generation_trajectory.lammpstrj",
+                                             stride=max(1, num_atoms // 1000))
+    else:
+        trajectory_writer = None
+    
+    checkpointer = None
+    if checkpoint is not None:
+        checkpointer = _Checkpoint(checkpoint, checkpoint_interval, positions, box_size, rng, cell_list,
+                                   atom_types if type_counts is None else None, elements, type_counts,
+                                   settings, start)
+    
+    # 进度显示、轨迹输出和检查点都关闭时不设置回调，放置循环中没有额外的函数调用
+    if progress is True:
+        report = lambda previous_placed, placed_atoms: _report_progress(previous_placed, placed_atoms, num_atoms)
+    elif progress:
+        report = lambda previous_placed, placed_atoms: progress(placed_atoms, num_atoms)
+    else:
+        report = None
+    
+    def on_batch(previous_placed, placed_atoms):
+        # 回调时这一批原子已全部插入网格，先记录进度，回调函数中被中断时检查点也包含这一批
+        if checkpointer is not None:
+            checkpointer.update(placed_atoms)
+        if trajectory_writer is not None:
+            trajectory_writer.update(positions, atom_types, box_size, placed_atoms)
+        if report is not None:
+            report(previous_placed, placed_atoms)
+    if trajectory_writer is None and report is None and checkpointer is None:
+        on_batch = None
     
-    # 逐个添加原子，确保满足最小距离要求（考虑周期性边界条件和空间粗粒化优化）
-    attempts = 0
     max_attempts = num_atoms * 1000  # 防止无限循环
+    # 随机序列吸附按接受率判断是否停滞，停滞时提前结束（或从已放置的原子开始改用空隙跟踪方式）
+    on_stall = settings.get("on_stall", "raise")
+    budget = AttemptBudget(num_atoms, max_attempts) if on_stall is not None and placement_strategy == "rsa" else None
+    switched = False
     
-    # 当放置过程变得困难时（尝试次数过多时），启用ML辅助
-    ml_assisted_triggered = False
+    try:
+        with phase("placement"):
+            placed_atoms, attempts = _run_placement(positions, cell_list, rng, settings, max_attempts, on_batch,
+                                                    type_counts, stats, start, relax_types, budget)
+            if budget is not None and budget.stalled:
+                if stats is not None:
+                    stats.stalled_at = (attempts, placed_atoms)
+                if on_stall == "switch" and not _is_triclinic(box_size):
+                    switched = True
+                    # 结果的统计性质与所选的随机序列吸附不同，必须让调用者知道
+                    warnings.warn(f"随机序列吸附在 {attempts} 次尝试后停滞（已放置 {placed_atoms}/{num_atoms} 个原子），"
+                                  f"改用空隙跟踪方式（void）放置其余原子", RuntimeWarning, stacklevel=3)
+                    if stats is not None:
+                        stats.switched_strategy = "void"
+                    placed_atoms, void_attempts = _run_placement(
+                        positions, cell_list, rng, dict(settings, placement_strategy="void"),
+                        max_attempts - attempts, on_batch, None if type_counts is None else
+                        type_counts - np.bincount(cell_list.types[start:placed_atoms], minlength=len(type_counts)),
+                        stats, placed_atoms
+                    )
+                    attempts += void_attempts
+    except BaseException:
+        # 被中断时保存最后一次回调时的进度（此后写入的原子还没有完整插入网格）
+        if checkpointer is not None:
+            checkpointer.save()
+        raise
+    finally:
+        if trajectory_writer is not None:
+            trajectory_writer.close()
     
-    while placed_atoms < num_atoms and attempts < max_attempts:
-        # 检查是否需要启用ML辅助（当尝试次数过多时）
-        if use_ml_assisted_placement and attempts > placed_atoms * 50:
-            ml_assisted_triggered = True
+    if placed_atoms < num_atoms:
+        if switched:
+            reason = (f"改用空隙跟踪方式后仍只放置了 {placed_atoms}/{num_atoms} 个原子，已达到随机序列吸附的饱和密度，"
+                      f"请降低密度或改用 placement_strategy=\"relax\"")
+        elif budget is not None and budget.stalled:
+            reason = (f"接受率过低，放置在 {attempts} 次尝试后停滞（已放置 {placed_atoms}/{num_atoms} 个原子），"
+                      f"可改用 placement_strategy=\"void\" 或 \"relax\"")
+        else:
+            reason = f"无法在 {attempts} 次尝试内放置所有原子"
+        if checkpointer is not None:
+            checkpointer.save(placed_atoms)
+            raise RuntimeError(f"{reason}，已放置的原子保存在检查点 {checkpoint} 中，可用resume_random_structure继续")
+        raise RuntimeError(f"{reason}，请检查参数设置")
+    
+    compact = isinstance(positions, np.memmap)
+    if type_counts is not None and placement_strategy != "relax":
+        # 放置过程中确定的类型转换为与逐个分配时相同的形式
+        atom_types, element_types = _type_sequences(atom_types, elements, compact)
+    
+    if compact:
+        positions.flush()
+    if stats is not None:
+        stats.timings["total"] = sum(stats.timings.values())
+    if progress is True:
+        print()  # 换行
+    return positions, box_size, atom_types, element_types
+
+def generate_random_structure(
+    num_atoms: int,
+    density: float,
+    min_distance: Union[float, Dict[Tuple[str, str], float]] = 1.0,
+    element_ratios: Dict[str, float] = None,
+    generate_trajectory: Union[bool, "TrajectoryWriter"] = False,  # 添加轨迹生成开关参数
+    use_ml_assisted_placement: bool = False,  # 添加ML辅助放置开关
+    batch_size: int = None,  # 批量候选模式的每批候选数
+    seed=None,  # 随机数种子
+    placement_strategy: str = "rsa",  # 放置策略
+    box_shape: List[float] = None,  # 盒子形状
+    progress: Union[bool, Callable[[int, int], None]] = True,  # 进度显示
+    stats: GenerationStats = None,  # 统计信息
+    positions_file: str = None,  # 坐标内存映射文件
+    checkpoint: str = None,  # 检查点文件
+    checkpoint_interval: float = 60.0,  # 检查点间隔（秒）
+    check_feasibility: bool = True,  # 预先检查堆积分数
+    on_stall: Optional[str] = "raise"  # 放置停滞时的处理方式
+) -> Tuple[np.ndarray, List[float], List[int], List[str]]:
+    """
+    生成满足特定数密度的随机原子结构（使用空间粗粒化优化）
+    
+    参数:
+    num_atoms: 原子数量
+    density: 数密度 (atoms per cubic unit)
+    min_distance: 原子间最小距离；也可以按元素对给出，例如 {("Fe", "Fe"): 2.2, ("Fe", "B"): 1.8, ("B", "B"): 1.6}
+                  （见 _cutoff_matrix），此时每个候选点按剩余原子数的比例抽取元素，并按元素对检查距离
+    element_ratios: 元素类型及其比例，例如 {"Ti": 0.5, "Al": 0.5}
+    generate_trajectory: 是否生成轨迹文件，默认为False；为True时写出约1000帧的generation_trajectory.lammpstrj，
+                         也可以传入TrajectoryWriter实例以控制文件名、抽帧间隔、增量写入和压缩
+    use_ml_assisted_placement: 是否使用ML辅助原子放置，默认为False
+    batch_size: 批量模式下每批生成的候选点数，大于1时启用批量向量化放置，默认为None（逐个放置）
+    seed: 随机数种子（int、np.random.SeedSequence或np.random.Generator），默认为None
+    placement_strategy: 放置策略，"rsa"为随机序列吸附（默认），"void"为跟踪空隙网格的放置方式，
+                        适合接近饱和的高密度（void模式总是批量进行，batch_size为每批活动网格数），
+                        "relax"为一次性放入全部原子后用软球推开重叠，可以超过随机序列吸附的饱和密度
+                        （不使用batch_size和use_ml_assisted_placement）
+    box_shape: 盒子形状 [lx, ly, lz]（正交）或 [lx, ly, lz, xy, xz, yz]（三斜，LAMMPS倾斜因子），
+               整体缩放到满足数密度，默认为None（立方盒子）；void模式只支持正交盒子
+    progress: 进度显示，True为在命令行显示百分比（默认），False为不显示，也可以传入回调函数
+              progress(placed_atoms, num_atoms)，每批放置后调用
+    stats: 可选的GenerationStats实例，生成过程中填充尝试次数、拒绝统计、各阶段耗时等；
+           默认为None（不做统计，没有额外开销）
+    positions_file: 坐标文件路径，给出时坐标直接写入该文件的np.memmap（float64，num_atoms x 3，按行存放），
+                    原子类型以int8/int16数组、元素名称以ElementTypes返回，给定种子时结果与默认模式相同。
+                    这只把坐标和类型移出常驻内存，CellList的网格索引仍在内存中（约 4 + 16 * 网格数/原子数
+                    字节/原子，数密度0.4时约45字节/原子，见CellList），因此峰值内存与原子数成正比，
+                    约为坐标大小的两倍，并不是完全的外存生成。relax模式需要整体的临时数组，不适合此用途
+    checkpoint: 检查点文件路径（.npz），给出时每隔checkpoint_interval秒保存已放置的原子和随机数生成器状态，
+                尝试次数用尽或被中断（异常、KeyboardInterrupt）时也会保存，之后可用resume_random_structure
+                继续生成；默认为None（不保存）。relax模式不支持检查点
+    checkpoint_interval: 两次保存检查点之间的最小间隔（秒）
+    check_feasibility: 是否在开始前按堆积分数估计可行性（见estimate_feasibility），超过所选策略的上限时
+                       直接抛出ValueError，而不是在用完 num_atoms * 1000 次尝试后才失败，默认为True
+    on_stall: 随机序列吸附的接受率低到无法在剩余尝试次数内完成时（见AttemptBudget）的处理方式：
+              "raise"（默认）立即抛出RuntimeError；"switch"从已放置的原子开始改用空隙跟踪方式继续并发出
+              RuntimeWarning（结果的统计性质与随机序列吸附不同；三斜盒子不能切换，直接失败）；
+              None为不做判断、用完全部尝试次数
+    返回:
+    positions: 原子坐标 (num_atoms x 3)
+    box_size: 盒子尺寸 [lx, ly, lz]，三斜盒子为 [lx, ly, lz, xy, xz, yz]
+    atom_types: 原子类型列表
+    element_types: 元素类型名称列表
+    """
+    
+    if placement_strategy not in ("rsa", "void", "relax"):
+        raise ValueError(f"未知的放置策略: {placement_strategy}")
+    if checkpoint is not None and placement_strategy == "relax":
+        raise ValueError("relax模式不支持检查点")
+    if on_stall not in ("switch", "raise", None):
+        raise ValueError(f"未知的停滞处理方式: {on_stall}")
+    if check_feasibility:
+        estimate = estimate_feasibility(density, min_distance, element_ratios, placement_strategy, num_atoms)
+        if not estimate.feasible:
+            raise ValueError(estimate.message)
+    
+    if stats is not None:
+        stats.begin(num_atoms, placement_strategy)
+        phase = stats.phase
+    else:
+        phase = lambda name: contextlib.nullcontext()
+    
+    with phase("setup"):
+        # 根据数密度计算盒子大小
+        volume = num_atoms / density
+        if box_shape is None:
+            box_length = volume**(1/3)
+            box_size = [box_length, box_length, box_length]
+        else:
+            if len(box_shape) not in (3, 6):
+                raise ValueError("box_shape应为 [lx, ly, lz] 或 [lx, ly, lz, xy, xz, yz]")
+            if placement_strategy == "void" and _is_triclinic(box_shape):
+                raise ValueError("void模式只支持正交盒子")
+            # 盒子体积为 lx*ly*lz（倾斜因子不改变体积），整体缩放即可
+            scale = (volume / np.prod(box_shape[:3]))**(1/3)
+            box_size = [float(length * scale) for length in box_shape]
         
-        # 根据是否使用ML辅助来选择放置策略
-        if ml_assisted_triggered:
-            # 使用简单的低密度区域选择
-            min_density = np.min(grid_density)
-            low_density_indices = np.where(grid_density == min_density)
-            if len(low_density_indices[0]) > 0:
-                # 随机选择一个低密度网格
-                idx = random.randint(0, len(low_density_indices[0])-1)
-                grid_x = low_density_indices[0][idx]
-                grid_y = low_density_indices[1][idx]
-                grid_z = low_density_indices[2][idx]
-            else:
-                # 如果找不到，随机选择一个网格
-                grid_x, grid_y, grid_z = random.randint(0, nx-1), random.randint(0, ny-1), random.randint(0, nz-1)
+        # 初始化坐标数组
+        positions = _allocate_positions(num_atoms, positions_file)
+        
+        # 所有随机数都来自同一个NumPy随机数生成器，保证给定种子时结果可复现
+        rng = np.random.default_rng(seed)
+        
+        # 原子类型按放置顺序依次取自打乱后的分布
+        atom_types, element_types = _assign_atom_types(num_atoms, element_ratios, rng,
+                                                       compact=positions_file is not None)
+        
+        # 按元素对给出最小距离时，类型在放置过程中按剩余原子数抽取，网格按最大截断距离划分
+        elements = list(element_ratios) if element_ratios is not None else ["Ti"]
+        type_counts = None
+        if not np.isscalar(min_distance):
+            min_distance = _cutoff_matrix(min_distance, elements)
+            type_counts = np.bincount(atom_types, minlength=len(elements) + 1)
+        
+        # 空间粗粒化优化设置
+        # 网格宽度不小于min_distance，因此只需检查邻居偏移模板中的相邻网格
+        cell_list = CellList(positions, box_size, min_distance, track_density=(placement_strategy == "rsa"))
+        
+        settings = dict(num_atoms=num_atoms, placement_strategy=placement_strategy, batch_size=batch_size,
+                        use_ml_assisted_placement=use_ml_assisted_placement, on_stall=on_stall)
+    
+    return _complete_structure(positions, box_size, cell_list, rng, atom_types, element_types, elements,
+                               type_counts, settings, 0, progress, stats, phase, generate_trajectory,
+                               checkpoint, checkpoint_interval)
+
+def resume_random_structure(
+    checkpoint: str,
+    placement_strategy: str = None,
+    batch_size: int = None,
+    progress: Union[bool, Callable[[int, int], None]] = True,
+    stats: GenerationStats = None,
+    positions_file: str = None,
+    checkpoint_interval: float = 60.0
+) -> Tuple[np.ndarray, List[float], List[int], List[str]]:
+    """
+    从检查点文件继续生成结构
+
+    由检查点中的原子重建网格，恢复随机数生成器的状态，继续放置剩余原子，并继续向同一个
+    检查点文件保存进度。续算得到的结构同样满足最小距离要求，但与不中断时生成的结构不完全相同。
+    因尝试次数用尽而失败的生成也可以续算（重新获得 num_atoms * 1000 次尝试），还可以换用
+    其他放置策略，例如接近饱和时改用"void"。
+
+    参数:
+    checkpoint: generate_random_structure(checkpoint=...) 或 extend_structure 写出的检查点文件
+    placement_strategy: 续算使用的放置策略，"rsa"或"void"，默认为None（与原来相同）
+    batch_size: 续算使用的每批候选点数，默认为None（与原来相同）
+    progress: 进度显示，同generate_random_structure
+    stats: 可选的GenerationStats，记录续算部分的统计信息
+    positions_file: 坐标内存映射文件，同generate_random_structure
+    checkpoint_interval: 保存检查点的最小间隔（秒）
+
+    返回:
+    与generate_random_structure相同
+    """
+    data = _load_checkpoint(checkpoint)
+    settings = data["settings"]
+    if placement_strategy is not None:
+        settings["placement_strategy"] = placement_strategy
+    if batch_size is not None:
+        settings["batch_size"] = batch_size
+    placement_strategy = settings["placement_strategy"]
+    num_atoms = settings["num_atoms"]
+    box_size = data["box_size"]
+    if placement_strategy not in ("rsa", "void"):
+        raise ValueError(f"续算不支持的放置策略: {placement_strategy}")
+    if placement_strategy == "void" and _is_triclinic(box_size):
+        raise ValueError("void模式只支持正交盒子")
+    
+    if stats is not None:
+        stats.begin(num_atoms, placement_strategy)
+        phase = stats.phase
+    else:
+        phase = lambda name: contextlib.nullcontext()
+    
+    with phase("setup"):
+        placed_atoms = len(data["positions"])
+        positions = _allocate_positions(num_atoms, positions_file)
+        positions[:placed_atoms] = data["positions"]
+        rng = data["rng"]
+        elements = data["elements"]
+        cell_list = CellList(positions, box_size, data["cutoff"], track_density=(placement_strategy == "rsa"))
+        if data["type_totals"] is not None:
+            cell_list.types[:placed_atoms] = data["atom_types"]
+            type_counts = data["type_totals"] - np.bincount(data["atom_types"], minlength=len(data["type_totals"]))
+            atom_types, element_types = None, None
         else:
-            # 优化策略：70%概率选择低密度区域，30%随机选择
-            if random.random() < 0.7:
-                # 找到密度最低的网格区域
-                min_density = np.min(grid_density)
-                low_density_indices = np.where(grid_density == min_density)
-                if len(low_density_indices[0]) > 0:
-                    # 随机选择一个低密度网格
-                    idx = random.randint(0, len(low_density_indices[0])-1)
-                    grid_x = low_density_indices[0][idx]
-                    grid_y = low_density_indices[1][idx]
-                    grid_z = low_density_indices[2][idx]
-                else:
-                    # 如果找不到，随机选择一个网格
-                    grid_x, grid_y, grid_z = random.randint(0, nx-1), random.randint(0, ny-1), random.randint(0, nz-1)
-            else:
-                # 随机选择一个网格
-                grid_x, grid_y, grid_z = random.randint(0, nx-1), random.randint(0, ny-1), random.randint(0, nz-1)
+            type_counts = None
+            atom_types, element_types = _type_sequences(data["atom_types"], elements, positions_file is not None)
+        cell_list.insert(np.arange(placed_atoms))
+    
+    return _complete_structure(positions, box_size, cell_list, rng, atom_types, element_types, elements,
+                               type_counts, settings, placed_atoms, progress, stats, phase,
+                               checkpoint=checkpoint, checkpoint_interval=checkpoint_interval)
+
+def _structure_elements(atom_types, element_types) -> Tuple[np.ndarray, List[str]]:
+    """
+    已有结构的类型编号与元素的对应关系
+
+    参数:
+    atom_types: 原子类型编号
+    element_types: 元素名称
+
+    返回:
+    类型编号数组 (N,) 和按类型编号排列的元素列表（结构中没有出现的编号记为"type<编号>"）
+    """
+    atom_types = np.asarray(atom_types, dtype=np.int64)
+    unique_types, first_index = np.unique(atom_types, return_index=True)
+    type_to_element = {int(type_id): element_types[index] for type_id, index in zip(unique_types, first_index)}
+    num_types = int(unique_types.max()) if len(atom_types) > 0 else 0
+    return atom_types, [type_to_element.get(type_id, f"type{type_id}") for type_id in range(1, num_types + 1)]
+
+def extend_structure(
+    structure,
+    num_new_atoms: int,
+    min_distance: Union[float, Dict[Tuple[str, str], float]] = 1.0,
+    element_ratios: Dict[str, float] = None,
+    use_ml_assisted_placement: bool = False,
+    batch_size: int = None,
+    seed=None,
+    placement_strategy: str = "rsa",
+    progress: Union[bool, Callable[[int, int], None]] = True,
+    stats: GenerationStats = None,
+    positions_file: str = None,
+    checkpoint: str = None,
+    checkpoint_interval: float = 60.0,
+    on_stall: Optional[str] = "raise"
+) -> Tuple[np.ndarray, List[float], List[int], List[str]]:
+    """
+    在已有结构的盒子中继续加入原子
+
+    已有原子保持不动并插入网格，新原子按与generate_random_structure相同的方式放置，只需满足
+    与全部原子（包括已有原子）之间的最小距离。新元素排在已有元素之后编号，已有原子的类型
+    编号不变。用于由小结构逐步加密得到大结构，而不必每次从头生成。
+
+    参数:
+    structure: save_lammps_data写出的LAMMPS数据文件路径，或 (positions, box_size, atom_types, element_types)
+    num_new_atoms: 新加入的原子数
+    min_distance: 最小距离，或按元素对给出（需要包含已有元素和新元素之间的所有元素对）
+    element_ratios: 新原子的元素比例，可以包含结构中没有的元素，默认为None（全部为Ti）
+    use_ml_assisted_placement: 是否使用ML辅助原子放置
+    batch_size: 批量模式下每批生成的候选点数
+    seed: 随机数种子
+    placement_strategy: 放置策略，"rsa"或"void"（relax模式会移动已有原子，不支持）
+    progress: 进度显示，同generate_random_structure
+    stats: 可选的GenerationStats
+    positions_file: 坐标内存映射文件，同generate_random_structure
+    checkpoint: 检查点文件，同generate_random_structure
+    checkpoint_interval: 保存检查点的最小间隔（秒）
+    on_stall: 随机序列吸附停滞时的处理方式，同generate_random_structure
+
+    返回:
+    positions: 原子坐标，前面是已有原子，顺序不变
+    box_size: 盒子尺寸（与已有结构相同）
+    atom_types: 原子类型列表
+    element_types: 元素类型名称列表
+    """
+    if isinstance(structure, (str, os.PathLike)):
+        structure = load_lammps_data(os.fspath(structure))
+    old_positions, box_size, old_types, old_elements = structure
+    if placement_strategy not in ("rsa", "void"):
+        raise ValueError(f"extend_structure不支持的放置策略: {placement_strategy}")
+    if on_stall not in ("switch", "raise", None):
+        raise ValueError(f"未知的停滞处理方式: {on_stall}")
+    if placement_strategy == "void" and _is_triclinic(box_size):
+        raise ValueError("void模式只支持正交盒子")
+    num_old = len(old_positions)
+    num_atoms = num_old + num_new_atoms
+    
+    if stats is not None:
+        stats.begin(num_atoms, placement_strategy)
+        phase = stats.phase
+    else:
+        phase = lambda name: contextlib.nullcontext()
+    
+    with phase("setup"):
+        # 新元素依次编在已有元素后面
+        old_types, elements = _structure_elements(old_types, old_elements)
+        new_elements = list(element_ratios) if element_ratios is not None else ["Ti"]
+        elements += [element for element in new_elements if element not in elements]
+        global_type = np.array([0] + [elements.index(element) + 1 for element in new_elements])
         
-        # 在选定的网格内随机生成新原子位置
-        x = random.uniform(grid_x * grid_size, min((grid_x + 1) * grid_size, box_length))
-        y = random.uniform(grid_y * grid_size, min((grid_y + 1) * grid_size, box_length))
-        z = random.uniform(grid_z * grid_size, min((grid_z + 1) * grid_size, box_length))
-        new_pos = np.array([x, y, z])
+        rng = np.random.default_rng(seed)
+        new_types, _ = _assign_atom_types(num_new_atoms, element_ratios, rng, compact=True)
+        new_types = global_type[new_types]
         
-        # 检查是否与相邻网格中的原子满足最小距离要求（考虑周期性边界条件）
-        valid_position = True
-        current_grid = get_grid_coords(new_pos)
-        neighbor_grids = get_neighboring_grids(current_grid)
+        positions = _allocate_positions(num_atoms, positions_file)
+        positions[:num_old] = old_positions
+        type_counts = None
+        if not np.isscalar(min_distance):
+            min_distance = _cutoff_matrix(min_distance, elements)
+            type_counts = np.bincount(new_types, minlength=len(elements) + 1)
+        cell_list = CellList(positions, list(box_size), min_distance, track_density=(placement_strategy == "rsa"))
+        if type_counts is not None:
+            cell_list.types[:num_old] = old_types
+            atom_types, element_types = None, None
+        else:
+            atom_types, element_types = _type_sequences(np.concatenate([old_types, new_types]), elements,
+                                                        positions_file is not None)
+        cell_list.insert(np.arange(num_old))
         
-        for grid_coord in neighbor_grids:
-            for atom_idx in grid.get(grid_coord, []):
-                distance = calculate_periodic_distance(new_pos, positions[atom_idx], box_size)
-                if distance < min_distance:
-                    valid_position = False
+        settings = dict(num_atoms=num_atoms, placement_strategy=placement_strategy, batch_size=batch_size,
+                        use_ml_assisted_placement=use_ml_assisted_placement, on_stall=on_stall)
+    
+    return _complete_structure(positions, list(box_size), cell_list, rng, atom_types, element_types, elements,
+                               type_counts, settings, num_old, progress, stats, phase,
+                               checkpoint=checkpoint, checkpoint_interval=checkpoint_interval)
+
+class MoleculeTemplate(NamedTuple):
+    """刚性分子（或原子团簇）模板"""
+    elements: Tuple[str, ...]  # 各原子的元素
+    coordinates: np.ndarray  # 各原子相对于几何中心的坐标 (k x 3)
+
+def molecule_template(elements: Sequence[str], coordinates) -> MoleculeTemplate:
+    """
+    由元素和坐标构造分子模板，坐标平移到以几何中心为原点
+
+    参数:
+    elements: 各原子的元素
+    coordinates: 各原子的坐标 (k x 3)
+
+    返回:
+    MoleculeTemplate
+    """
+    coordinates = np.array(coordinates, dtype=float).reshape(-1, 3)
+    if len(coordinates) != len(elements) or len(coordinates) == 0:
+        raise ValueError("分子模板的元素数与坐标数不一致")
+    return MoleculeTemplate(tuple(elements), coordinates - coordinates.mean(axis=0))
+
+def _icosahedron(edge: float) -> np.ndarray:
+    """正二十面体的顶点坐标（棱长为edge）"""
+    golden = (1 + np.sqrt(5)) / 2
+    vertices = [np.roll([0.0, a, b * golden], shift) for shift in range(3) for a in (-1, 1) for b in (-1, 1)]
+    return np.array(vertices) * edge / 2
+
+# 常用分子的平衡几何（Å）；B12为α-硼中的正二十面体团簇
+MOLECULES = {
+    "H2O": molecule_template(("O", "H", "H"), [[0.0, 0.0, 0.0], [0.9572, 0.0, 0.0],
+                                              [0.9572 * np.cos(np.radians(104.52)),
+                                               0.9572 * np.sin(np.radians(104.52)), 0.0]]),
+    "CO2": molecule_template(("C", "O", "O"), [[0.0, 0.0, 0.0], [1.16, 0.0, 0.0], [-1.16, 0.0, 0.0]]),
+    "CH4": molecule_template(("C", "H", "H", "H", "H"),
+                             [[0.0, 0.0, 0.0]] + (1.09 / np.sqrt(3) * np.array(
+                                 [[1, 1, 1], [1, -1, -1], [-1, 1, -1], [-1, -1, 1]])).tolist()),
+    "N2": molecule_template(("N", "N"), [[0.0, 0.0, 0.0], [1.098, 0.0, 0.0]]),
+    "B12": molecule_template(("B",) * 12, _icosahedron(1.77)),
+}
+
+def _random_rotations(rng: np.random.Generator, size: int) -> np.ndarray:
+    """
+    均匀分布的随机转动矩阵（由均匀分布的单位四元数得到）
+
+    参数:
+    rng: 随机数生成器
+    size: 矩阵个数
+
+    返回:
+    转动矩阵 (size x 3 x 3)
+    """
+    u1, u2, u3 = rng.random((3, size))
+    x = np.sqrt(1 - u1) * np.sin(2 * np.pi * u2)
+    y = np.sqrt(1 - u1) * np.cos(2 * np.pi * u2)
+    z = np.sqrt(u1) * np.sin(2 * np.pi * u3)
+    w = np.sqrt(u1) * np.cos(2 * np.pi * u3)
+    return np.stack([
+        np.stack([1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)], axis=-1),
+        np.stack([2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)], axis=-1),
+        np.stack([2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)], axis=-1),
+    ], axis=1)
+
+def insert_molecules(
+    molecules: Dict[str, int],
+    structure=None,
+    box_size: List[float] = None,
+    min_distance: Union[float, Dict[Tuple[str, str], float]] = 1.0,
+    templates: Dict[str, MoleculeTemplate] = None,
+    batch_size: int = 64,
+    max_attempts: int = 100000,
+    seed=None,
+    progress: Union[bool, Callable[[int, int], None]] = True
+) -> Tuple[np.ndarray, List[float], List[int], List[str], np.ndarray]:
+    """
+    在盒子中随机插入刚性分子（或原子团簇）
+
+    分子逐个放置：每次尝试同时生成一批随机取向和随机位置，模板的全部原子在网格中一次性
+    向量化检查，接受这一批中第一个所有原子都满足最小距离的姿态。这一批都失败时下一批的
+    大小加倍（不超过batch_size），第一个姿态就成功时减半，低密度时不会做多余的检查。
+    最小距离只对不同分子（以及已有原子）之间的原子对检查，分子内部的键长由模板决定。
+    原子多的分子先放置，整体结构中的空腔越来越小时只剩下小分子需要放置。
+
+    参数:
+    molecules: 分子名称到个数的字典，例如 {"H2O": 500, "CO2": 50}；名称在templates或MOLECULES中查找
+    structure: 已有结构（LAMMPS数据文件路径或 (positions, box_size, atom_types, element_types)），
+               已有原子保持不动，默认为None（空盒子）
+    box_size: 没有已有结构时的盒子尺寸 [lx, ly, lz] 或 [lx, ly, lz, xy, xz, yz]
+    min_distance: 最小距离，或按元素对给出（需要包含所有元素对）
+    templates: 自定义的分子模板（名称到MoleculeTemplate），与MOLECULES同名时优先使用
+    batch_size: 每次尝试的最大姿态数
+    max_attempts: 每个分子最多尝试的姿态数，超过时报错
+    seed: 随机数种子
+    progress: 进度显示，同generate_random_structure（按插入的原子数计）
+
+    返回:
+    positions: 原子坐标，前面是已有原子，同一分子的原子连续排列
+    box_size: 盒子尺寸
+    atom_types: 原子类型列表（已有元素的编号不变，新元素依次编在后面）
+    element_types: 元素类型名称列表
+    molecule_ids: 分子编号 (N,)，已有原子为0，可以直接传给 save_lammps_data(atom_style="full")
+    """
+    templates = {**MOLECULES, **(templates or {})}
+    unknown = [name for name in molecules if name not in templates]
+    if unknown:
+        raise ValueError(f"未知的分子: {unknown}")
+    if structure is not None:
+        if isinstance(structure, (str, os.PathLike)):
+            structure = load_lammps_data(os.fspath(structure))
+        old_positions, box_size, old_types, old_elements = structure
+    elif box_size is None:
+        raise ValueError("没有已有结构时需要给出box_size")
+    else:
+        old_positions, old_types, old_elements = np.empty((0, 3)), [], []
+    box_size = list(box_size)
+    old_types, elements = _structure_elements(old_types, old_elements)
+    
+    # 原子多的分子先放置
+    names = sorted((name for name in molecules if molecules[name] > 0),
+                   key=lambda name: -len(templates[name].elements))
+    for element in (element for name in names for element in templates[name].elements):
+        if element not in elements:
+            elements.append(element)
+    template_types = {name: np.array([elements.index(element) + 1 for element in templates[name].elements])
+                      for name in names}
+    
+    num_old = len(old_positions)
+    num_new = sum(molecules[name] * len(templates[name].elements) for name in names)
+    num_atoms = num_old + num_new
+    positions = np.empty((num_atoms, 3))
+    positions[:num_old] = old_positions
+    atom_types = np.zeros(num_atoms, dtype=np.int64)
+    atom_types[:num_old] = old_types
+    molecule_ids = np.zeros(num_atoms, dtype=np.int64)
+    
+    pairwise = not np.isscalar(min_distance)
+    if pairwise:
+        min_distance = _cutoff_matrix(min_distance, elements)
+    cell_list = CellList(positions, box_size, min_distance)
+    if pairwise:
+        cell_list.types[:num_old] = old_types
+    cell_list.insert(np.arange(num_old))
+    
+    rng = np.random.default_rng(seed)
+    placed, molecule_id, trials = num_old, 0, 1
+    for name in names:
+        coordinates, types = templates[name].coordinates, template_types[name]
+        size = len(types)
+        for _ in range(molecules[name]):
+            attempts = 0
+            while True:
+                if attempts >= max_attempts:
+                    raise RuntimeError(f"尝试 {attempts} 个姿态后仍无法插入第 {molecule_id + 1} 个分子 ({name})，"
+                                       f"请降低密度或最小距离")
+                # 一批姿态的全部原子一次检查
+                centers = _cartesian(rng.random((trials, 3)), box_size)
+                poses = centers[:, None, :] + np.einsum('kij,aj->kai', _random_rotations(rng, trials), coordinates)
+                fractions = _fractional(poses, box_size)
+                poses = _cartesian(fractions - np.floor(fractions), box_size)
+                conflict = cell_list.has_conflict(poses.reshape(-1, 3),
+                                                  types=np.tile(types, trials) if pairwise else None)
+                valid = np.flatnonzero(~conflict.reshape(trials, size).any(axis=1))
+                attempts += trials
+                if len(valid) > 0:
                     break
-            if not valid_position:
-                break
-        
-        # 如果位置有效，则添加该原子
-        if valid_position:
-            positions[placed_atoms] = new_pos
-            element_type = atom_distribution[placed_atoms]
-            atom_types.append(element_to_type[element_type])
-            element_types.append(element_type)
-            placed_atoms += 1
+                trials = min(batch_size, trials * 2)
+            if valid[0] == 0:
+                trials = max(1, trials // 2)
             
-            # 更新网格系统
-            current_grid = get_grid_coords(new_pos)
-            grid[current_grid].append(placed_atoms - 1)  # 存储索引
-            grid_density[grid_x, grid_y, grid_z] += 1
+            indices = np.arange(placed, placed + size)
+            positions[indices] = poses[valid[0]]
+            atom_types[indices] = types
+            molecule_id += 1
+            molecule_ids[indices] = molecule_id
+            if pairwise:
+                cell_list.types[indices] = types
+            cell_list.insert(indices)
             
-            # 如果需要生成轨迹，则保存当前构型作为轨迹的一帧
-            if generate_trajectory:
-                save_lammps_trajectory("generation_trajectory.lammpstrj", 
-                                     positions[:placed_atoms], box_size, 
-                                     atom_types, element_types, placed_atoms, num_atoms)
-            
-            # 显示进度
-            if placed_atoms % max(1, num_atoms // 100) == 0 or placed_atoms == num_atoms:
-                progress = placed_atoms / num_atoms * 100
-                sys.stdout.write(f'\r结构生成进度: {progress:.1f}% ({placed_atoms}/{num_atoms} 原子)')
-                sys.stdout.flush()
-            
-        attempts += 1
-    
-    if placed_atoms < num_atoms:
-        raise RuntimeError(f"无法在 {attempts} 次尝试内放置所有原子，请检查参数设置")
+            if progress is True:
+                _report_progress(placed - num_old, placed + size - num_old, num_new)
+            elif progress:
+                progress(placed + size - num_old, num_new)
+            placed += size
     
-    print()  # 换行
-    return positions, box_size, atom_types, element_types
+    if progress is True and num_new > 0:
+        print()  # 换行
+    atom_types, element_types = _type_sequences(atom_types, elements, False)
+    return positions, box_size, atom_types, element_types, molecule_ids
 
 def calculate_periodic_distance(pos1: np.ndarray, pos2: np.ndarray, box_size: List[float]) -> float:
     """
-    计算考虑周期性边界条件的两点间距离
+    计算考虑周期性边界条件的两点间距离（批量计算请使用periodic_distances）
     
     参数:
     pos1: 第一个点的坐标
     pos2: 第二个点的坐标
-    box_size: 盒子尺寸 [lx, ly, lz]
+    box_size: 盒子尺寸 [lx, ly, lz] 或 [lx, ly, lz, xy, xz, yz]
     
     返回:
     考虑周期性边界条件的最小距离
     """
-    delta = np.abs(pos1 - pos2)
-    
-    # 应用周期性边界条件：如果距离超过盒子尺寸的一半，则使用镜像距离
-    for i in range(3):
-        if delta[i] > 0.5 * box_size[i]:
-            delta[i] = box_size[i] - delta[i]
-    
-    return np.sqrt(np.sum(delta**2))
+    return float(periodic_distances(pos1, pos2, box_size))
 
-def save_lammps_data(filename: str, positions: np.ndarray, box_size: List[float], atom_types: List[int], element_types: List[str]):
+# 各原子格式在Atoms部分的列顺序（LAMMPS data文件）
+ATOM_STYLE_COLUMNS = {
+    "atomic": ("id", "type", "x", "y", "z"),
+    "charge": ("id", "type", "q", "x", "y", "z"),
+    "full": ("id", "mol", "type", "q", "x", "y", "z"),
+}
+
+def save_lammps_data(filename: str, positions: np.ndarray, box_size: List[float], atom_types: List[int],
+                     element_types: List[str], atom_style: str = "atomic",
+                     charges: Union[Dict[str, float], np.ndarray] = None, molecule_ids: np.ndarray = None,
+                     compression: str = None, chunk_size: int = 1 << 15):
     """
     将原子结构保存为LAMMPS的data格式
     
+    Atoms部分按列用NumPy批量格式化，并以大块写入，可直接写出gzip/zstd压缩文件。
+    各列按块取出，坐标可以是np.memmap，临时内存只与chunk_size有关（默认每块约5 MB；块小时
+    格式化的中间数组留在CPU缓存中，也比大块更快）
+    
     参数:
-    filename: 输出文件名
+    filename: 输出文件名（扩展名为 .gz / .zst 时自动压缩）
     positions: 原子坐标
     box_size: 盒子尺寸
     atom_types: 原子类型列表
     element_types: 元素类型名称列表
+    atom_style: LAMMPS原子格式，"atomic"（默认）、"charge"或"full"
+    charges: 电荷，可以是按元素给出的字典（如 {"Fe": 0.0, "B": 0.0}）或每个原子的电荷数组，默认为0
+    molecule_ids: 每个原子的分子编号（仅full格式使用），默认为0（不属于任何分子）
+    compression: 压缩格式，None、"gzip"或"zstd"；为None时按扩展名自动判断
+    chunk_size: 每次格式化并写入的原子数
     """
+    if atom_style not in ATOM_STYLE_COLUMNS:
+        raise ValueError(f"不支持的原子格式: {atom_style}")
+    
     num_atoms = len(positions)
-    unique_elements = list(dict.fromkeys(element_types))  # 保持顺序的去重
-    unique_atom_types = list(set(atom_types))
+    if atom_style == "full" and molecule_ids is not None:
+        molecule_ids = np.asarray(molecule_ids)
+    if charges is not None and not isinstance(charges, dict):
+        charges = np.asarray(charges, dtype=float)
+    
+    # 由原子类型编号和元素名称的对应关系确定每个类型的元素，保证Masses与Atoms中的类型编号一致；
+    # 按块扫描，不为全部原子创建整数数组（atom_types可能是紧凑的int8数组）
+    type_to_element = {}
+    for start in range(0, num_atoms, chunk_size):
+        chunk_types, first_index = np.unique(np.asarray(atom_types[start:start + chunk_size]), return_index=True)
+        for type_id, index in zip(chunk_types.tolist(), first_index.tolist()):
+            if type_id not in type_to_element:
+                type_to_element[type_id] = element_types[start + index]
+    num_types = max(type_to_element) if num_atoms > 0 else 0
+    if isinstance(charges, dict):
+        type_charges = np.zeros(num_types + 1)
+        for type_id, element in type_to_element.items():
+            type_charges[type_id] = charges.get(element, 0.0)
+    
+    def chunk_columns(start, stop):
+        # 每块单独取出各列，坐标可以直接来自np.memmap
+        chunk_types = np.asarray(atom_types[start:stop], dtype=np.int64)
+        columns = {"id": np.arange(start + 1, stop + 1), "type": chunk_types,
+                   "x": positions[start:stop, 0], "y": positions[start:stop, 1], "z": positions[start:stop, 2]}
+        if atom_style in ("charge", "full"):
+            if charges is None:
+                columns["q"] = np.zeros(stop - start)
+            elif isinstance(charges, dict):
+                columns["q"] = type_charges[chunk_types]
+            else:
+                columns["q"] = charges[start:stop]
+        if atom_style == "full":
+            columns["mol"] = np.zeros(stop - start, dtype=np.int64) if molecule_ids is None else molecule_ids[start:stop]
+        return columns
     
-    # 创建元素到类型编号的映射，保持与generate_random_structure中一致的顺序
-    element_to_type = {}
-    for i, element in enumerate(unique_elements):
-        element_to_type[element] = i + 1
+    column_names = ATOM_STYLE_COLUMNS[atom_style]
+    decimals = [6 if name in ("q", "x", "y", "z") else 0 for name in column_names]
     
     # 确保文件保存在当前目录下
     if not os.path.isabs(filename):
         filename = os.path.join(os.getcwd(), filename)
     
-    # 使用UTF-8编码打开文件，避免编码错误
-    with open(filename, 'w', encoding='utf-8') as f:
+    header = [
         # 写入文件头
-        f.write(f"LAMMPS data file generated by random-structure.py\n\n")
-        
+        "LAMMPS data file generated by random-structure.py\n\n",
         # 写入原子和原子类型的数量
-        f.write(f"{num_atoms} atoms\n")
-        f.write(f"{len(unique_atom_types)} atom types\n\n")
-        
+        f"{num_atoms} atoms\n",
+        f"{num_types} atom types\n\n",
         # 写入盒子边界
-        f.write(f"0.000000 {box_size[0]:.6f} xlo xhi\n")
-        f.write(f"0.000000 {box_size[1]:.6f} ylo yhi\n")
-        f.write(f"0.000000 {box_size[2]:.6f} zlo zhi\n\n")
-        
-        # 写入质量
-        f.write(f"Masses\n\n")
-        for element, type_id in element_to_type.items():
-            mass = ELEMENT_MASSES.get(element, 1.0)  # 如果找不到元素，使用默认质量1.0
-            f.write(f"{type_id} {mass:.4f}\n")
-        f.write("\n")
-        
-        # 写入原子坐标
-        f.write(f"Atoms\n\n")
-        for i in range(num_atoms):
-            # 在LAMMPS中，原子编号从1开始
-            f.write(f"{i+1} {atom_types[i]} {positions[i, 0]:.6f} {positions[i, 1]:.6f} {positions[i, 2]:.6f}\n")
+        f"0.000000 {box_size[0]:.6f} xlo xhi\n",
+        f"0.000000 {box_size[1]:.6f} ylo yhi\n",
+        f"0.000000 {box_size[2]:.6f} zlo zhi\n",
+    ]
+    if len(box_size) == 6:
+        header.append(f"{box_size[3]:.6f} {box_size[4]:.6f} {box_size[5]:.6f} xy xz yz\n")
+    # 写入质量（如果找不到元素，使用默认质量1.0）
+    header.append("\nMasses\n\n")
+    for type_id in range(1, num_types + 1):
+        # 行尾注释记录元素名称，读取时不必按质量反查（质量相同的元素和未知元素都能正确还原）
+        element = type_to_element.get(type_id)
+        mass = ELEMENT_MASSES.get(element, 1.0)
+        header.append(f"{type_id} {mass:.4f}  # {element}\n" if element is not None else f"{type_id} {mass:.4f}\n")
+    header.append(f"\nAtoms # {atom_style}\n\n")
+    
+    with _open_output(filename, compression) as f:
+        f.write("".join(header).encode('utf-8'))
+        # 写入原子坐标（在LAMMPS中，原子编号从1开始）
+        for start in range(0, num_atoms, chunk_size):
+            columns = chunk_columns(start, min(start + chunk_size, num_atoms))
+            f.write(_format_columns([columns[name] for name in column_names], decimals))
+
+def _element_from_mass(mass: float) -> str:
+    """由质量反查元素名称（save_lammps_data写出4位小数），找不到时返回None"""
+    for element, element_mass in ELEMENT_MASSES.items():
+        if abs(element_mass - mass) < 5e-4:
+            return element
+    return None
+
+# data文件中Atoms段落的标题行，行尾注释为原子格式（如 "Atoms # atomic"）
+_ATOMS_SECTION = re.compile(rb"^[ \t]*Atoms[ \t]*(?:#([^\n]*))?\r?\n", re.M)
+_BLANK = re.compile(rb"\s*")
+
+@contextlib.contextmanager
+def _open_buffer(filename: str):
+    """
+    以只读方式打开文件内容：普通文件使用内存映射，不读入内存；.gz 文件解压到内存
+
+    返回:
+    支持切片和find的缓冲区（mmap或bytes）
+    """
+    if filename.endswith(".gz"):
+        with gzip.open(filename, 'rb') as f:
+            yield f.read()
+        return
+    with open(filename, 'rb') as f:
+        # 空文件不能建立内存映射
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            yield buffer
+
+def _skip_lines(buffer, start: int, num_lines: int, block_size: int = 1 << 24) -> int:
+    """
+    从start开始跳过num_lines行，按块用NumPy查找换行符，不逐行循环
+
+    返回:
+    第num_lines行之后的位置；文件在最后一行没有换行符时为文件末尾，行数不足时为None
+    """
+    position = start
+    while num_lines > 0 and position < len(buffer):
+        count = min(block_size, len(buffer) - position)
+        newlines = np.flatnonzero(np.frombuffer(buffer, dtype=np.uint8, count=count, offset=position) == 10)
+        if len(newlines) >= num_lines:
+            return position + int(newlines[num_lines - 1]) + 1
+        num_lines -= len(newlines)
+        position += count
+    if num_lines == 0:
+        return position
+    # 最后一行没有换行符
+    return len(buffer) if num_lines == 1 and buffer[position - 1:position] not in (b"\n", b"") else None
+
+def _read_rows(buffer, start: int, num_rows: int, num_columns: int = None) -> Tuple[np.ndarray, int]:
+    """
+    把从start开始（跳过前导空行）的num_rows行数值表一次性解析为数组
+
+    参数:
+    buffer: 文件内容（mmap或bytes）
+    start: 起始位置
+    num_rows: 行数
+    num_columns: 列数，默认按第一行的字段数确定
+
+    返回:
+    (num_rows x num_columns) 的浮点数组，以及表格之后的位置
+    """
+    start = _BLANK.match(buffer, start).end()
+    if num_rows == 0:
+        return np.zeros((0, num_columns or 0)), start
+    end = _skip_lines(buffer, start, num_rows)
+    if end is None:
+        raise ValueError(f"数据不完整：应有 {num_rows} 行")
+    if num_columns is None:
+        first_line_end = buffer.find(b"\n", start, end)
+        num_columns = len(buffer[start:end if first_line_end < 0 else first_line_end].split())
+    # 空白分隔的数值由NumPy的C解析器一次性读入
+    values = np.fromstring(buffer[start:end], dtype=np.float64, sep=" ")
+    if len(values) != num_rows * num_columns:
+        raise ValueError(f"数据格式错误：{num_rows} 行 x {num_columns} 列，实际读到 {len(values)} 个数值")
+    return values.reshape(num_rows, num_columns), end
+
+def load_lammps_data(filename: str) -> Tuple[np.ndarray, List[float], List[int], List[str]]:
+    """
+    读取LAMMPS的data格式文件（save_lammps_data写出的文件，或LAMMPS write_data写出的atomic/charge/full格式）
+
+    文件以内存映射方式打开，Atoms部分整体交给NumPy解析，没有逐行的Python循环。
+    元素名称取自Masses部分行尾的注释（如 "1 55.845 # Fe"），没有注释时按质量反查ELEMENT_MASSES，
+    都找不到时记为 "type<编号>"。坐标平移到以盒子下界为原点，原子按编号排序。
+
+    参数:
+    filename: 数据文件路径（扩展名为 .gz 时按gzip读取）
+
+    返回:
+    与generate_random_structure相同的 positions, box_size, atom_types, element_types
+    """
+    num_atoms = None
+    lower, box_size, tilt = np.zeros(3), [0.0, 0.0, 0.0], None
+    type_to_element = {}
+    section = None
+    with _open_buffer(filename) as buffer:
+        match = _ATOMS_SECTION.search(buffer)
+        if match is None:
+            raise ValueError(f"{filename} 不是有效的LAMMPS数据文件（缺少Atoms部分）")
+        atom_style = (match.group(1) or b"").decode('utf-8').strip() or "atomic"
+        # 第一行是标题
+        for line in buffer[:match.start()].decode('utf-8', 'replace').splitlines()[1:]:
+            content, _, comment = line.partition('#')
+            words = content.split()
+            if not words:
+                continue
+            if not words[0][0].isdigit() and words[0][0] not in "+-.":
+                # 段落标题（Masses、Pair Coeffs等）
+                section = words[0]
+                continue
+            if section is None:
+                if words[-1] == "atoms":
+                    num_atoms = int(words[0])
+                elif words[-1] in ("xhi", "yhi", "zhi"):
+                    axis = "xyz".index(words[-1][0])
+                    lower[axis] = float(words[0])
+                    box_size[axis] = float(words[1]) - float(words[0])
+                elif words[-3:] == ["xy", "xz", "yz"]:
+                    tilt = [float(value) for value in words[:3]]
+            elif section == "Masses":
+                element = comment.strip() or _element_from_mass(float(words[1]))
+                type_to_element[int(words[0])] = element or f"type{words[0]}"
+        if num_atoms is None:
+            raise ValueError(f"{filename} 不是有效的LAMMPS数据文件（缺少atoms数量）")
+        if atom_style not in ATOM_STYLE_COLUMNS:
+            raise ValueError(f"不支持的原子格式: {atom_style}")
+
+        # 其后的num_atoms行为原子数据（LAMMPS写出的文件在坐标之后还有镜像标志，之后可能还有Velocities等段落）
+        try:
+            atoms, _ = _read_rows(buffer, match.end(), num_atoms)
+        except ValueError as error:
+            raise ValueError(f"{filename} 中的原子数据不完整或格式错误：{error}") from None
+    columns = ATOM_STYLE_COLUMNS[atom_style]
+    if atoms.shape[1] < len(columns):
+        raise ValueError(f"{filename} 中的原子数据只有 {atoms.shape[1]} 列，{atom_style} 格式需要 {len(columns)} 列")
+    atoms = atoms[:, [columns.index(name) for name in ("id", "type", "x", "y", "z")]]
+
+    atoms = atoms[np.argsort(atoms[:, 0], kind='stable')]
+    positions = atoms[:, 2:5] - lower
+    atom_types = atoms[:, 1].astype(np.int64)
+    # 按类型编号查表得到元素名称，不逐个原子查字典
+    names = np.array([type_to_element.get(type_id, f"type{type_id}")
+                      for type_id in range(int(atom_types.max(initial=0)) + 1)], dtype=object)
+    element_types = names[atom_types].tolist()
+    atom_types = atom_types.tolist()
+    if tilt is not None:
+        box_size = box_size + tilt
+    return positions, box_size, atom_types, element_types
+
+class TrajectoryFrame(NamedTuple):
+    """轨迹中的一帧"""
+    timestep: int
+    box_size: List[float]  # [lx, ly, lz] 或 [lx, ly, lz, xy, xz, yz]
+    ids: np.ndarray  # 原子编号（按文件中的顺序）
+    atom_types: np.ndarray  # 原子类型编号
+    positions: np.ndarray  # 相对盒子下界的坐标 (n x 3)
+
+class TrajectoryReader(Sequence):
+    """
+    LAMMPS轨迹文件（lammpstrj）的随机访问读取器
+
+    打开时在内存映射的文件中查找每一帧 "ITEM: TIMESTEP" 的位置建立索引（只做字节搜索，
+    不解析原子行），之后 reader[i] 只解析第i帧：读取帧头后把原子部分整体交给NumPy解析。
+    可以读取save_lammps_trajectory和TrajectoryWriter写出的文件（包括只写新增原子的增量轨迹），
+    以及包含 id、type、x、y、z 列的其他LAMMPS dump文件。.gz 文件先解压到内存再建立索引。
+    """
+
+    def __init__(self, filename: str):
+        """
+        参数:
+        filename: 轨迹文件路径
+        """
+        self.filename = filename
+        self._context = _open_buffer(filename)
+        self._buffer = self._context.__enter__()
+        offsets = []
+        position = self._buffer.find(b"ITEM: TIMESTEP")
+        while position >= 0:
+            offsets.append(position)
+            position = self._buffer.find(b"ITEM: TIMESTEP", position + 1)
+        self.offsets = np.array(offsets, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, index: int) -> TrajectoryFrame:
+        """
+        解析第index帧（支持负数下标）
+
+        返回:
+        TrajectoryFrame
+        """
+        if self._buffer is None:
+            raise ValueError("轨迹文件已关闭")
+        if not -len(self) <= index < len(self):
+            raise IndexError(f"帧编号 {index} 超出范围（共 {len(self)} 帧）")
+        start = int(self.offsets[index])
+        atoms_item = self._buffer.find(b"ITEM: ATOMS", start)
+        header_end = self._buffer.find(b"\n", atoms_item) + 1 if atoms_item >= 0 else 0
+        if header_end == 0:
+            raise ValueError(f"{self.filename} 第 {index} 帧缺少 ITEM: ATOMS")
+        lines = self._buffer[start:header_end].decode('utf-8').splitlines()
+        timestep, num_atoms = int(lines[1]), int(lines[3])
+        bounds = np.array([line.split() for line in lines[5:8]], dtype=float)
+        if "xy" in lines[4].split():
+            # 由包围盒边界还原三斜盒子的边界（与_trajectory_header相反）
+            xy, xz, yz = bounds[:, 2]
+            lower = bounds[:, 0] - [min(0.0, xy, xz, xy + xz), min(0.0, yz), 0.0]
+            upper = bounds[:, 1] - [max(0.0, xy, xz, xy + xz), max(0.0, yz), 0.0]
+            box_size = (upper - lower).tolist() + [xy, xz, yz]
+        else:
+            lower = bounds[:, 0]
+            box_size = (bounds[:, 1] - lower).tolist()
+        columns = lines[8].split()[2:]
+        missing = {"id", "type", "x", "y", "z"} - set(columns)
+        if missing:
+            raise ValueError(f"{self.filename} 第 {index} 帧缺少列: {sorted(missing)}")
+        try:
+            atoms, _ = _read_rows(self._buffer, header_end, num_atoms, len(columns))
+        except ValueError as error:
+            raise ValueError(f"{self.filename} 第 {index} 帧的原子数据不完整或格式错误：{error}") from None
+        positions = atoms[:, [columns.index(name) for name in ("x", "y", "z")]] - lower
+        return TrajectoryFrame(timestep, box_size, atoms[:, columns.index("id")].astype(np.int64),
+                               atoms[:, columns.index("type")].astype(np.int64), positions)
+
+    def close(self):
+        """关闭内存映射"""
+        if self._buffer is not None:
+            self._buffer = None
+            self._context.__exit__(None, None, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
 if __name__ == "__main__":
     # 示例：生成包含50个原子的结构，数密度为0.05 atoms/unit³，最小距离为1.5
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生成结构的快速分析：邻居列表、最小距离、配位数以及总的和按元素对分解的径向分布函数g(r)
+（使用与生成时相同的周期性网格划分，计算量与原子数成正比，可分块多线程计算）
+@Time: 2026/10/17
+@File: structure_analysis.py
+@Author: Xuerui Wei
+"""
+
+import numpy as np
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+from random_structure import CellList, _minimum_image, _perpendicular_widths
+
+class RadialDistribution(NamedTuple):
+    """径向分布函数的计算结果"""
+    r: np.ndarray  # 各区间中心的距离
+    edges: np.ndarray  # 区间边界（长度为区间数+1）
+    g: np.ndarray  # 总的径向分布函数
+    partial: Dict[Tuple[str, str], np.ndarray]  # 按元素对分解的径向分布函数，键为按类型编号排序的元素对
+    coordination: Dict[Tuple[str, str], np.ndarray]  # 累积配位数：元素A的原子在r以内平均有几个元素B的原子
+
+# 每次同时展开的候选原子对数（所有线程合计）；每对的临时数组约100字节，对应约400 MB的峰值内存
+PAIR_BUDGET = 1 << 22
+
+def _check_cutoff(box_size: List[float], cutoff: float):
+    """最小镜像约定只在截断距离不超过盒子垂直宽度的一半时成立"""
+    half_width = _perpendicular_widths(np.asarray(box_size, dtype=float)).min() / 2
+    if cutoff > half_width:
+        raise ValueError(f"截断距离 {cutoff} 超过盒子最小垂直宽度的一半 {half_width:.4f}")
+
+def _map_pair_chunks(positions: np.ndarray, box_size: List[float], cutoff: float,
+                     func: Callable[[np.ndarray, np.ndarray, np.ndarray], object],
+                     chunk_size: int = None, max_workers: int = None, pair_budget: int = PAIR_BUDGET) -> list:
+    """
+    分块找出距离小于cutoff的原子对，并对每块调用func
+
+    用与生成时相同的CellList划分网格（网格宽度取cutoff的一半，相邻网格的模板更贴近截断球），
+    再把原子按网格编号排序，使每个网格中的原子在数组中连续存放：查询一个网格只需要一段
+    连续的下标，不用沿链表逐个前进，按原子顺序分块时访问的坐标也集中在空间上相邻的区域。
+    每对原子只在排序后编号较小的一方所在的块中出现一次。各块相互独立，用线程池并行计算
+    （大部分时间花在释放GIL的NumPy数组运算上）。
+
+    每块的临时数组（候选原子对的编号、位移和距离）与块内原子数乘以每个原子的候选原子数成正比，
+    后者随数密度和cutoff的三次方增长，同时计算的块数等于线程数。默认的块大小由按网格平均占据数
+    估计的候选原子对数确定，使所有线程同时展开的候选原子对不超过pair_budget，峰值内存与密度和
+    cutoff无关。func 只需返回直方图等小结果，neighbor_list返回的原子对本身仍与原子对总数成正比。
+
+    参数:
+    positions: 原子坐标 (N x 3)
+    box_size: 盒子尺寸 [lx, ly, lz] 或 [lx, ly, lz, xy, xz, yz]
+    cutoff: 截断距离
+    func: func(first, second, distances)，first、second 为原子编号（原始顺序），distances 为对应的距离
+    chunk_size: 每块的原子数，默认为None（按pair_budget确定）
+    max_workers: 线程数，默认为CPU核数
+    pair_budget: 所有线程同时展开的候选原子对数上限（chunk_size为None时使用）
+
+    返回:
+    各块func的返回值列表（按块的顺序）
+    """
+    _check_cutoff(box_size, cutoff)
+    positions = np.asarray(positions, dtype=float)
+    cell_list = CellList(positions, box_size, cutoff, cell_size=cutoff / 2)
+    cells = cell_list.cell_index(positions)
+    order = np.argsort(cells, kind="stable")
+    cells = cells[order]
+    positions = positions[order]
+    # 每个网格中的原子在排序后的数组中占据 [start, end)；最后一个是CellList的空哨兵网格
+    end = np.cumsum(np.bincount(cells, minlength=cell_list.total_cells + 1))
+    start = end - np.bincount(cells, minlength=cell_list.total_cells + 1)
+    
+    workers = 1 if max_workers == 1 else (max_workers or os.cpu_count() or 1)
+    if chunk_size is None:
+        # 每个原子的相邻网格列表加上其中编号更大的原子（平均为相邻网格中原子数的一半）
+        per_atom = len(cell_list.stencil) * (1 + len(positions) / cell_list.total_cells / 2)
+        chunk_size = max(1, int(pair_budget / workers / per_atom))
+
+    def process(chunk_start):
+        chunk_stop = min(chunk_start + chunk_size, len(positions))
+        # 块内原子按网格排好序，相邻网格只需按不同的网格各计算一次
+        chunk_cells, inverse = np.unique(cells[chunk_start:chunk_stop], return_inverse=True)
+        coords = np.stack(np.unravel_index(chunk_cells, cell_list.n_cells), axis=1)
+        neighbors = cell_list.neighbor_cells(coords)[inverse]
+        first = np.arange(chunk_start, chunk_stop)[:, None]
+        # 只取编号更大的原子，每对原子只出现一次，同时去掉原子自身
+        lower = np.maximum(start[neighbors], first + 1).ravel()
+        lengths = np.maximum(end[neighbors].ravel() - lower, 0)
+        first = np.repeat(np.broadcast_to(first, neighbors.shape).ravel(), lengths)
+        second = np.repeat(lower - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        delta = _minimum_image(positions[second] - positions[first], cell_list.box)
+        distances = np.sqrt(np.einsum('ij,ij->i', delta, delta))
+        within = distances < cutoff
+        return func(order[first[within]], order[second[within]], distances[within])
+
+    starts = range(0, len(positions), chunk_size)
+    if workers == 1 or len(starts) <= 1:
+        return [process(chunk_start) for chunk_start in starts]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(process, starts))
+
+def neighbor_list(positions: np.ndarray, box_size: List[float], cutoff: float,
+                  chunk_size: int = None, max_workers: int = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    构造周期性边界条件下的邻居列表
+
+    参数:
+    positions: 原子坐标 (N x 3)
+    box_size: 盒子尺寸 [lx, ly, lz] 或 [lx, ly, lz, xy, xz, yz]
+    cutoff: 截断距离（不超过盒子最小垂直宽度的一半）
+    chunk_size: 每块的原子数，默认按候选原子对数的上限确定（见_map_pair_chunks）
+    max_workers: 线程数，默认为CPU核数
+
+    返回:
+    first, second: 距离小于cutoff的原子对编号（first < second，每对只出现一次）
+    distances: 对应的最小镜像距离
+    """
+    chunks = _map_pair_chunks(positions, box_size, cutoff, lambda *pairs: pairs, chunk_size, max_workers)
+    if not chunks:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+    first, second, distances = (np.concatenate(parts) for parts in zip(*chunks))
+    return np.minimum(first, second), np.maximum(first, second), distances
+
+def _type_indices(atom_types, num_atoms: int) -> Tuple[np.ndarray, int]:
+    """类型编号数组及类型数（atom_types为None时所有原子视为类型1）"""
+    if atom_types is None:
+        return np.ones(num_atoms, dtype=np.int64), 1
+    atom_types = np.asarray(atom_types, dtype=np.int64)
+    return atom_types, int(atom_types.max()) if num_atoms > 0 else 0
+
+def minimum_distances(positions: np.ndarray, box_size: List[float], atom_types=None, cutoff: float = None,
+                      chunk_size: int = None, max_workers: int = None) -> np.ndarray:
+    """
+    计算各元素对之间的最小距离
+
+    参数:
+    positions: 原子坐标 (N x 3)
+    box_size: 盒子尺寸
+    atom_types: 原子类型编号（从1开始），默认为None（所有原子同一类型）
+    cutoff: 搜索半径，默认为平均原子间距的2倍（不超过盒子最小垂直宽度的一半）；
+            在搜索半径内没有原子对的元素对，最小距离记为inf
+    chunk_size: 每块的原子数，默认按候选原子对数的上限确定（见_map_pair_chunks）
+    max_workers: 线程数
+
+    返回:
+    矩阵 (T+1) x (T+1)，[a, b] 为类型a与类型b的原子之间的最小距离（下标0不使用）；
+    atom_types为None时 [1, 1] 即为全体原子的最小距离
+    """
+    num_atoms = len(positions)
+    types, num_types = _type_indices(atom_types, num_atoms)
+    half_width = _perpendicular_widths(np.asarray(box_size, dtype=float)).min() / 2
+    if cutoff is None:
+        volume = float(np.prod(np.asarray(box_size, dtype=float)[:3]))
+        cutoff = min(2.0 * (volume / max(num_atoms, 1))**(1/3), half_width)
+
+    def chunk_minimum(first, second, distances):
+        result = np.full((num_types + 1) * (num_types + 1), np.inf)
+        a, b = types[first], types[second]
+        pair = np.minimum(a, b) * (num_types + 1) + np.maximum(a, b)
+        np.minimum.at(result, pair, distances)
+        return result
+
+    chunks = _map_pair_chunks(positions, box_size, cutoff, chunk_minimum, chunk_size, max_workers)
+    result = np.min(chunks, axis=0) if chunks else np.full((num_types + 1) ** 2, np.inf)
+    result = result.reshape(num_types + 1, num_types + 1)
+    return np.minimum(result, result.T)
+
+def coordination_numbers(positions: np.ndarray, box_size: List[float], cutoff: float, atom_types=None,
+                         chunk_size: int = None, max_workers: int = None) -> np.ndarray:
+    """
+    计算每个原子在cutoff以内的邻居数，可按邻居的类型分开统计
+
+    参数:
+    positions: 原子坐标 (N x 3)
+    box_size: 盒子尺寸
+    cutoff: 截断距离（通常取g(r)第一个谷的位置）
+    atom_types: 原子类型编号（从1开始），默认为None（不区分邻居类型）
+    chunk_size: 每块的原子数，默认按候选原子对数的上限确定（见_map_pair_chunks）
+    max_workers: 线程数
+
+    返回:
+    atom_types为None时为每个原子的邻居数 (N,)；否则为 (N x (T+1))，[i, b] 为原子i的类型b邻居数
+    """
+    num_atoms = len(positions)
+    types, num_types = _type_indices(atom_types, num_atoms)
+
+    def chunk_counts(first, second, distances):
+        # 每对原子给双方各记一个对方类型的邻居
+        atoms = np.concatenate([first, second])
+        neighbor_types = np.concatenate([types[second], types[first]])
+        return np.bincount(atoms * (num_types + 1) + neighbor_types, minlength=num_atoms * (num_types + 1))
+
+    chunks = _map_pair_chunks(positions, box_size, cutoff, chunk_counts, chunk_size, max_workers)
+    counts = np.sum(chunks, axis=0) if chunks else np.zeros(num_atoms * (num_types + 1), dtype=np.int64)
+    counts = counts.reshape(num_atoms, num_types + 1)
+    return counts.sum(axis=1) if atom_types is None else counts
+
+def radial_distribution(positions: np.ndarray, box_size: List[float], r_max: float, bins: int = 200,
+                        atom_types=None, element_types=None, chunk_size: int = None,
+                        max_workers: int = None) -> RadialDistribution:
+    """
+    计算总的和按元素对分解的径向分布函数
+
+    g_ab(r) = V * n_ab(r) / (N_a * N_b * 4/3*pi*(r_{k+1}^3 - r_k^3))，n_ab为距离落在区间内的有序原子对数
+    （a与b不同时每对计一次，相同时计两次）。总的 g(r) 满足 g = sum_ab x_a x_b g_ab，x为元素的原子分数。
+
+    参数:
+    positions: 原子坐标 (N x 3)
+    box_size: 盒子尺寸
+    r_max: 最大距离（不超过盒子最小垂直宽度的一半）
+    bins: 区间数
+    atom_types: 原子类型编号（从1开始），默认为None（只计算总的g(r)）
+    element_types: 元素名称列表（与atom_types对应），用作partial的键，默认为 "1"、"2" 等类型编号
+    chunk_size: 每块的原子数，默认按候选原子对数的上限确定（见_map_pair_chunks）
+    max_workers: 线程数
+
+    返回:
+    RadialDistribution
+    """
+    num_atoms = len(positions)
+    types, num_types = _type_indices(atom_types, num_atoms)
+    edges = np.linspace(0.0, r_max, bins + 1)
+    num_pairs = (num_types + 1) * (num_types + 1)
+
+    def chunk_histogram(first, second, distances):
+        a, b = types[first], types[second]
+        pair = np.minimum(a, b) * (num_types + 1) + np.maximum(a, b)
+        index = np.minimum((distances / r_max * bins).astype(np.int64), bins - 1)
+        return np.bincount(pair * bins + index, minlength=num_pairs * bins)
+
+    chunks = _map_pair_chunks(positions, box_size, r_max, chunk_histogram, chunk_size, max_workers)
+    histogram = np.sum(chunks, axis=0) if chunks else np.zeros(num_pairs * bins, dtype=np.int64)
+    histogram = histogram.reshape(num_types + 1, num_types + 1, bins)
+
+    box = np.asarray(box_size, dtype=float)
+    volume = float(np.prod(box[:3]))
+    shell = 4.0 / 3.0 * np.pi * (edges[1:]**3 - edges[:-1]**3)
+    counts = np.bincount(types, minlength=num_types + 1)
+    total = 2.0 * histogram.sum(axis=(0, 1))
+    g = volume * total / (num_atoms * num_atoms * shell) if num_atoms > 0 else np.zeros(bins)
+
+    partial, coordination = {}, {}
+    if atom_types is not None:
+        names = {}
+        if element_types is not None:
+            for type_id, index in zip(*np.unique(types, return_index=True)):
+                names[int(type_id)] = element_types[index]
+        present = np.flatnonzero(counts)
+        for a in present:
+            for b in present[present >= a]:
+                ordered = histogram[a, b] * (2.0 if a == b else 1.0)
+                key = (names.get(int(a), str(a)), names.get(int(b), str(b)))
+                partial[key] = volume * ordered / (counts[a] * counts[b] * shell)
+                coordination[key] = np.cumsum(ordered) / counts[a]
+                if a != b:
+                    coordination[key[::-1]] = np.cumsum(ordered) / counts[b]
+    return RadialDistribution(0.5 * (edges[1:] + edges[:-1]), edges, g, partial, coordination)
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+随机结构的磁盘缓存：按完整的生成参数和种子计算内容地址，命中时直接读取压缩的二进制数组
+@Time: 2026/10/17
+@File: structure_cache.py
+@Author: Xuerui Wei
+"""
+
+import numpy as np
+import contextlib
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+import zipfile
+from typing import List, Optional, Tuple
+
+from random_structure import generate_random_structure, _compact_type_dtype
+
+try:
+    import fcntl
+except ImportError:  # Windows上没有fcntl，只是不能避免多个进程同时生成同一个结构
+    fcntl = None
+
+# 生成算法的输出发生变化（同样的参数和种子得到不同的结构）时需要增加版本号，使旧的缓存失效
+CACHE_VERSION = 4
+
+# 会影响生成结果的参数；其余参数（progress、stats、checkpoint等）不改变生成的结构，不参与计算键
+_KEY_PARAMETERS = ("num_atoms", "density", "min_distance", "element_ratios", "use_ml_assisted_placement",
+                   "batch_size", "seed", "placement_strategy", "box_shape", "on_stall")
+
+# 取实数值的参数（包括字典的值和列表的元素）：整数和浮点数写法（1与1.0）得到相同的键
+_REAL_PARAMETERS = ("density", "min_distance", "element_ratios", "box_shape")
+
+def _canonical(value, real: bool = False):
+    """
+    把参数转换为可以稳定序列化为JSON的形式
+
+    参数:
+    value: 参数值
+    real: 是否为实数值参数，为True时整数也按浮点数表示
+    """
+    if isinstance(value, np.random.SeedSequence):
+        return {"entropy": _canonical(value.entropy), "spawn_key": [int(k) for k in value.spawn_key]}
+    if isinstance(value, dict):
+        # 元素比例的顺序决定类型编号，保持原顺序；元素对的最小距离与两个元素的先后无关
+        if all(isinstance(key, tuple) for key in value):
+            return sorted([sorted(key), _canonical(item, real)] for key, item in value.items())
+        return [[key, _canonical(item, real)] for key, item in value.items()]
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_canonical(item, real) for item in value]
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)) and not real:
+        return int(value)
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        # repr保证浮点数精确往返，不会因为打印精度把不同的参数映射到同一个键
+        return repr(float(value))
+    return value
+
+class StructureCache:
+    """
+    按内容寻址的结构缓存
+
+    键是生成参数（包括种子）和CACHE_VERSION的SHA-256，每个结构保存为一个
+    <键>.npz 文件（坐标、盒子尺寸、紧凑的类型编号和元素名称）。文件先写到同一目录下的
+    临时文件再用 os.replace 原子替换，读取方不会看到写了一半的文件；同一个键的生成过程
+    用文件锁串行化，多个进程同时请求同一个结构时只生成一次。
+
+    命中时更新文件的修改时间，缓存总大小超过 max_bytes 时按修改时间删除最久未使用的
+    文件（LRU）。其他进程正在读取的文件被删除时，读取方按未命中处理并重新生成。
+    """
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = 1 << 30):
+        """
+        参数:
+        cache_dir: 缓存目录，默认为环境变量RANDOM_STRUCTURE_CACHE，未设置时为 ~/.cache/random_structure
+        max_bytes: 缓存文件的总大小上限（字节），默认为1 GiB
+        """
+        if cache_dir is None:
+            cache_dir = os.environ.get("RANDOM_STRUCTURE_CACHE",
+                                       os.path.join(os.path.expanduser("~"), ".cache", "random_structure"))
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def cacheable(**generation_kwargs) -> bool:
+        """
+        判断一组生成参数的结果能否缓存
+
+        没有固定种子（seed为None或np.random.Generator）时每次结果不同；写轨迹文件或
+        坐标内存映射文件的调用有文件副作用，这些情况都不使用缓存。
+        """
+        seed = generation_kwargs.get("seed")
+        if seed is None or isinstance(seed, np.random.Generator):
+            return False
+        return not generation_kwargs.get("generate_trajectory") and generation_kwargs.get("positions_file") is None
+
+    @staticmethod
+    def key(**generation_kwargs) -> str:
+        """
+        计算生成参数对应的缓存键
+
+        参数:
+        generation_kwargs: 传给generate_random_structure的参数
+
+        返回:
+        64位十六进制字符串
+        """
+        unknown = set(generation_kwargs) - set(_KEY_PARAMETERS) - {"progress", "stats", "generate_trajectory",
+                                                                   "positions_file", "checkpoint",
+                                                                   "checkpoint_interval", "check_feasibility"}
+        if unknown:
+            raise TypeError(f"未知的生成参数: {sorted(unknown)}")
+        # 未给出的参数按generate_random_structure的默认值计算，省略参数与显式传入默认值得到相同的键
+        defaults = {name: parameter.default
+                    for name, parameter in inspect.signature(generate_random_structure).parameters.items()
+                    if parameter.default is not inspect.Parameter.empty}
+        params = {name: _canonical(generation_kwargs.get(name, defaults.get(name)), name in _REAL_PARAMETERS)
+                  for name in _KEY_PARAMETERS}
+        params["cache_version"] = CACHE_VERSION
+        text = json.dumps(params, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def path(self, key: str) -> str:
+        """缓存键对应的文件路径"""
+        return os.path.join(self.cache_dir, key + ".npz")
+
+    def get(self, key: str) -> Optional[Tuple[np.ndarray, List[float], List[int], List[str]]]:
+        """
+        读取缓存的结构
+
+        参数:
+        key: 缓存键
+
+        返回:
+        与generate_random_structure相同的 (positions, box_size, atom_types, element_types)，未命中时为None
+        """
+        path = self.path(key)
+        try:
+            with np.load(path) as data:
+                positions = data["positions"]
+                box_size = data["box_size"].tolist()
+                atom_types = data["atom_types"].astype(np.int64)
+                elements = data["elements"].tolist()
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            # 损坏或截断的文件（例如写入时磁盘已满、复制了一半）直接删除，按未命中处理
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            return None
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(path)
+        atom_types = atom_types.tolist()
+        return positions, box_size, atom_types, [elements[type_id - 1] for type_id in atom_types]
+
+    def put(self, key: str, positions: np.ndarray, box_size: List[float], atom_types: List[int],
+            element_types: List[str]):
+        """
+        保存结构，然后按LRU删除超出大小上限的文件
+
+        参数:
+        key: 缓存键
+        positions, box_size, atom_types, element_types: generate_random_structure的返回值
+        """
+        atom_types = np.asarray(atom_types)
+        num_types = int(atom_types.max()) if len(atom_types) else 0
+        elements = [""] * num_types
+        for type_id, index in zip(*np.unique(atom_types, return_index=True)):
+            elements[type_id - 1] = element_types[index]
+
+        fd, temporary = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp-", suffix=".npz")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(f, positions=np.asarray(positions, dtype=np.float64),
+                                    box_size=np.asarray(box_size, dtype=np.float64),
+                                    atom_types=atom_types.astype(_compact_type_dtype(num_types)),
+                                    elements=np.array(elements, dtype=str))
+            os.replace(temporary, self.path(key))
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temporary)
+            raise
+        self.evict()
+
+    def evict(self):
+        """按修改时间从旧到新删除缓存文件，直到总大小不超过max_bytes"""
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".npz") and not entry.name.startswith("."):
+                    with contextlib.suppress(FileNotFoundError):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            # 其他进程可能已经删除了同一个文件；同时删除该键的锁文件，长期使用的缓存目录中不会积累锁文件
+            # （正在持有该锁的进程不受影响，最坏情况是另一个进程同时重新生成同一个结构，结果由原子替换保证完整）
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path[:-len(".npz")] + ".lock")
+            total -= size
+
+    def clear(self):
+        """删除全部缓存文件"""
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith((".npz", ".lock")):
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(entry.path)
+
+    @contextlib.contextmanager
+    def _lock(self, key: str):
+        """同一个键的独占文件锁（没有fcntl时不加锁）"""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.cache_dir, key + ".lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def generate(self, **generation_kwargs) -> Tuple[np.ndarray, List[float], List[int], List[str]]:
+        """
+        带缓存的generate_random_structure
+
+        参数:
+        generation_kwargs: 传给generate_random_structure的参数；结果不可缓存时（见cacheable）直接生成，
+                           命中时不调用generate_random_structure，传入的stats不会被填充
+
+        返回:
+        与generate_random_structure相同
+        """
+        if not self.cacheable(**generation_kwargs):
+            return generate_random_structure(**generation_kwargs)
+        key = self.key(**generation_kwargs)
+        result = self.get(key)
+        if result is None:
+            with self._lock(key):
+                # 等待锁期间其他进程可能已经生成并保存了同一个结构
+                result = self.get(key)
+                if result is None:
+                    self.misses += 1
+                    result = generate_random_structure(**generation_kwargs)
+                    self.put(key, *result)
+                    return result
+        self.hits += 1
+        return result
@@ -0,0 +1,139 @@
+"""
+测试parallel_structure模块
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import parallel_structure
+import random_structure
+import structure_analysis
+import numpy as np
+import pathlib
+import tempfile
+
+GENERATION_KWARGS = dict(
+    num_atoms=60,
+    density=0.05,
+    min_distance=1.0,
+    element_ratios={"Ti": 0.5, "Al": 0.5},
+    batch_size=32
+)
+
+def test_ensemble_reproducible(tmp_path):
+    """测试并行集合生成：工作进程直接写文件，且任意成员都能由根种子单独复现"""
+    results = list(parallel_structure.generate_ensemble(
+        4, root_seed=2024, output_dir=str(tmp_path), max_workers=2, **GENERATION_KWARGS
+    ))
+    assert sorted(result.index for result in results) == [0, 1, 2, 3]
+    for result in results:
+        assert result.positions is None
+        assert os.path.exists(result.filename)
+    
+    # 不写文件时直接返回结构，与单独复现的结果以及写出的文件一致
+    in_memory = {result.index: result for result in parallel_structure.generate_ensemble(
+        4, root_seed=2024, max_workers=1, **GENERATION_KWARGS
+    )}
+    positions, box_size, atom_types, element_types = parallel_structure.ensemble_member(2, 2024, **GENERATION_KWARGS)
+    assert np.array_equal(in_memory[2].positions, positions)
+    assert in_memory[2].atom_types == atom_types
+    
+    with open(tmp_path / "structure_0002.data") as f:
+        lines = f.read().splitlines()
+    atoms = np.loadtxt(lines[lines.index("Atoms # atomic") + 2:])
+    assert np.allclose(atoms[:, 2:], positions, atol=1e-6)
+    
+    # 后台线程写出的文件与工作进程写出的相同
+    pipelined = list(parallel_structure.generate_ensemble(
+        4, root_seed=2024, output_dir=str(tmp_path / "pipelined"), max_workers=1, io_queue_size=2,
+        **GENERATION_KWARGS
+    ))
+    assert [result.index for result in pipelined] == [0, 1, 2, 3]
+    for result in pipelined:
+        assert (tmp_path / "pipelined" / os.path.basename(result.filename)).read_bytes() == \
+            (tmp_path / os.path.basename(result.filename)).read_bytes()
+    
+    # 不同成员的随机数流相互独立
+    assert not np.array_equal(in_memory[0].positions, in_memory[1].positions)
+    
+    print("并行集合生成测试通过!")
+
+def test_domain_decomposed_generation():
+    """测试区域分解生成：跨子区域边界和周期性边界都满足最小距离，且结果与工作进程数无关"""
+    kwargs = dict(num_atoms=800, density=0.3, min_distance=1.0,
+                  element_ratios={"Ti": 0.5, "Al": 0.5}, domains=(2, 2, 1), seed=11, batch_size=256)
+    positions, box_size, atom_types, element_types = parallel_structure.generate_domain_decomposed(
+        max_workers=1, **kwargs
+    )
+    assert positions.shape == (800, 3)
+    assert np.all((positions >= 0) & (positions < box_size[0]))
+    assert atom_types.count(1) == 400 and element_types.count("Al") == 400
+    
+    delta = positions[:, None, :] - positions[None, :, :]
+    delta -= np.asarray(box_size) * np.round(delta / np.asarray(box_size))
+    distances = np.sqrt(np.sum(delta**2, axis=-1))
+    np.fill_diagonal(distances, np.inf)
+    assert distances.min() >= 1.0
+    
+    parallel_positions, _, parallel_types, _ = parallel_structure.generate_domain_decomposed(
+        max_workers=2, **kwargs
+    )
+    assert np.array_equal(parallel_positions, positions)
+    assert parallel_types == atom_types
+    
+    # 非周期方向上不跨越盒子边界检查距离，周期方向上仍然回绕
+    atom = np.array([[0.1, 0.1, 2.5]])
+    cell_list = random_structure.CellList(atom, [5.0, 5.0, 5.0], 1.0, periodic=(False, True, True))
+    cell_list.insert(0)
+    conflicts = cell_list.has_conflict(np.array([[4.9, 0.1, 2.5], [0.1, 4.9, 2.5], [0.5, 0.1, 2.5]]))
+    assert conflicts.tolist() == [False, True, True]
+    
+    print("区域分解生成测试通过!")
+
+def test_tiled_generation(tmp_path):
+    """测试平铺复制生成：跨tile边界满足最小距离、每个tile组成不变、可复现，并记录剩余关联"""
+    kwargs = dict(tiles=(2, 2, 3), tile_atoms=1500, density=0.5, min_distance=1.0,
+                  element_ratios={"Fe": 0.8, "B": 0.2}, perturbation=0.05, seed=5, batch_size=512, progress=False)
+    report = parallel_structure.TilingReport()
+    positions, box_size, atom_types, element_types = parallel_structure.generate_tiled_structure(
+        report=report, **kwargs)
+    tile, tile_box, tile_types, _ = random_structure.generate_random_structure(
+        1500, 0.5, 1.0, {"Fe": 0.8, "B": 0.2}, seed=np.random.SeedSequence(5, spawn_key=(0,)),
+        batch_size=512, progress=False)
+    assert positions.shape == (18000, 3) and np.allclose(box_size, np.asarray(tile_box) * [2, 2, 3])
+    assert np.all((positions >= 0) & (positions < box_size))
+    assert structure_analysis.minimum_distances(positions, box_size, cutoff=1.5)[1, 1] >= 1.0
+    # 元素只在tile内部重排，每个tile的组成与模板相同
+    assert np.array_equal(np.bincount(np.reshape(atom_types, (12, 1500)).ravel()), np.bincount(tile_types) * 12)
+    assert element_types[:3] == [["Fe", "B"][type_id - 1] for type_id in atom_types[:3]]
+    assert report.repaired_atoms > 0 and report.boundary_atoms > report.repaired_atoms
+    assert report.copies == 12 and report.independent_atoms == 1500 and report.distinct_operations > 1
+    assert np.isclose(report.max_reliable_distance, tile_box[0] / 2)
+    assert "min_reliable_wavevector" in report.as_dict()
+
+    # 同样的种子得到同样的结构；坐标写入内存映射文件时类型以紧凑数组返回
+    mapped_positions, _, mapped_types, mapped_elements = parallel_structure.generate_tiled_structure(
+        positions_file=str(tmp_path / "tiled.npy"), **kwargs)
+    assert np.array_equal(mapped_positions, positions)
+    assert mapped_types.dtype == np.int8 and mapped_types.tolist() == atom_types
+    assert list(mapped_elements[:3]) == element_types[:3]
+
+    # 不做任何变换时所有tile完全相同
+    positions, _, atom_types, _ = parallel_structure.generate_tiled_structure(
+        rotate=False, shift=False, shuffle_species=False, **dict(kwargs, perturbation=0.0, tiles=(2, 1, 1)))
+    assert np.allclose(positions[1500:] - [tile_box[0], 0, 0], tile) and atom_types[1500:] == tile_types
+
+    # 较大的位移会把原子推过边界面，与相邻tile中离边界面稍远的原子冲突
+    for seed in range(4):
+        positions, box_size, _, _ = parallel_structure.generate_tiled_structure(
+            (2, 2, 2), 1000, 0.3, min_distance=1.0, perturbation=0.2, seed=seed, batch_size=256, progress=False)
+        assert structure_analysis.minimum_distances(positions, box_size, cutoff=1.5)[1, 1] >= 1.0
+
+    print("平铺复制生成测试通过!")
+
+if __name__ == "__main__":
+    test_ensemble_reproducible(pathlib.Path(tempfile.mkdtemp()))
+    test_domain_decomposed_generation()
+    test_tiled_generation(pathlib.Path(tempfile.mkdtemp()))
+    print("所有测试通过！")
@@ -8,6 +8,15 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
 import random_structure
 import numpy as np
+import gzip
+import pathlib
+import tempfile
+import io
+import json
+import contextlib
+import threading
+import warnings
+import time
 
 def test_generate_random_structure():
     """测试随机结构生成功能"""
@@ -92,8 +101,755 @@ def test_lammps_mass_consistency():
     
     print("LAMMPS质量一致性测试通过!")
 
+def _min_periodic_distance(positions, box_size):
+    """暴力计算所有原子对的最小周期性距离"""
+    delta = positions[:, None, :] - positions[None, :, :]
+    box = np.asarray(box_size)
+    delta -= box * np.round(delta / box)
+    distances = np.sqrt(np.sum(delta**2, axis=-1))
+    np.fill_diagonal(distances, np.inf)
+    return distances.min()
+
+def test_batched_generation():
+    """测试批量向量化放置模式满足最小距离要求且可复现"""
+    kwargs = dict(
+        num_atoms=300,
+        density=0.0784,
+        min_distance=1.5,
+        element_ratios={"Fe": 0.8, "B": 0.2},
+        batch_size=128,
+        seed=42
+    )
+    positions, box_size, atom_types, element_types = random_structure.generate_random_structure(**kwargs)
+    
+    assert positions.shape == (300, 3)
+    assert len(atom_types) == 300
+    assert element_types.count("B") == 60
+    assert np.all((positions >= 0) & (positions < box_size[0]))
+    assert _min_periodic_distance(positions, box_size) >= 1.5
+    
+    # 相同种子应得到完全相同的结构
+    positions_again, _, atom_types_again, _ = random_structure.generate_random_structure(**kwargs)
+    assert np.array_equal(positions, positions_again)
+    assert atom_types == atom_types_again
+    
+    print("批量放置测试通过!")
+
+def test_cell_list_query():
+    """测试链表网格的邻居查询与暴力计算结果一致"""
+    rng = np.random.default_rng(0)
+    box_size = [10.0, 7.0, 3.0]
+    positions = rng.random((400, 3)) * box_size
+    cell_list = random_structure.CellList(positions, box_size, cutoff=1.2)
+    cell_list.insert(np.arange(200))
+    cell_list.insert(np.arange(200, 400))
+    assert cell_list.counts.sum() == 400
+    
+    points = rng.random((50, 3)) * box_size
+    delta = positions[None, :, :] - points[:, None, :]
+    delta -= np.asarray(box_size) * np.round(delta / np.asarray(box_size))
+    expected = (np.sum(delta**2, axis=-1) < 1.2**2).any(axis=1)
+    assert np.array_equal(cell_list.has_conflict(points), expected)
+    
+    # 每个原子在查询结果中最多出现一次（网格数不足时模板不能重复计入同一网格）
+    query, atoms = cell_list.query_pairs(points)
+    pairs = query * len(positions) + atoms
+    assert len(np.unique(pairs)) == len(pairs)
+    
+    print("链表网格查询测试通过!")
+
+def test_density_buckets():
+    """测试桶队列维护的最低占据数与直接扫描一致"""
+    rng = np.random.default_rng(1)
+    buckets = random_structure.DensityBuckets(64)
+    for cell in rng.integers(64, size=300):
+        buckets.increment(cell)
+        assert buckets.min_count == buckets.counts.min()
+    
+    # order 按占据数排序，position 是它的逆映射
+    assert np.all(np.diff(buckets.counts[buckets.order]) >= 0)
+    assert np.array_equal(buckets.position[buckets.order], np.arange(64))
+    
+    picks = buckets.random_min_cells(rng, size=100)
+    assert np.all(buckets.counts[picks] == buckets.counts.min())
+    
+    # 批量加一（包括重复的网格）与逐个加一得到相同的占据数和桶边界
+    bulk = random_structure.DensityBuckets(64)
+    single = random_structure.DensityBuckets(64)
+    for _ in range(20):
+        cells = rng.integers(64, size=rng.integers(1, 100))
+        bulk.increment_many(cells)
+        for cell in cells:
+            single.increment(cell)
+        assert np.array_equal(bulk.counts, single.counts) and bulk.bucket_start == single.bucket_start
+        assert bulk.min_count == single.min_count == bulk.counts.min()
+        assert np.all(np.diff(bulk.counts[bulk.order]) >= 0)
+        assert np.array_equal(bulk.position[bulk.order], np.arange(64))
+    
+    print("桶队列测试通过!")
+
+def test_void_placement_near_jamming():
+    """测试空隙跟踪模式能在接近随机序列吸附极限的密度下完成放置"""
+    # 堆积分数 0.36，逐个随机尝试在这一密度下几乎无法完成
+    density = 0.36 * 6 / np.pi
+    positions, box_size, atom_types, element_types = random_structure.generate_random_structure(
+        num_atoms=400,
+        density=density,
+        min_distance=1.0,
+        element_ratios={"Ti": 0.5, "Al": 0.5},
+        seed=7,
+        placement_strategy="void"
+    )
+    
+    assert positions.shape == (400, 3)
+    assert element_types.count("Ti") == 200
+    assert _min_periodic_distance(positions, box_size) >= 1.0
+    
+    print("空隙跟踪放置测试通过!")
+
+def test_trajectory_writer(tmp_path):
+    """测试流式轨迹写入器的抽帧、增量写入和压缩输出"""
+    filename = str(tmp_path / "traj.lammpstrj")
+    writer = random_structure.TrajectoryWriter(filename, stride=50)
+    positions, box_size, atom_types, element_types = random_structure.generate_random_structure(
+        num_atoms=200,
+        density=0.05,
+        min_distance=1.0,
+        generate_trajectory=writer,
+        seed=3
+    )
+    with open(filename) as f:
+        lines = f.read().splitlines()
+    counts = [int(lines[i + 1]) for i, line in enumerate(lines) if line == "ITEM: NUMBER OF ATOMS"]
+    assert counts == [50, 100, 150, 200]
+    # 最后一帧与最终结构一致
+    last = np.loadtxt(lines[-200:])
+    assert np.allclose(last[:, 2:], positions, atol=1e-6)
+    assert np.array_equal(last[:, 1], atom_types)
+    
+    # 增量写入时每帧只包含新增原子，压缩输出可直接用gzip读取
+    gz_filename = str(tmp_path / "traj.lammpstrj.gz")
+    with random_structure.TrajectoryWriter(gz_filename, stride=80, incremental=True, compression="gzip") as writer:
+        for placed_atoms in range(1, 201):
+            writer.update(positions, atom_types, box_size, placed_atoms)
+    with gzip.open(gz_filename, 'rt') as f:
+        lines = f.read().splitlines()
+    counts = [int(lines[i + 1]) for i, line in enumerate(lines) if line == "ITEM: NUMBER OF ATOMS"]
+    assert counts == [80, 80, 40]
+    assert lines[-40].split()[0] == "161"
+    
+    print("轨迹写入测试通过!")
+
+def test_save_lammps_data_styles(tmp_path):
+    """测试批量写出的LAMMPS数据文件：类型与质量对应、不同原子格式以及压缩输出"""
+    positions, box_size, atom_types, element_types = random_structure.generate_random_structure(
+        num_atoms=50,
+        density=0.05,
+        min_distance=1.0,
+        element_ratios={"Ti": 0.5, "Al": 0.5},
+        seed=11
+    )
+    
+    # atomic格式与逐行格式化的结果一致，Masses按类型编号给出对应元素的质量
+    filename = str(tmp_path / "atomic.data")
+    random_structure.save_lammps_data(filename, positions, box_size, atom_types, element_types)
+    with open(filename) as f:
+        lines = f.read().splitlines()
+    masses_start = lines.index("Masses")
+    assert lines[masses_start + 2] == "1 47.8670  # Ti"
+    assert lines[masses_start + 3] == "2 26.9820  # Al"
+    atoms_start = lines.index("Atoms # atomic")
+    expected = [f"{i+1} {atom_types[i]} {positions[i, 0]:.6f} {positions[i, 1]:.6f} {positions[i, 2]:.6f}"
+                for i in range(50)]
+    assert lines[atoms_start + 2:] == expected
+    
+    # full格式（gzip压缩）：id mol type q x y z
+    filename = str(tmp_path / "full.data.gz")
+    molecule_ids = np.arange(50) // 2 + 1
+    random_structure.save_lammps_data(filename, positions, box_size, atom_types, element_types,
+                                      atom_style="full", charges={"Ti": 0.5, "Al": -0.25},
+                                      molecule_ids=molecule_ids)
+    with gzip.open(filename, 'rt') as f:
+        lines = f.read().splitlines()
+    atoms = np.loadtxt(lines[lines.index("Atoms # full") + 2:])
+    assert np.array_equal(atoms[:, 1], molecule_ids)
+    assert np.array_equal(atoms[:, 2], atom_types)
+    assert np.allclose(atoms[:, 3], np.where(np.array(element_types) == "Ti", 0.5, -0.25))
+    assert np.allclose(atoms[:, 4:], positions, atol=1e-6)
+    
+    # charge格式（zstd压缩，需要安装zstandard）
+    try:
+        import zstandard
+    except ImportError:
+        zstandard = None
+    if zstandard is not None:
+        filename = str(tmp_path / "charge.data.zst")
+        charges = np.linspace(-1, 1, 50)
+        random_structure.save_lammps_data(filename, positions, box_size, atom_types, element_types,
+                                          atom_style="charge", charges=charges)
+        with open(filename, 'rb') as f:
+            text = zstandard.ZstdDecompressor().stream_reader(f).read().decode()
+        lines = text.splitlines()
+        atoms = np.loadtxt(lines[lines.index("Atoms # charge") + 2:])
+        assert np.allclose(atoms[:, 2], charges, atol=1e-6)
+        assert np.allclose(atoms[:, 3:], positions, atol=1e-6)
+    
+    print("LAMMPS数据文件格式测试通过!")
+
+def test_periodic_distance_kernel():
+    """测试批量最小镜像距离：一对多、全部两两距离以及三斜盒子"""
+    rng = np.random.default_rng(5)
+    box_size = [10.0, 9.0, 8.0, 2.0, -1.5, 1.0]
+    points = rng.random((30, 3)) @ random_structure._box_matrix(box_size)
+    
+    # 与遍历相邻镜像的暴力结果比较
+    images = np.stack(np.meshgrid(*[np.arange(-1, 2)] * 3, indexing='ij'), axis=-1).reshape(-1, 3)
+    shifts = images @ random_structure._box_matrix(box_size)
+    delta = points[None, :, None, :] + shifts[None, None, :, :] - points[:, None, None, :]
+    expected = np.sqrt(np.sum(delta**2, axis=-1)).min(axis=-1)
+    distances = random_structure.periodic_distances(points, points, box_size, pairwise=True)
+    assert distances.shape == (30, 30)
+    close = expected < 3.5  # 不超过最小垂直宽度的一半时最小镜像约定是准确的
+    assert np.allclose(distances[close], expected[close])
+    
+    one_to_many = random_structure.periodic_distances(points[0], points, box_size)
+    assert np.allclose(one_to_many, distances[0])
+    assert abs(random_structure.calculate_periodic_distance(points[0], points[3], box_size) - distances[0, 3]) < 1e-12
+    
+    # 正交盒子跨越周期性边界
+    assert abs(random_structure.calculate_periodic_distance(
+        np.array([0.5, 0.0, 0.0]), np.array([9.5, 0.0, 0.0]), [10.0, 10.0, 10.0]) - 1.0) < 1e-12
+    
+    print("批量周期性距离测试通过!")
+
+def test_pair_cutoffs_and_triclinic_box(tmp_path):
+    """测试按元素对的最小距离以及三斜盒子中的生成和输出"""
+    min_distance = {("Fe", "Fe"): 1.6, ("Fe", "B"): 1.2, ("B", "B"): 1.4}
+    cutoffs = random_structure._cutoff_matrix(min_distance, ["Fe", "B"])
+    for batch_size in (None, 128):
+        positions, box_size, atom_types, element_types = random_structure.generate_random_structure(
+            num_atoms=400, density=0.1, min_distance=min_distance, element_ratios={"Fe": 0.8, "B": 0.2},
+            seed=8, batch_size=batch_size
+        )
+        atom_types = np.asarray(atom_types)
+        assert np.bincount(atom_types).tolist() == [0, 320, 80]
+        assert all(element == ("Fe" if type_id == 1 else "B") for type_id, element in zip(atom_types, element_types))
+        distances = random_structure.periodic_distances(positions, positions, box_size, pairwise=True)
+        np.fill_diagonal(distances, np.inf)
+        assert np.all(distances >= cutoffs[atom_types][:, atom_types])
+        # B-Fe 之间确实用到了比 Fe-Fe 更短的距离
+        assert distances.min() < 1.6
+    
+    positions, box_size, atom_types, element_types = random_structure.generate_random_structure(
+        num_atoms=300, density=0.3, min_distance=1.0, seed=9, batch_size=64,
+        box_shape=[1.0, 1.0, 1.3, 0.3, 0.2, -0.25]
+    )
+    assert len(box_size) == 6
+    assert abs(box_size[0] * box_size[1] * box_size[2] - 300 / 0.3) < 1e-6
+    fractions = random_structure._fractional(positions, box_size)
+    assert np.all((fractions >= 0) & (fractions < 1))
+    distances = random_structure.periodic_distances(positions, positions, box_size, pairwise=True)
+    np.fill_diagonal(distances, np.inf)
+    assert distances.min() >= 1.0
+    
+    filename = tmp_path / "triclinic.data"
+    random_structure.save_lammps_data(str(filename), positions, box_size, atom_types, element_types)
+    assert f"{box_size[3]:.6f} {box_size[4]:.6f} {box_size[5]:.6f} xy xz yz" in filename.read_text()
+    
+    print("元素对最小距离和三斜盒子测试通过!")
+
+def test_relax_placement_beyond_rsa_limit():
+    """测试先放置再松弛模式可以超过随机序列吸附的饱和密度（堆积分数约0.38）"""
+    packing_fraction = 0.45
+    density = packing_fraction / (np.pi / 6)
+    positions, box_size, atom_types, element_types = random_structure.generate_random_structure(
+        num_atoms=600, density=density, min_distance=1.0, element_ratios={"Ti": 0.5, "Al": 0.5},
+        seed=4, placement_strategy="relax"
+    )
+    assert positions.shape == (600, 3)
+    assert np.all((positions >= 0) & (positions <= box_size[0]))
+    assert _min_periodic_distance(positions, box_size) >= 1.0
+    assert sorted(set(element_types)) == ["Al", "Ti"]
+    
+    # 按元素对给出最小距离时同样适用
+    min_distance = {("Fe", "Fe"): 1.6, ("Fe", "B"): 1.2, ("B", "B"): 1.4}
+    positions, box_size, atom_types, element_types = random_structure.generate_random_structure(
+        num_atoms=300, density=0.2, min_distance=min_distance, element_ratios={"Fe": 0.8, "B": 0.2},
+        seed=4, placement_strategy="relax"
+    )
+    atom_types = np.asarray(atom_types)
+    cutoffs = random_structure._cutoff_matrix(min_distance, ["Fe", "B"])
+    distances = random_structure.periodic_distances(positions, positions, box_size, pairwise=True)
+    np.fill_diagonal(distances, np.inf)
+    assert np.all(distances >= cutoffs[atom_types][:, atom_types])
+    
+    print("松弛放置模式测试通过!")
+
+def test_generation_stats():
+    """测试生成统计信息与进度/剖析回调"""
+    events = []
+    stats = random_structure.GenerationStats(profile_callback=lambda event, data: events.append(event))
+    progress_calls = []
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        random_structure.generate_random_structure(
+            num_atoms=200, density=0.1, min_distance=1.0, seed=5, batch_size=64,
+            use_ml_assisted_placement=True, progress=lambda placed, total: progress_calls.append((placed, total)),
+            stats=stats
+        )
+    
+    # 进度回调替代了标准输出
+    assert output.getvalue() == ""
+    assert progress_calls[-1] == (200, 200)
+    
+    assert stats.placed_atoms == 200
+    assert stats.attempts >= 200 and stats.rejections == stats.attempts - 200
+    assert stats.rejections_by_occupancy.sum() == stats.rejections
+    assert 0 < stats.acceptance_rate <= 1
+    # 低密度下接受率很高，ML辅助不会被触发
+    assert not stats.ml_assisted_triggered and stats.ml_triggered_at is None
+    assert {"setup", "placement", "total"} <= set(stats.timings)
+    assert len(stats.acceptance_over_time()) > 0
+    assert events.count("batch") == stats.batches and events.count("phase") == 2
+    json.dumps(stats.as_dict())
+    
+    # 其他放置策略同样填充统计信息
+    for strategy in ("void", "relax"):
+        stats = random_structure.GenerationStats()
+        with contextlib.redirect_stdout(output):
+            random_structure.generate_random_structure(
+                num_atoms=200, density=0.1, min_distance=1.0, seed=5, placement_strategy=strategy,
+                progress=False, stats=stats
+            )
+        assert stats.placed_atoms == 200 and stats.attempts > 0
+    assert output.getvalue() == ""
+    
+    print("生成统计信息测试通过!")
+
+def test_out_of_core_generation(tmp_path):
+    """测试内存映射坐标和紧凑类型数组"""
+    kwargs = dict(num_atoms=2000, density=0.2, min_distance=1.0, element_ratios={"Fe": 0.8, "B": 0.2},
+                  seed=8, batch_size=256, progress=False)
+    positions, box_size, atom_types, element_types = random_structure.generate_random_structure(**kwargs)
+    mapped, mapped_box, compact_types, compact_elements = random_structure.generate_random_structure(
+        positions_file=str(tmp_path / "positions.bin"), **kwargs
+    )
+    
+    # 坐标直接写在文件中，结果与内存中生成的完全相同
+    assert isinstance(mapped, np.memmap)
+    assert os.path.getsize(tmp_path / "positions.bin") == 2000 * 3 * 8
+    assert np.array_equal(mapped, positions) and mapped_box == box_size
+    assert compact_types.dtype == np.int8 and compact_types.tolist() == atom_types
+    assert len(compact_elements) == 2000 and list(compact_elements) == element_types
+    assert compact_elements[5] == element_types[5] and compact_elements[10:20] == element_types[10:20]
+    
+    # 按块从内存映射写出的数据文件与普通写出的相同
+    random_structure.save_lammps_data(str(tmp_path / "a.data"), positions, box_size, atom_types, element_types,
+                                      atom_style="charge", charges={"Fe": 1.0, "B": -1.0})
+    random_structure.save_lammps_data(str(tmp_path / "b.data"), mapped, mapped_box, compact_types, compact_elements,
+                                      atom_style="charge", charges={"Fe": 1.0, "B": -1.0}, chunk_size=300)
+    assert (tmp_path / "a.data").read_bytes() == (tmp_path / "b.data").read_bytes()
+    
+    # 按元素对给出最小距离时同样返回紧凑类型
+    min_distance = {("Fe", "Fe"): 1.2, ("Fe", "B"): 1.0, ("B", "B"): 1.1}
+    kwargs.update(num_atoms=500, min_distance=min_distance, density=0.1)
+    positions, box_size, atom_types, element_types = random_structure.generate_random_structure(**kwargs)
+    mapped, _, compact_types, compact_elements = random_structure.generate_random_structure(
+        positions_file=str(tmp_path / "typed.bin"), **kwargs
+    )
+    assert np.array_equal(mapped, positions)
+    assert compact_types.dtype == np.int8 and compact_types.tolist() == atom_types
+    assert list(compact_elements) == element_types
+    
+    print("内存映射生成测试通过!")
+
+def test_checkpoint_and_resume(tmp_path):
+    """测试中断时保存检查点，以及从检查点继续生成"""
+    checkpoint = str(tmp_path / "run.npz")
+    kwargs = dict(num_atoms=2000, density=0.3, min_distance=1.0, element_ratios={"Ti": 0.7, "Al": 0.3},
+                  seed=21, batch_size=128, checkpoint=checkpoint, checkpoint_interval=0.0)
+    
+    def interrupt(placed_atoms, num_atoms):
+        if placed_atoms > num_atoms // 2:
+            raise KeyboardInterrupt
+    
+    try:
+        random_structure.generate_random_structure(progress=interrupt, **kwargs)
+    except KeyboardInterrupt:
+        pass
+    partial = np.load(checkpoint)["positions"]
+    assert 1000 < len(partial) < 2000
+    
+    positions, box_size, atom_types, element_types = random_structure.resume_random_structure(
+        checkpoint, progress=False
+    )
+    assert len(positions) == 2000 and np.array_equal(positions[:len(partial)], partial)
+    assert _min_periodic_distance(positions, box_size) >= 1.0
+    # 类型在开始时已经分配，续算不改变
+    expected = random_structure.generate_random_structure(progress=False, **dict(kwargs, checkpoint=None))
+    assert atom_types == expected[2] and element_types == expected[3]
+    
+    # 按元素对给出最小距离时，续算按剩余原子数补足各类型
+    min_distance = {("Fe", "Fe"): 1.2, ("Fe", "B"): 1.0, ("B", "B"): 1.1}
+    kwargs.update(density=0.15, min_distance=min_distance, element_ratios={"Fe": 0.8, "B": 0.2})
+    try:
+        random_structure.generate_random_structure(progress=interrupt, **kwargs)
+    except KeyboardInterrupt:
+        pass
+    positions, box_size, atom_types, element_types = random_structure.resume_random_structure(
+        checkpoint, placement_strategy="void", progress=False
+    )
+    atom_types = np.asarray(atom_types)
+    assert np.bincount(atom_types).tolist() == [0, 1600, 400]
+    cutoffs = random_structure._cutoff_matrix(min_distance, ["Fe", "B"])
+    distances = random_structure.periodic_distances(positions, positions, box_size, pairwise=True)
+    np.fill_diagonal(distances, np.inf)
+    assert np.all(distances >= cutoffs[atom_types][:, atom_types])
+    
+    print("检查点续算测试通过!")
+
+def test_extend_structure(tmp_path):
+    """测试读取数据文件并在已有结构中加入新原子和新元素"""
+    positions, box_size, atom_types, element_types = random_structure.generate_random_structure(
+        num_atoms=300, density=0.1, min_distance=1.2, element_ratios={"Ti": 0.7, "Al": 0.3},
+        seed=3, progress=False, box_shape=[1.0, 1.0, 1.2, 0.2, 0.0, 0.1]
+    )
+    filename = str(tmp_path / "small.data")
+    random_structure.save_lammps_data(filename, positions, box_size, atom_types, element_types)
+    loaded = random_structure.load_lammps_data(filename)
+    assert np.allclose(loaded[0], positions, atol=1e-6) and np.allclose(loaded[1], box_size, atol=1e-6)
+    assert loaded[2] == atom_types and loaded[3] == element_types
+    
+    min_distance = {("Ti", "Ti"): 1.2, ("Ti", "Al"): 1.2, ("Al", "Al"): 1.2,
+                    ("B", "Ti"): 1.0, ("B", "Al"): 1.0, ("B", "B"): 1.0}
+    grown, grown_box, grown_types, grown_elements = random_structure.extend_structure(
+        filename, 600, min_distance=min_distance, element_ratios={"Ti": 0.5, "B": 0.5},
+        seed=4, batch_size=64, progress=False
+    )
+    assert len(grown) == 900 and np.array_equal(grown[:300], loaded[0])
+    assert grown_types[:300] == atom_types and grown_elements[:300] == element_types
+    assert grown_elements.count("B") == 300 and grown_elements.count("Ti") == atom_types.count(1) + 300
+    assert set(zip(grown_types, grown_elements)) == {(1, "Ti"), (2, "Al"), (3, "B")}
+    
+    grown_types = np.asarray(grown_types)
+    cutoffs = random_structure._cutoff_matrix(min_distance, ["Ti", "Al", "B"])
+    distances = random_structure.periodic_distances(grown, grown, grown_box, pairwise=True)
+    np.fill_diagonal(distances, np.inf)
+    assert np.all(distances >= cutoffs[grown_types][:, grown_types] - 1e-5)
+    
+    print("结构扩展测试通过!")
+
+def test_feasibility_and_adaptive_budget():
+    """测试按堆积分数预估可行性，以及接受率过低时提前结束或切换放置策略"""
+    to_density = lambda phi: phi / (np.pi / 6)
+    estimate = random_structure.estimate_feasibility(to_density(0.36))
+    assert abs(estimate.packing_fraction - 0.36) < 1e-12
+    assert estimate.feasible and estimate.recommended_strategy == "void"
+    estimate = random_structure.estimate_feasibility(to_density(0.45))
+    assert not estimate.feasible and estimate.recommended_strategy == "relax"
+    assert random_structure.estimate_feasibility(to_density(0.45), placement_strategy="relax").feasible
+    assert random_structure.estimate_feasibility(to_density(0.7), placement_strategy="relax").recommended_strategy is None
+    phi = random_structure.packing_fraction(0.1, {("Fe", "Fe"): 2.0, ("Fe", "B"): 1.5, ("B", "B"): 1.0},
+                                            {"Fe": 0.5, "B": 0.5})
+    assert abs(phi - 0.1 * np.pi / 6 * 4.5) < 1e-12
+    
+    # 超过饱和密度时立即失败，不再尝试
+    stats = random_structure.GenerationStats()
+    try:
+        random_structure.generate_random_structure(num_atoms=1000, density=to_density(0.45), seed=1,
+                                                   progress=False, stats=stats)
+        assert False, "应当抛出ValueError"
+    except ValueError as error:
+        assert "relax" in str(error)
+    assert stats.attempts == 0
+    
+    # 低于饱和密度但随机序列吸附会停滞：提前结束，或改用空隙跟踪方式完成
+    kwargs = dict(num_atoms=1500, density=to_density(0.37), min_distance=1.0, seed=2, batch_size=512, progress=False)
+    stats = random_structure.GenerationStats()
+    try:
+        random_structure.generate_random_structure(on_stall="raise", stats=stats, **kwargs)
+        assert False, "应当抛出RuntimeError"
+    except RuntimeError as error:
+        assert "void" in str(error)
+    assert stats.stalled_at is not None and stats.attempts < 1500 * 1000 // 2
+    
+    # 默认不切换；显式要求切换时发出警告
+    try:
+        random_structure.generate_random_structure(**kwargs)
+        assert False, "默认应当抛出RuntimeError"
+    except RuntimeError:
+        pass
+    stats = random_structure.GenerationStats()
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        positions, box_size, _, _ = random_structure.generate_random_structure(on_stall="switch", stats=stats,
+                                                                               **kwargs)
+    assert [warning.category for warning in caught] == [RuntimeWarning] and "void" in str(caught[0].message)
+    assert stats.switched_strategy == "void" and stats.placed_atoms == 1500
+    assert _min_periodic_distance(positions, box_size) >= 1.0
+    
+    # extend_structure同样默认不切换，on_stall传入放置设置
+    # 已有700个原子、盒子与上面相同，加入800个原子后达到同样的堆积分数
+    small = random_structure.generate_random_structure(**dict(kwargs, num_atoms=700,
+                                                              density=to_density(0.37) * 700 / 1500))
+    try:
+        random_structure.extend_structure(small, 800, seed=3, batch_size=512, progress=False)
+        assert False, "默认应当抛出RuntimeError"
+    except RuntimeError as error:
+        assert "void" in str(error)
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        grown = random_structure.extend_structure(small, 800, seed=3, batch_size=512, progress=False,
+                                                  on_stall="switch")
+    assert len(grown[0]) == 1500 and [warning.category for warning in caught] == [RuntimeWarning]
+    
+    print("可行性估计与自适应尝试预算测试通过!")
+
+def test_lammps_readers(tmp_path):
+    """测试数据文件和轨迹文件的读取：与写出的结构一致，轨迹可以按帧随机访问"""
+    rng = np.random.default_rng(4)
+    box_size = [12.0, 13.0, 14.0, 1.5, -2.0, 0.5]
+    positions = random_structure._cartesian(rng.random((500, 3)), box_size)
+    atom_types = rng.integers(1, 4, size=500).tolist()
+    # Bk和Cm质量相同，Xx不在ELEMENT_MASSES中，都需要从Masses的注释还原
+    names = {1: "Bk", 2: "Cm", 3: "Xx"}
+    element_types = [names[type_id] for type_id in atom_types]
+    for name in ("box.data", "box.data.gz"):
+        filename = str(tmp_path / name)
+        random_structure.save_lammps_data(filename, positions, box_size, atom_types, element_types)
+        loaded = random_structure.load_lammps_data(filename)
+        assert np.allclose(loaded[0], positions, atol=1e-6)
+        assert np.allclose(loaded[1], box_size) and loaded[2] == atom_types
+        assert loaded[3] == element_types
+
+    # LAMMPS write_data风格：盒子下界不为0、原子乱序、坐标之后有镜像标志、之后还有其他段落
+    order = rng.permutation(500)
+    lines = ["LAMMPS data file via write_data", "", "500 atoms", "2 atom types", "",
+             "-5.0 5.0 xlo xhi", "-5.0 5.0 ylo yhi", "-5.0 5.0 zlo zhi", "", "Masses", "",
+             "1 55.845 # Fe", "2 1.0 # Ar", "", "Atoms # charge", ""]
+    lines += [f"{i + 1} {atom_types[i] % 2 + 1} 0.5 {x - 5:.6f} {y - 5:.6f} {z - 5:.6f} 0 -1 0"
+              for i, (x, y, z) in zip(order, positions[order] % 10.0)]
+    lines += ["", "Velocities", "", "1 0.0 0.0 0.0"]
+    filename = tmp_path / "write_data.data"
+    filename.write_text("\n".join(lines) + "\n")
+    loaded = random_structure.load_lammps_data(str(filename))
+    assert np.allclose(loaded[0], positions % 10.0, atol=1e-6)
+    assert loaded[1] == [10.0, 10.0, 10.0]
+    assert loaded[2] == [type_id % 2 + 1 for type_id in atom_types]
+    filename.write_text("\n".join(lines[:-200]) + "\n")
+    try:
+        random_structure.load_lammps_data(str(filename))
+        assert False, "原子行不完整时应当抛出ValueError"
+    except ValueError:
+        pass
+
+    # 全量轨迹和增量压缩轨迹，随机访问任意一帧
+    for name, incremental in (("traj.lammpstrj", False), ("traj.lammpstrj.gz", True)):
+        filename = str(tmp_path / name)
+        with random_structure.TrajectoryWriter(filename, stride=120, incremental=incremental) as writer:
+            for placed_atoms in range(1, 501):
+                writer.update(positions, atom_types, box_size, placed_atoms)
+        with random_structure.TrajectoryReader(filename) as reader:
+            assert len(reader) == 5
+            assert [frame.timestep for frame in reader] == [120, 240, 360, 480, 500]
+            frame = reader[-2]
+            first = 360 if incremental else 0
+            assert np.array_equal(frame.ids, np.arange(first + 1, 481))
+            assert np.array_equal(frame.atom_types, atom_types[first:480])
+            assert np.allclose(frame.positions, positions[first:480], atol=1e-6)
+            assert np.allclose(frame.box_size, box_size)
+    
+    # save_lammps_trajectory写出的正交盒子轨迹
+    filename = str(tmp_path / "single.lammpstrj")
+    for step in (1, 2, 3):
+        random_structure.save_lammps_trajectory(filename, positions, box_size[:3], atom_types, element_types,
+                                                step, 500)
+    with random_structure.TrajectoryReader(filename) as reader:
+        assert len(reader) == 3 and reader[1].box_size == box_size[:3]
+        assert np.allclose(reader[2].positions, positions[:3], atol=1e-6)
+    
+    print("数据与轨迹读取测试通过!")
+
+def test_insert_molecules(tmp_path):
+    """测试刚性分子插入：分子间最小距离、分子几何不变、分子编号，以及在已有结构中插入"""
+    min_distance = {("O", "O"): 2.5, ("O", "H"): 1.6, ("H", "H"): 1.5, ("C", "C"): 2.5, ("C", "O"): 2.2,
+                    ("C", "H"): 1.8, ("Fe", "Fe"): 2.0, ("Fe", "O"): 1.8, ("Fe", "H"): 1.5, ("Fe", "C"): 1.8}
+    old = random_structure.generate_random_structure(
+        num_atoms=50, density=0.005, min_distance=2.0, element_ratios={"Fe": 1.0},
+        seed=1, progress=False, box_shape=[1.0, 1.0, 1.0, 0.2, 0.0, 0.1]
+    )
+    positions, box_size, atom_types, element_types, molecule_ids = random_structure.insert_molecules(
+        {"H2O": 150, "CO2": 40}, structure=old, min_distance=min_distance, seed=2, progress=False
+    )
+    assert len(positions) == 50 + 150 * 3 + 40 * 3 and np.array_equal(positions[:50], old[0])
+    assert set(zip(atom_types, element_types)) == {(1, "Fe"), (2, "O"), (3, "H"), (4, "C")}
+    assert np.all(molecule_ids[:50] == 0) and np.array_equal(np.bincount(molecule_ids)[1:], [3] * 190)
+    
+    # 不同分子之间满足最小距离，分子内部的键长和键角与模板相同
+    cutoffs = random_structure._cutoff_matrix(min_distance, ["Fe", "O", "H", "C"])
+    types = np.asarray(atom_types)
+    distances = random_structure.periodic_distances(positions, positions, box_size, pairwise=True)
+    other = (molecule_ids[:, None] != molecule_ids[None, :]) | (molecule_ids[:, None] == 0)
+    np.fill_diagonal(other, False)
+    assert np.all(distances[other] >= cutoffs[types][:, types][other] - 1e-9)
+    for molecule_id in range(1, 191):
+        atoms = np.flatnonzero(molecule_ids == molecule_id)
+        name = "CO2" if element_types[atoms[0]] == "C" else "H2O"
+        template = random_structure.MOLECULES[name].coordinates
+        expected = np.linalg.norm(template[:, None] - template[None, :], axis=-1)
+        assert np.allclose(distances[np.ix_(atoms, atoms)], expected)
+    
+    filename = str(tmp_path / "molecules.data")
+    random_structure.save_lammps_data(filename, positions, box_size, atom_types, element_types,
+                                      atom_style="full", molecule_ids=molecule_ids)
+    
+    # 自定义模板；空间不够时报错
+    template = random_structure.molecule_template(("B", "B"), [[0.0, 0.0, 0.0], [1.7, 0.0, 0.0]])
+    try:
+        random_structure.insert_molecules({"B2": 100}, box_size=[5.0, 5.0, 5.0], min_distance=2.0,
+                                          templates={"B2": template}, max_attempts=1000, seed=3, progress=False)
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("空间不够时应报错")
+    
+    print("分子插入测试通过!")
+
+def test_background_writer(tmp_path):
+    """测试后台写入：结果与同步写入相同、队列满时阻塞（背压）、写入错误在调用线程中抛出"""
+    positions, box_size, atom_types, element_types = random_structure.generate_random_structure(
+        num_atoms=300, density=0.05, min_distance=1.0, element_ratios={"Fe": 0.5, "B": 0.5},
+        seed=5, progress=False
+    )
+    with random_structure.BackgroundWriter(queue_size=1) as writer:
+        for i in range(3):
+            writer.save_lammps_data(str(tmp_path / f"background_{i}.data"), positions, box_size,
+                                    atom_types, element_types, atom_style="charge")
+    random_structure.save_lammps_data(str(tmp_path / "sync.data"), positions, box_size, atom_types, element_types,
+                                      atom_style="charge")
+    assert writer.tasks_done == 3
+    for i in range(3):
+        assert (tmp_path / f"background_{i}.data").read_bytes() == (tmp_path / "sync.data").read_bytes()
+    
+    # 写入线程被第一个任务占住、队列中已有一个任务时，再提交会阻塞
+    gate = threading.Event()
+    writer = random_structure.BackgroundWriter(queue_size=1)
+    writer.submit(gate.wait)
+    writer.submit(lambda: None)
+    producer = threading.Thread(target=writer.submit, args=(lambda: None,))
+    producer.start()
+    producer.join(timeout=0.2)
+    assert producer.is_alive()
+    gate.set()
+    producer.join(timeout=5)
+    assert not producer.is_alive()
+    writer.close()
+    assert writer.tasks_done == 3
+    
+    # 写入出错后不再执行后续任务，错误在submit和close时抛出
+    written = []
+    writer = random_structure.BackgroundWriter()
+    writer.save_lammps_data(str(tmp_path / "missing" / "a.data"), positions, box_size, atom_types, element_types)
+    deadline = time.monotonic() + 5
+    while writer._error is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    for call in (lambda: writer.submit(written.append, 1), writer.close):
+        try:
+            call()
+        except OSError:
+            pass
+        else:
+            raise AssertionError("写入错误应在调用线程中抛出")
+    assert written == []
+    
+    # 后台写入的轨迹与同步写入相同
+    for background in (False, True):
+        writer = random_structure.TrajectoryWriter(str(tmp_path / f"traj_{background}.lammpstrj"), stride=40,
+                                                   background=background, queue_size=2)
+        random_structure.generate_random_structure(num_atoms=200, density=0.05, min_distance=1.0,
+                                                   generate_trajectory=writer, seed=3, progress=False)
+    assert (tmp_path / "traj_True.lammpstrj").read_bytes() == (tmp_path / "traj_False.lammpstrj").read_bytes()
+    
+    print("后台写入测试通过!")
+
+def test_ml_assisted_stays_on():
+    """测试批量放置中ML辅助一旦触发就一直只选择低密度网格"""
+    class RecordingGenerator:
+        """记录binomial调用（只有未触发ML辅助时才按70%/30%抽取网格）的随机数生成器"""
+        def __init__(self, seed):
+            self.rng = np.random.default_rng(seed)
+            self.binomial_calls = 0
+        def binomial(self, *args, **kwargs):
+            self.binomial_calls += 1
+            return self.rng.binomial(*args, **kwargs)
+        def __getattr__(self, name):
+            return getattr(self.rng, name)
+
+    # 前三批全部拒绝以触发ML辅助，之后正常接受
+    filter_candidates = random_structure._filter_candidates
+    calls = []
+    def rejecting_filter(*args):
+        calls.append(len(calls))
+        if len(calls) <= 3:
+            return np.zeros(0, dtype=np.int64)
+        return filter_candidates(*args)
+
+    positions = np.zeros((300, 3))
+    cell_list = random_structure.CellList(positions, [20.0, 20.0, 20.0], 1.0, track_density=True)
+    rng = RecordingGenerator(6)
+    stats = random_structure.GenerationStats()
+    stats.begin(300, "rsa")
+    random_structure._filter_candidates = rejecting_filter
+    try:
+        placed_atoms, _ = random_structure._place_batched(positions, cell_list, rng, 16,
+                                                          use_ml_assisted_placement=True, stats=stats)
+    finally:
+        random_structure._filter_candidates = filter_candidates
+    assert placed_atoms == 300 and len(calls) > 20
+    assert stats.ml_assisted_triggered and stats.ml_triggered_at[1] == 0
+    # 只有触发前的第一批按比例抽取
+    assert rng.binomial_calls == 1
+    
+    print("ML辅助触发测试通过!")
+
+def test_format_columns_rounding():
+    """测试按列格式化与 % 格式化逐位相同，包括舍入中点附近的值和恰好在中点上的值"""
+    rng = np.random.default_rng(9)
+    for k in (1, 3, 6, 8):
+        uniform = rng.uniform(-5000, 5000, 50000)
+        # 十进制中点 (m + 0.5) / 10^k 及其前后相邻的浮点数
+        midpoints = (rng.integers(-10**(k + 3), 10**(k + 3), 20000) + 0.5) / 10**k
+        values = np.concatenate([uniform, midpoints, np.nextafter(midpoints, np.inf),
+                                 np.nextafter(midpoints, -np.inf), [0.125, 2.5, 3.5, -0.375, 1e-9, 0.0]])
+        lines = random_structure._format_columns([values], [k]).decode().split("\n")[:-1]
+        expected = [f"%.{k}f" % value for value in values]
+        # 唯一的区别：舍入后为0的负数不写负号
+        expected = [text[1:] if text.startswith("-") and float(text) == 0 else text for text in expected]
+        assert lines == expected
+    
+    print("格式化舍入测试通过!")
+
 if __name__ == "__main__":
     test_generate_random_structure()
     test_calculate_periodic_distance()
     test_lammps_mass_consistency()
+    test_batched_generation()
+    test_cell_list_query()
+    test_density_buckets()
+    test_void_placement_near_jamming()
+    test_trajectory_writer(pathlib.Path(tempfile.mkdtemp()))
+    test_save_lammps_data_styles(pathlib.Path(tempfile.mkdtemp()))
+    test_periodic_distance_kernel()
+    test_pair_cutoffs_and_triclinic_box(pathlib.Path(tempfile.mkdtemp()))
+    test_relax_placement_beyond_rsa_limit()
+    test_generation_stats()
+    test_out_of_core_generation(pathlib.Path(tempfile.mkdtemp()))
+    test_checkpoint_and_resume(pathlib.Path(tempfile.mkdtemp()))
+    test_extend_structure(pathlib.Path(tempfile.mkdtemp()))
+    test_feasibility_and_adaptive_budget()
+    test_lammps_readers(pathlib.Path(tempfile.mkdtemp()))
+    test_insert_molecules(pathlib.Path(tempfile.mkdtemp()))
+    test_background_writer(pathlib.Path(tempfile.mkdtemp()))
+    test_ml_assisted_stays_on()
+    test_format_columns_rounding()
     print("所有测试通过！")
\ No newline at end of file
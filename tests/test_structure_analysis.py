@@ -0,0 +1,98 @@
+"""
+测试structure_analysis模块
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import structure_analysis
+import random_structure
+import numpy as np
+
+def _brute_force_pairs(positions, box_size, cutoff):
+    """用全部原子对的最小镜像距离得到邻居列表"""
+    distances = random_structure.periodic_distances(positions, positions, box_size, pairwise=True)
+    first, second = np.nonzero(np.triu(distances < cutoff, k=1))
+    return first, second, distances[first, second]
+
+def test_neighbor_list_matches_brute_force():
+    """测试分块邻居列表、最小距离和配位数与逐对计算一致（正交与三斜盒子，单线程与多线程）"""
+    rng = np.random.default_rng(3)
+    for box_size in ([10.0, 11.0, 12.0], [10.0, 11.0, 12.0, 2.0, -1.5, 1.0]):
+        fractional = rng.random((600, 3))
+        positions = random_structure._cartesian(fractional, box_size)
+        types = rng.integers(1, 3, size=600)
+        expected = _brute_force_pairs(positions, box_size, 2.5)
+        expected_order = np.lexsort(expected[:2][::-1])
+        for max_workers in (1, 4):
+            first, second, distances = structure_analysis.neighbor_list(
+                positions, box_size, 2.5, chunk_size=100, max_workers=max_workers)
+            order = np.lexsort((second, first))
+            assert np.array_equal(first[order], expected[0][expected_order])
+            assert np.array_equal(second[order], expected[1][expected_order])
+            assert np.allclose(distances[order], expected[2][expected_order])
+
+        minimum = structure_analysis.minimum_distances(positions, box_size, types, cutoff=2.5, chunk_size=100)
+        all_distances = random_structure.periodic_distances(positions, positions, box_size, pairwise=True)
+        np.fill_diagonal(all_distances, np.inf)
+        for a in (1, 2):
+            for b in (1, 2):
+                assert np.isclose(minimum[a, b], all_distances[np.ix_(types == a, types == b)].min())
+
+        counts = structure_analysis.coordination_numbers(positions, box_size, 2.5, types, chunk_size=100)
+        within = all_distances < 2.5
+        assert np.array_equal(counts[:, 1], within[:, types == 1].sum(axis=1))
+        assert np.array_equal(counts[:, 2], within[:, types == 2].sum(axis=1))
+        assert np.array_equal(structure_analysis.coordination_numbers(positions, box_size, 2.5),
+                              within.sum(axis=1))
+
+    # 默认块大小按候选原子对数的上限确定：密度和截断距离越大，块越小
+    chunk_atoms = structure_analysis._map_pair_chunks(positions, box_size, 2.5, lambda first, *_: len(first),
+                                                      max_workers=1, pair_budget=20000)
+    assert len(chunk_atoms) > 1 and sum(chunk_atoms) == len(expected[0])
+    dense = structure_analysis._map_pair_chunks(positions, box_size, 4.0, lambda first, *_: len(first),
+                                                max_workers=1, pair_budget=20000)
+    assert len(dense) > len(chunk_atoms)
+
+    try:
+        structure_analysis.neighbor_list(positions, [10.0, 10.0, 10.0], 6.0)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("截断距离超过盒子宽度的一半时应报错")
+
+    print("邻居列表测试通过!")
+
+def test_radial_distribution():
+    """测试理想气体的g(r)约为1，生成结构在最小距离以内g(r)为0，且总g(r)与部分g(r)满足加权关系"""
+    rng = np.random.default_rng(5)
+    box_size = [20.0, 20.0, 20.0]
+    ideal = structure_analysis.radial_distribution(rng.random((8000, 3)) * 20.0, box_size, 8.0, bins=16)
+    assert np.all(np.abs(ideal.g[4:] - 1.0) < 0.05)
+    assert not ideal.partial
+
+    positions, box_size, atom_types, element_types = random_structure.generate_random_structure(
+        num_atoms=3000, density=0.1, min_distance=1.2, element_ratios={"Fe": 0.7, "B": 0.3},
+        seed=7, progress=False)
+    result = structure_analysis.radial_distribution(positions, box_size, 4.0, bins=40,
+                                                    atom_types=atom_types, element_types=element_types,
+                                                    max_workers=4, chunk_size=500)
+    assert np.all(result.g[result.r < 1.2] == 0)
+    assert set(result.partial) == {("Fe", "Fe"), ("Fe", "B"), ("B", "B")}
+    fractions = {"Fe": atom_types.count(1) / 3000, "B": atom_types.count(2) / 3000}
+    weighted = sum(fractions[a] * fractions[b] * g * (1 if a == b else 2) for (a, b), g in result.partial.items())
+    assert np.allclose(weighted, result.g)
+
+    # 累积配位数与直接计数一致
+    counts = structure_analysis.coordination_numbers(positions, box_size, 4.0, atom_types)
+    types = np.asarray(atom_types)
+    assert np.isclose(result.coordination[("Fe", "B")][-1], counts[types == 1, 2].mean())
+    assert np.isclose(result.coordination[("B", "Fe")][-1], counts[types == 2, 1].mean())
+
+    print("径向分布函数测试通过!")
+
+if __name__ == "__main__":
+    test_neighbor_list_matches_brute_force()
+    test_radial_distribution()
+    print("所有测试通过！")
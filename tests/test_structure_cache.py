@@ -0,0 +1,103 @@
+"""
+测试structure_cache模块
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import structure_cache
+import random_structure
+import numpy as np
+import pathlib
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+GENERATION_KWARGS = dict(
+    num_atoms=300,
+    density=0.1,
+    min_distance=1.0,
+    element_ratios={"Fe": 0.8, "B": 0.2},
+    batch_size=64,
+    seed=11,
+    progress=False
+)
+
+def _cached_generate(cache_dir):
+    """工作进程中通过缓存生成同一个结构"""
+    cache = structure_cache.StructureCache(cache_dir)
+    positions, box_size, atom_types, element_types = cache.generate(**GENERATION_KWARGS)
+    return positions, cache.misses
+
+def test_cache_hit_and_key(tmp_path):
+    """测试缓存命中结果与直接生成相同，以及缓存键对参数的敏感性"""
+    cache = structure_cache.StructureCache(str(tmp_path))
+    expected = random_structure.generate_random_structure(**GENERATION_KWARGS)
+    first = cache.generate(**GENERATION_KWARGS)
+    second = cache.generate(**GENERATION_KWARGS)
+    assert (cache.misses, cache.hits) == (1, 1)
+    for result in (first, second):
+        assert np.array_equal(result[0], expected[0])
+        assert result[1:] == expected[1:]
+
+    key = structure_cache.StructureCache.key
+    assert key(**GENERATION_KWARGS) == key(**dict(GENERATION_KWARGS, progress=True))
+    assert key(**GENERATION_KWARGS) == key(**dict(GENERATION_KWARGS, on_stall="raise"))
+    assert key(**GENERATION_KWARGS) != key(**dict(GENERATION_KWARGS, seed=12))
+    assert key(**GENERATION_KWARGS) != key(**dict(GENERATION_KWARGS, element_ratios={"B": 0.2, "Fe": 0.8}))
+    assert key(min_distance={("Fe", "B"): 1.0, ("B", "B"): 1.2}, seed=1) == \
+        key(min_distance={("B", "B"): 1.2, ("B", "Fe"): 1.0}, seed=1)
+    # 实数参数的整数写法与浮点数写法等价，整数参数不受影响
+    assert key(**dict(GENERATION_KWARGS, min_distance=1, density=np.float32(0.5), element_ratios={"Fe": 4, "B": 1})) == \
+        key(**dict(GENERATION_KWARGS, min_distance=1.0, density=0.5, element_ratios={"Fe": 4.0, "B": 1.0}))
+    assert key(min_distance={("Fe", "B"): 1, ("B", "B"): 2}, seed=1) == \
+        key(min_distance={("Fe", "B"): 1.0, ("B", "B"): 2.0}, seed=1)
+    assert key(num_atoms=300, seed=1) != key(num_atoms=301, seed=1)
+
+    # 没有固定种子时不使用缓存
+    cache.generate(**dict(GENERATION_KWARGS, seed=None))
+    assert (cache.misses, cache.hits) == (1, 1)
+    assert len(list(tmp_path.glob("*.npz"))) == 1
+
+    # 损坏或截断的缓存文件按未命中处理
+    entry = pathlib.Path(cache.path(key(**GENERATION_KWARGS)))
+    entry.write_bytes(b"broken")
+    assert np.array_equal(cache.generate(**GENERATION_KWARGS)[0], expected[0])
+    assert cache.misses == 2
+    entry.write_bytes(entry.read_bytes()[:entry.stat().st_size // 2])
+    assert np.array_equal(cache.generate(**GENERATION_KWARGS)[0], expected[0])
+    assert cache.misses == 3
+
+    print("缓存命中测试通过!")
+
+def test_cache_lru_eviction_and_processes(tmp_path):
+    """测试按大小上限的LRU淘汰，以及多个进程同时请求同一个结构"""
+    cache = structure_cache.StructureCache(str(tmp_path / "lru"))
+    paths = []
+    for seed in range(3):
+        cache.generate(**dict(GENERATION_KWARGS, seed=seed))
+        paths.append(cache.path(cache.key(**dict(GENERATION_KWARGS, seed=seed))))
+        # 保证修改时间可区分
+        os.utime(paths[-1], (seed, seed))
+    entry_size = os.path.getsize(paths[0])
+
+    # 访问最早的结构后它变为最近使用，淘汰的是第二个
+    cache.generate(**dict(GENERATION_KWARGS, seed=0))
+    cache.max_bytes = int(2.5 * entry_size)
+    cache.evict()
+    assert [os.path.exists(path) for path in paths] == [True, False, True]
+    # 被淘汰的结构的锁文件一起删除
+    assert [os.path.exists(path[:-len(".npz")] + ".lock") for path in paths] == [True, False, True]
+
+    with ProcessPoolExecutor(max_workers=3) as executor:
+        results = list(executor.map(_cached_generate, [str(tmp_path / "shared")] * 3))
+    assert all(np.array_equal(positions, results[0][0]) for positions, _ in results)
+    # 文件锁保证只生成一次
+    assert sum(misses for _, misses in results) == 1
+
+    print("缓存淘汰测试通过!")
+
+if __name__ == "__main__":
+    test_cache_hit_and_key(pathlib.Path(tempfile.mkdtemp()))
+    test_cache_lru_eviction_and_processes(pathlib.Path(tempfile.mkdtemp()))
+    print("所有测试通过！")